@@ -38,8 +38,12 @@ def _app(config):
 
 
 @pytest.fixture(scope="function")
-def app():
-    config = dict(mongodb_uri=MONGODB_URI, mongodb_db=MONGODB_DB, debug=True)
+def config():
+    return dict(mongodb_uri=MONGODB_URI, mongodb_db=MONGODB_DB, debug=True)
+
+
+@pytest.fixture(scope="function")
+def app(config):
     return _app(config)
 
 
@@ -2,7 +2,10 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from .routers import graphql
+from .routers import pricelist_rates
 from .routers import status
+from .routers import transactions
+from .services import running_transaction as running_transaction_service
 from .services import storage as storage_service
 
 
@@ -11,7 +14,9 @@ def get_app(config: dict):
     setattr(app, 'config', config)
 
     app.include_router(graphql.router)
+    app.include_router(pricelist_rates.router)
     app.include_router(status.router)
+    app.include_router(transactions.router)
 
     app.add_middleware(
         CORSMiddleware,
@@ -22,5 +27,7 @@ def get_app(config: dict):
     )
 
     app = storage_service.setup(app, config)
+    if config.get("running_transactions_collection"):
+        app = running_transaction_service.setup(app)
 
     return app
@@ -8,16 +8,22 @@ from .account import (
     Account as AccountType,
     AccountTransaction,
     AccountFilter,
+    AccountPage,
     get_account,
     get_account_transaction,
     all_accounts,
     all_accounts_meta,
+    all_accounts_page,
     upsertAccount,
     deleteAccount,
     beginAccountTransaction,
+    authorizeAccountTransaction,
     endAccountTransaction,
     commitAccountTransaction,
+    settleAccountTransaction,
     rollbackAccountTransaction,
+    commitAccountTransactions,
+    rollbackAccountTransactions,
     incrementAccountBalance,
     setAccountBalance,
 )
@@ -25,9 +31,11 @@ from .account import (
 from .carrier import (
     Carrier as CarrierType,
     CarrierFilter,
+    CarrierPage,
     get_carrier,
     all_carriers,
     all_carriers_meta,
+    all_carriers_page,
     upsertCarrier,
     deleteCarrier,
 )
@@ -35,9 +43,11 @@ from .carrier import (
 from .customer import (
     Customer as CustomerType,
     CustomerFilter,
+    CustomerPage,
     get_customer,
     all_customers,
     all_customers_meta,
+    all_customers_page,
     upsertCustomer,
     deleteCustomer,
 )
@@ -45,9 +55,11 @@ from .customer import (
 from .seller import (
     Seller as SellerType,
     SellerFilter,
+    SellerPage,
     get_seller,
     all_sellers,
     all_sellers_meta,
+    all_sellers_page,
     upsertSeller,
     deleteSeller,
 )
@@ -55,9 +67,11 @@ from .seller import (
 from .invoice import (
     Invoice as InvoiceType,
     InvoiceFilter,
+    InvoicePage,
     get_invoice,
     all_invoices,
     all_invoices_meta,
+    all_invoices_page,
     upsertInvoice,
     deleteInvoice,
 )
@@ -65,31 +79,42 @@ from .invoice import (
 from .pricelist import (
     Pricelist as PricelistType,
     PricelistFilter,
+    PricelistPage,
     get_pricelist,
     all_pricelists,
     all_pricelists_meta,
+    all_pricelists_page,
     upsertPricelist,
     deletePricelist,
+    activatePricelistVersion,
+    deletePricelistVersion,
 )
 
 from .pricelist_rate import (
     PricelistRate as PricelistRateType,
     PricelistRateFilter,
+    PricelistRatePage,
     get_pricelist_rate,
     all_pricelist_rates,
     all_pricelist_rates_meta,
+    all_pricelist_rates_page,
     upsertPricelistRate,
     deletePricelistRate,
+    DestinationRate,
     get_least_cost_routing,
+    get_rates_by_destinations,
 )
 
 from .transaction import (
     Transaction as TransactionType,
     TransactionFilter,
+    TransactionPage,
     get_transaction,
     all_transactions,
     all_transactions_meta,
+    all_transactions_page,
     upsertTransaction,
+    upsertTransactions,
     deleteTransaction,
 )
 
@@ -111,6 +136,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=CarrierFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_carriers_meta = graphene.Field(
         lambda: ListMetadata,
@@ -121,6 +148,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=CarrierFilter(),
     )
+    all_carriers_page = graphene.Field(
+        lambda: CarrierPage,
+        name="allCarriersPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=CarrierFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_carrier(
         self,
@@ -138,6 +177,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: CarrierFilter = None,
     ):
         return all_carriers(
@@ -146,6 +187,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -167,6 +210,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_carriers_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: CarrierFilter = None,
+    ):
+        return all_carriers_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # customers
     customer = graphene.Field(
         lambda: CustomerType,
@@ -183,6 +250,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=CustomerFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_customers_meta = graphene.Field(
         lambda: ListMetadata,
@@ -193,6 +262,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=CustomerFilter(),
     )
+    all_customers_page = graphene.Field(
+        lambda: CustomerPage,
+        name="allCustomersPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=CustomerFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_customer(
         self,
@@ -210,6 +291,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: CustomerFilter = None,
     ):
         return all_customers(
@@ -218,6 +301,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -239,6 +324,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_customers_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: CustomerFilter = None,
+    ):
+        return all_customers_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # sellers
     seller = graphene.Field(
         lambda: SellerType,
@@ -255,6 +364,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=SellerFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_sellers_meta = graphene.Field(
         lambda: ListMetadata,
@@ -265,6 +376,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=SellerFilter(),
     )
+    all_sellers_page = graphene.Field(
+        lambda: SellerPage,
+        name="allSellersPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=SellerFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_seller(
         self,
@@ -282,6 +405,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: SellerFilter = None,
     ):
         return all_sellers(
@@ -290,6 +415,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -311,6 +438,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_sellers_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: SellerFilter = None,
+    ):
+        return all_sellers_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # invoices
     invoice = graphene.Field(
         lambda: InvoiceType,
@@ -327,6 +478,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=InvoiceFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_invoices_meta = graphene.Field(
         lambda: ListMetadata,
@@ -337,6 +490,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=InvoiceFilter(),
     )
+    all_invoices_page = graphene.Field(
+        lambda: InvoicePage,
+        name="allInvoicesPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=InvoiceFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_invoice(
         self,
@@ -354,6 +519,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: InvoiceFilter = None,
     ):
         return all_invoices(
@@ -362,6 +529,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -383,6 +552,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_invoices_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: InvoiceFilter = None,
+    ):
+        return all_invoices_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # pricelists
     pricelist = graphene.Field(
         lambda: PricelistType,
@@ -399,6 +592,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=PricelistFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_pricelists_meta = graphene.Field(
         lambda: ListMetadata,
@@ -409,6 +604,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=PricelistFilter(),
     )
+    all_pricelists_page = graphene.Field(
+        lambda: PricelistPage,
+        name="allPricelistsPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=PricelistFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_pricelist(
         self,
@@ -426,6 +633,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: PricelistFilter = None,
     ):
         return all_pricelists(
@@ -434,6 +643,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -455,6 +666,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_pricelists_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: PricelistFilter = None,
+    ):
+        return all_pricelists_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # pricelist_rates
     pricelist_rate = graphene.Field(
         lambda: PricelistRateType,
@@ -473,6 +708,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=PricelistRateFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_pricelist_rates_meta = graphene.Field(
         lambda: ListMetadata,
@@ -483,6 +720,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=PricelistRateFilter(),
     )
+    all_pricelist_rates_page = graphene.Field(
+        lambda: PricelistRatePage,
+        name="allPricelistRatesPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=PricelistRateFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_pricelist_rate(
         self,
@@ -509,6 +758,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: PricelistRateFilter = None,
     ):
         return all_pricelist_rates(
@@ -517,6 +768,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -538,6 +791,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_pricelist_rates_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: PricelistRateFilter = None,
+    ):
+        return all_pricelist_rates_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # accounts
     account = graphene.Field(
         lambda: AccountType,
@@ -561,6 +838,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=AccountFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_accounts_meta = graphene.Field(
         lambda: ListMetadata,
@@ -571,6 +850,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=AccountFilter(),
     )
+    all_accounts_page = graphene.Field(
+        lambda: AccountPage,
+        name="allAccountsPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=AccountFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_account(
         self,
@@ -593,6 +884,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: AccountFilter = None,
     ):
         return all_accounts(
@@ -601,6 +894,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -622,6 +917,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_accounts_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: AccountFilter = None,
+    ):
+        return all_accounts_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # transactions
     transaction = graphene.Field(
         lambda: TransactionType,
@@ -639,6 +958,8 @@ class Query(graphene.ObjectType):
         sortField=graphene.String(),
         sortOrder=graphene.String(),
         filter=TransactionFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
     )
     all_transactions_meta = graphene.Field(
         lambda: ListMetadata,
@@ -649,6 +970,18 @@ class Query(graphene.ObjectType):
         sortOrder=graphene.String(),
         filter=TransactionFilter(),
     )
+    all_transactions_page = graphene.Field(
+        lambda: TransactionPage,
+        name="allTransactionsPage",
+        page=graphene.Int(),
+        perPage=graphene.Int(),
+        sortField=graphene.String(),
+        sortOrder=graphene.String(),
+        filter=TransactionFilter(),
+        after=graphene.String(),
+        before=graphene.String(),
+        estimate=graphene.Boolean(),
+    )
 
     async def resolve_transaction(
         self,
@@ -673,6 +1006,8 @@ class Query(graphene.ObjectType):
         perPage: int = 25,
         sortField: str = "id",
         sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
         filter: TransactionFilter = None,
     ):
         return all_transactions(
@@ -681,6 +1016,8 @@ class Query(graphene.ObjectType):
             perPage=perPage,
             sortField=sortField,
             sortOrder=sortOrder,
+            after=after,
+            before=before,
             filter=filter.to_dict() if filter is not None else None,
         )
 
@@ -702,6 +1039,30 @@ class Query(graphene.ObjectType):
             filter=filter.to_dict() if filter is not None else None,
         )
 
+    async def resolve_all_transactions_page(
+        self,
+        info,
+        page: int = 0,
+        perPage: int = 25,
+        sortField: str = "id",
+        sortOrder: str = "asc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        estimate: bool = False,
+        filter: TransactionFilter = None,
+    ):
+        return all_transactions_page(
+            info,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+            estimate=estimate,
+            filter=filter.to_dict() if filter is not None else None,
+        )
+
     # additional API query end-points
     least_cost_routing = graphene.List(
         CarrierType,
@@ -728,6 +1089,31 @@ class Query(graphene.ObjectType):
             destination=destination,
         )
 
+    rate_destinations = graphene.List(
+        DestinationRate,
+        name="rateDestinations",
+        tenant=graphene.ID(default_value='default'),
+        pricelist_tags=graphene.List(graphene.String),
+        carrier_tags=graphene.List(graphene.String),
+        destinations=graphene.List(graphene.String, required=True),
+    )
+
+    async def resolve_rate_destinations(
+        self,
+        info,
+        tenant=None,
+        pricelist_tags=None,
+        carrier_tags=None,
+        destinations=None,
+    ):
+        return await get_rates_by_destinations(
+            info,
+            tenant=tenant,
+            pricelist_tags=pricelist_tags,
+            carrier_tags=carrier_tags,
+            destinations=destinations,
+        )
+
 
 class Mutations(graphene.ObjectType):
     # carriers
@@ -759,6 +1145,12 @@ class Mutations(graphene.ObjectType):
     update_pricelist = upsertPricelist.Field(name="updatePricelist")
     upsert_pricelist = upsertPricelist.Field(name="upsertPricelist")
     delete_pricelist = deletePricelist.Field(name="deletePricelist")
+    activate_pricelist_version = activatePricelistVersion.Field(
+        name="activatePricelistVersion"
+    )
+    delete_pricelist_version = deletePricelistVersion.Field(
+        name="deletePricelistVersion"
+    )
 
     # pricelist_rats
     create_pricelist_rate = upsertPricelistRate.Field(name="createPricelistRate")
@@ -774,13 +1166,25 @@ class Mutations(graphene.ObjectType):
     begin_account_transaction = beginAccountTransaction.Field(
         name="beginAccountTransaction"
     )
+    authorize_account_transaction = authorizeAccountTransaction.Field(
+        name="authorizeAccountTransaction"
+    )
     end_account_transaction = endAccountTransaction.Field(name="endAccountTransaction")
     commit_account_transaction = commitAccountTransaction.Field(
         name="commitAccountTransaction"
     )
+    settle_account_transaction = settleAccountTransaction.Field(
+        name="settleAccountTransaction"
+    )
     rollback_account_transaction = rollbackAccountTransaction.Field(
         name="rollbackAccountTransaction"
     )
+    commit_account_transactions = commitAccountTransactions.Field(
+        name="commitAccountTransactions"
+    )
+    rollback_account_transactions = rollbackAccountTransactions.Field(
+        name="rollbackAccountTransactions"
+    )
     increment_account_balance = incrementAccountBalance.Field(
         name="incrementAccountBalance"
     )
@@ -790,6 +1194,7 @@ class Mutations(graphene.ObjectType):
     create_transaction = upsertTransaction.Field(name="createTransaction")
     update_transaction = upsertTransaction.Field(name="updateTransaction")
     upsert_transaction = upsertTransaction.Field(name="upsertTransaction")
+    upsert_transactions = upsertTransactions.Field(name="upsertTransactions")
     delete_transaction = deleteTransaction.Field(name="deleteTransaction")
 
 
@@ -11,7 +11,10 @@ from .pricelist_rate import (
     get_pricelist_rate_by_destination,
     get_least_cost_routing,
 )
+from .projection import get_projection
 from ..services import account as account_service
+from ..services import billing as billing_service
+from ..services import loader as loader_service
 from ..services import storage as storage_service
 from .types import BigInt
 
@@ -67,6 +70,16 @@ class AccountTransaction(graphene.ObjectType):
     timestamp_end = graphene.DateTime()
 
 
+class TransactionRejectionReason(graphene.Enum):
+    ACCOUNT_INACTIVE = account_service.REASON_ACCOUNT_INACTIVE
+    INSUFFICIENT_BALANCE = account_service.REASON_INSUFFICIENT_BALANCE
+    MAX_CONCURRENT_TRANSACTIONS = account_service.REASON_MAX_CONCURRENT_TRANSACTIONS
+    MAX_INBOUND_TRANSACTIONS = account_service.REASON_MAX_INBOUND_TRANSACTIONS
+    MAX_OUTBOUND_TRANSACTIONS = account_service.REASON_MAX_OUTBOUND_TRANSACTIONS
+    CONFLICT = account_service.REASON_CONFLICT
+    DESTINATION_NOT_RATED = account_service.REASON_DESTINATION_NOT_RATED
+
+
 class InputAccountPricelistRate(graphene.InputObjectType):
     pricelist_tag = graphene.String(required=True)
     prefix = graphene.String(required=True)
@@ -95,6 +108,26 @@ class InputAccountTransaction(graphene.InputObjectType):
     timestamp_end = graphene.DateTime()
 
 
+class InputAccountTransactionCommit(graphene.InputObjectType):
+    account_tag = graphene.String(required=True)
+    transaction_tag = graphene.String(required=True)
+    fee = graphene.Int(required=True)
+
+
+class InputAccountTransactionRollback(graphene.InputObjectType):
+    account_tag = graphene.String(required=True)
+    transaction_tag = graphene.String(required=True)
+
+
+class AccountTransactionResult(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    account_tag = graphene.String()
+    transaction_tag = graphene.String()
+    ok = graphene.Boolean()
+
+
 class LinkedAccount(graphene.ObjectType):
     class Meta:
         default_resolver = dict_resolver
@@ -164,6 +197,27 @@ class Account(graphene.ObjectType):
     least_cost_routing = graphene.List(
         Carrier, destination=graphene.String(required=True)
     )
+    cursor = graphene.String()
+
+    async def resolve_customer_tag(self, info):
+        storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
+        customer = await account_service.get_customer(storage, self, loaders)
+        return customer["id"] if customer else None
+
+    async def resolve_customer(self, info):
+        storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
+        return await account_service.get_customer(storage, self, loaders)
+
+    async def resolve_linked_accounts(self, info):
+        storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
+        return await account_service.get_linked_accounts(storage, self, loaders)
+
+    async def resolve_running_transactions(self, info):
+        storage = storage_service.get(info.context["request"])
+        return await account_service.get_running_transactions(storage, self)
 
     async def resolve_destination_rate(self, info, destination=None):
         account = Account(**dict(self)) if not isinstance(self, Account) else self
@@ -187,6 +241,29 @@ class Account(graphene.ObjectType):
         )
 
 
+ACCOUNT_DEPENDENCIES = {
+    "customer_tag": ("tenant", "customer_tag"),
+    "customer": ("tenant", "customer_tag"),
+    "linked_accounts": ("tenant", "linked_accounts"),
+    "running_transactions": ("tenant", "account_tag", "running_transactions"),
+    "destination_rate": (
+        "tenant",
+        "pricelist_tags",
+        "carrier_tags",
+        "carrier_tags_override",
+    ),
+    "least_cost_routing": ("tenant", "carrier_tags", "carrier_tags_override"),
+}
+
+
+class AccountPage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(Account)
+    count = graphene.Int()
+
+
 class upsertAccount(graphene.Mutation):
     class Arguments:
         id = graphene.ID()
@@ -238,6 +315,7 @@ class upsertAccount(graphene.Mutation):
         if id is None and not (tenant is not None and account_tag is not None):
             raise ValueError("Provide either the id or tenant and account_tag!")
         storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
         return await account_service.upsert(
             storage,
             dict(
@@ -260,6 +338,7 @@ class upsertAccount(graphene.Mutation):
                 tags=tags,
                 linked_accounts=linked_accounts,
             ),
+            loaders=loaders,
         )
 
 
@@ -284,8 +363,9 @@ class deleteAccount(graphene.Mutation):
         if id is None and not (tenant is not None and account_tag is not None):
             raise ValueError("Provide either the id or tenant and account_tag!")
         storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
         return await account_service.delete(
-            storage, id=id, tenant=tenant, account_tag=account_tag
+            storage, id=id, tenant=tenant, account_tag=account_tag, loaders=loaders
         )
 
 
@@ -332,13 +412,22 @@ class beginAccountTransaction(graphene.Mutation):
         tenant = graphene.ID(default_value='default')
         account_tag = graphene.String()
         transaction = graphene.Argument(InputAccountTransaction)
+        min_balance = BigInt(default_value=account_service.PREPAID_MIN_BALANCE)
 
     ok = graphene.Boolean()
+    reason = graphene.Field(TransactionRejectionReason)
     transaction = graphene.Field(AccountTransaction)
 
-    async def mutate(self, info, tenant=None, account_tag=None, transaction=None):
+    async def mutate(
+        self,
+        info,
+        tenant=None,
+        account_tag=None,
+        transaction=None,
+        min_balance=account_service.PREPAID_MIN_BALANCE,
+    ):
         storage = storage_service.get(info.context["request"])
-        transaction = await account_service.begin_transaction(
+        transaction, reason = await account_service.begin_transaction(
             storage,
             tenant,
             account_tag,
@@ -355,13 +444,63 @@ class beginAccountTransaction(graphene.Mutation):
                 "tags": transaction.tags,
                 "timestamp_begin": transaction.timestamp_begin,
             },
+            min_balance=min_balance,
         )
         return beginAccountTransaction(
-            ok=bool(transaction) if transaction is not None else None,
+            ok=bool(transaction) if transaction is not None or reason else None,
+            reason=reason,
             transaction=transaction,
         )
 
 
+class authorizeAccountTransaction(graphene.Mutation):
+    class Arguments:
+        tenant = graphene.ID(default_value='default')
+        account_tag = graphene.String()
+        transaction = graphene.Argument(InputAccountTransaction)
+        min_balance = BigInt(default_value=account_service.PREPAID_MIN_BALANCE)
+
+    ok = graphene.Boolean()
+    reason = graphene.Field(TransactionRejectionReason)
+    account = graphene.Field(Account)
+    destination_rate = graphene.Field(PricelistRate)
+    least_cost_routing = graphene.List(Carrier)
+    transaction = graphene.Field(AccountTransaction)
+
+    async def mutate(
+        self,
+        info,
+        tenant=None,
+        account_tag=None,
+        transaction=None,
+        min_balance=account_service.PREPAID_MIN_BALANCE,
+    ):
+        storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
+        result = await account_service.authorize_transaction(
+            storage,
+            tenant,
+            account_tag,
+            {
+                "transaction_tag": transaction.transaction_tag,
+                "proxy_tag": transaction.proxy_tag,
+                "source": transaction.source,
+                "source_ip": transaction.source_ip,
+                "destination": transaction.destination,
+                "carrier_ip": transaction.carrier_ip,
+                "inbound": transaction.inbound,
+                "primary": transaction.primary,
+                "tags": transaction.tags,
+                "timestamp_begin": transaction.timestamp_begin,
+            },
+            min_balance=min_balance,
+            loaders=loaders,
+        )
+        if result is None:
+            return authorizeAccountTransaction(ok=None)
+        return authorizeAccountTransaction(**result)
+
+
 class endAccountTransaction(graphene.Mutation):
     class Arguments:
         tenant = graphene.ID(default_value='default')
@@ -409,6 +548,38 @@ class commitAccountTransaction(graphene.Mutation):
         return commitAccountTransaction(ok=ok)
 
 
+class settleAccountTransaction(graphene.Mutation):
+    class Arguments:
+        tenant = graphene.ID(default_value='default')
+        account_tag = graphene.String()
+        transaction_tag = graphene.String()
+        timestamp_end = graphene.DateTime()
+        duration = graphene.Int()
+
+    ok = graphene.Boolean()
+    duration = graphene.Int()
+    fee = graphene.Int()
+
+    async def mutate(
+        self,
+        info,
+        tenant=None,
+        account_tag=None,
+        transaction_tag=None,
+        timestamp_end=None,
+        duration=None,
+    ):
+        storage = storage_service.get(info.context["request"])
+        transaction = await billing_service.settle_transaction(
+            storage, tenant, account_tag, transaction_tag, timestamp_end, duration
+        )
+        if transaction is None:
+            return settleAccountTransaction(ok=False)
+        return settleAccountTransaction(
+            ok=True, duration=transaction["duration"], fee=transaction["fee"]
+        )
+
+
 class rollbackAccountTransaction(graphene.Mutation):
     class Arguments:
         tenant = graphene.ID(default_value='default')
@@ -425,6 +596,69 @@ class rollbackAccountTransaction(graphene.Mutation):
         return commitAccountTransaction(ok=ok)
 
 
+class commitAccountTransactions(graphene.Mutation):
+    class Arguments:
+        tenant = graphene.ID(default_value='default')
+        transactions = graphene.List(InputAccountTransactionCommit, required=True)
+
+    results = graphene.List(AccountTransactionResult)
+
+    async def mutate(self, info, tenant=None, transactions=None):
+        storage = storage_service.get(info.context["request"])
+        transactions = [
+            {
+                "account_tag": transaction.account_tag,
+                "transaction_tag": transaction.transaction_tag,
+                "fee": transaction.fee,
+            }
+            for transaction in transactions
+        ]
+        results = await account_service.commit_transactions(
+            storage, tenant, transactions
+        )
+        return commitAccountTransactions(
+            results=[
+                dict(
+                    account_tag=transaction["account_tag"],
+                    transaction_tag=transaction["transaction_tag"],
+                    ok=ok,
+                )
+                for transaction, ok in zip(transactions, results)
+            ]
+        )
+
+
+class rollbackAccountTransactions(graphene.Mutation):
+    class Arguments:
+        tenant = graphene.ID(default_value='default')
+        transactions = graphene.List(InputAccountTransactionRollback, required=True)
+
+    results = graphene.List(AccountTransactionResult)
+
+    async def mutate(self, info, tenant=None, transactions=None):
+        storage = storage_service.get(info.context["request"])
+        transactions = [
+            {
+                "account_tag": transaction.account_tag,
+                "transaction_tag": transaction.transaction_tag,
+            }
+            for transaction in transactions
+        ]
+        results = await account_service.rollback_transactions(
+            storage, tenant, transactions
+        )
+        return rollbackAccountTransactions(
+            results=[
+                dict(
+                    account_tag=transaction["account_tag"],
+                    transaction_tag=transaction["transaction_tag"],
+                    ok=ok,
+                )
+                for transaction, ok in zip(transactions, results)
+            ]
+        )
+
+
 async def get_account(
     info,
     id: Optional[str] = None,
@@ -435,7 +669,11 @@ async def get_account(
         raise ValueError("Provide either the id or tenant and account_tag!")
     storage = storage_service.get(info.context["request"])
     account = await account_service.get(
-        storage, id=id, tenant=tenant, account_tag=account_tag
+        storage,
+        id=id,
+        tenant=tenant,
+        account_tag=account_tag,
+        projection=get_projection(info, ACCOUNT_DEPENDENCIES),
     )
     return account
 
@@ -447,6 +685,8 @@ async def all_accounts(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ):
     storage = storage_service.get(info.context["request"])
     return await account_service.get_all(
@@ -456,6 +696,9 @@ async def all_accounts(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        projection=get_projection(info, ACCOUNT_DEPENDENCIES),
     )
 
 
@@ -486,3 +729,29 @@ async def get_account_transaction(
     return await account_service.get_transaction(
         storage, tenant, account_tag, transaction_tag
     )
+
+
+async def all_accounts_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    return await account_service.get_all_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        projection=get_projection(info, ACCOUNT_DEPENDENCIES, path=("rows",)),
+    )
@@ -4,6 +4,7 @@ import graphene  # type: ignore
 
 from graphene.types.resolver import dict_resolver  # type: ignore
 
+from .projection import get_projection
 from ..services import carrier as carrier_service
 from ..services import storage as storage_service
 
@@ -41,6 +42,15 @@ class Carrier(graphene.ObjectType):
     port = graphene.Int()
     protocol = CarrierProtocol()
     active = graphene.Boolean(default_value=True)
+    cursor = graphene.String()
+
+
+class CarrierPage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(Carrier)
+    count = graphene.Int()
 
 
 class upsertCarrier(graphene.Mutation):
@@ -119,7 +129,11 @@ async def get_carrier(
         raise ValueError("Provide either the id or tenant and carrier_tag!")
     storage = storage_service.get(info.context["request"])
     return await carrier_service.get(
-        storage, id=id, tenant=tenant, carrier_tag=carrier_tag
+        storage,
+        id=id,
+        tenant=tenant,
+        carrier_tag=carrier_tag,
+        projection=get_projection(info),
     )
 
 
@@ -130,6 +144,8 @@ async def all_carriers(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     storage = storage_service.get(info.context["request"])
     return await carrier_service.get_all(
@@ -139,6 +155,9 @@ async def all_carriers(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        projection=get_projection(info),
     )
 
 
@@ -160,3 +179,29 @@ async def all_carriers_meta(
         filter=filter,
     )
     return {"count": meta["count"]}
+
+
+async def all_carriers_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    return await carrier_service.get_all_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        projection=get_projection(info, path=("rows",)),
+    )
@@ -4,6 +4,7 @@ import graphene  # type: ignore
 
 from graphene.types.resolver import dict_resolver  # type: ignore
 
+from .projection import get_projection
 from ..services import customer as customer_service
 from ..services import storage as storage_service
 
@@ -51,6 +52,15 @@ class Customer(graphene.ObjectType):
     province = graphene.String()
     country = graphene.String()
     active = graphene.Boolean()
+    cursor = graphene.String()
+
+
+class CustomerPage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(Customer)
+    count = graphene.Int()
 
 
 class upsertCustomer(graphene.Mutation):
@@ -156,7 +166,11 @@ async def get_customer(
         raise ValueError("Provide either the id or tenant and customer_tag!")
     storage = storage_service.get(info.context["request"])
     return await customer_service.get(
-        storage, id=id, tenant=tenant, customer_tag=customer_tag
+        storage,
+        id=id,
+        tenant=tenant,
+        customer_tag=customer_tag,
+        projection=get_projection(info),
     )
 
 
@@ -167,6 +181,8 @@ async def all_customers(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     storage = storage_service.get(info.context["request"])
     return await customer_service.get_all(
@@ -176,6 +192,9 @@ async def all_customers(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        projection=get_projection(info),
     )
 
 
@@ -197,3 +216,29 @@ async def all_customers_meta(
         filter=filter,
     )
     return {"count": meta["count"]}
+
+
+async def all_customers_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    return await customer_service.get_all_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        projection=get_projection(info, path=("rows",)),
+    )
@@ -6,7 +6,9 @@ import graphene  # type: ignore
 from graphene.types.resolver import dict_resolver  # type: ignore
 
 from .customer import Customer
+from .projection import get_projection
 from ..services import invoice as invoice_service
+from ..services import loader as loader_service
 from ..services import storage as storage_service
 from .types import BigInt
 
@@ -56,6 +58,23 @@ class Invoice(graphene.ObjectType):
     net_total = BigInt()
     vat_rate = graphene.Int()
     total = BigInt()
+    cursor = graphene.String()
+
+    async def resolve_customer(self, info):
+        storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
+        return await invoice_service.get_customer(storage, self, loaders)
+
+
+INVOICE_DEPENDENCIES = {"customer": ("tenant", "customer_tag")}
+
+
+class InvoicePage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(Invoice)
+    count = graphene.Int()
 
 
 class InputInvoiceRow(graphene.InputObjectType):
@@ -99,6 +118,7 @@ class upsertInvoice(graphene.Mutation):
         if id is None and not (tenant is not None and invoice_number is not None):
             raise ValueError("Provide either the id or tenant and invoice_number!")
         storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
         return await invoice_service.upsert(
             storage,
             dict(
@@ -112,6 +132,7 @@ class upsertInvoice(graphene.Mutation):
                 vat_rate=vat_rate,
                 total=total,
             ),
+            loaders=loaders,
         )
 
 
@@ -133,8 +154,13 @@ class deleteInvoice(graphene.Mutation):
         if id is None and not (tenant is not None and invoice_number is not None):
             raise ValueError("Provide either the id or tenant and invoice_number!")
         storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
         return await invoice_service.delete(
-            storage, id=id, tenant=tenant, invoice_number=invoice_number
+            storage,
+            id=id,
+            tenant=tenant,
+            invoice_number=invoice_number,
+            loaders=loaders,
         )
 
 
@@ -148,7 +174,11 @@ async def get_invoice(
         raise ValueError("Provide either the id or tenant and invoice_number!")
     storage = storage_service.get(info.context["request"])
     return await invoice_service.get(
-        storage, id=id, tenant=tenant, invoice_number=invoice_number
+        storage,
+        id=id,
+        tenant=tenant,
+        invoice_number=invoice_number,
+        projection=get_projection(info, INVOICE_DEPENDENCIES),
     )
 
 
@@ -159,6 +189,8 @@ async def all_invoices(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     storage = storage_service.get(info.context["request"])
     return await invoice_service.get_all(
@@ -168,6 +200,9 @@ async def all_invoices(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        projection=get_projection(info, INVOICE_DEPENDENCIES),
     )
 
 
@@ -189,3 +224,29 @@ async def all_invoices_meta(
         filter=filter,
     )
     return {"count": meta["count"]}
+
+
+async def all_invoices_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    return await invoice_service.get_all_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        projection=get_projection(info, INVOICE_DEPENDENCIES, path=("rows",)),
+    )
@@ -4,6 +4,7 @@ import graphene  # type: ignore
 
 from graphene.types.resolver import dict_resolver  # type: ignore
 
+from .projection import get_projection
 from ..services import pricelist as pricelist_service
 from ..services import storage as storage_service
 
@@ -39,6 +40,16 @@ class Pricelist(graphene.ObjectType):
     pricelist_tag = graphene.String(required=True)
     name = graphene.String()
     currency = PricelistCurrency()
+    active_version = graphene.String()
+    cursor = graphene.String()
+
+
+class PricelistPage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(Pricelist)
+    count = graphene.Int()
 
 
 class upsertPricelist(graphene.Mutation):
@@ -101,6 +112,39 @@ class deletePricelist(graphene.Mutation):
         )
 
 
+class activatePricelistVersion(graphene.Mutation):
+    class Arguments:
+        tenant = graphene.ID(default_value='default')
+        pricelist_tag = graphene.String(required=True)
+        version = graphene.String(required=True)
+
+    Output = Pricelist
+
+    async def mutate(
+        self, info, tenant: str, pricelist_tag: str, version: str
+    ) -> Optional[dict]:
+        storage = storage_service.get(info.context["request"])
+        return await pricelist_service.activate_version(
+            storage, tenant, pricelist_tag, version
+        )
+
+
+class deletePricelistVersion(graphene.Mutation):
+    class Arguments:
+        tenant = graphene.ID(default_value='default')
+        pricelist_tag = graphene.String(required=True)
+        version = graphene.String(required=True)
+
+    count = graphene.Int()
+
+    async def mutate(self, info, tenant: str, pricelist_tag: str, version: str):
+        storage = storage_service.get(info.context["request"])
+        count = await pricelist_service.delete_versions(
+            storage, tenant, pricelist_tag, [version]
+        )
+        return deletePricelistVersion(count=count)
+
+
 async def get_pricelist(
     info,
     id: Optional[str] = None,
@@ -111,7 +155,11 @@ async def get_pricelist(
         raise ValueError("Provide either the id or tenant and pricelist_tag!")
     storage = storage_service.get(info.context["request"])
     return await pricelist_service.get(
-        storage, id=id, tenant=tenant, pricelist_tag=pricelist_tag
+        storage,
+        id=id,
+        tenant=tenant,
+        pricelist_tag=pricelist_tag,
+        projection=get_projection(info),
     )
 
 
@@ -122,6 +170,8 @@ async def all_pricelists(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     storage = storage_service.get(info.context["request"])
     return await pricelist_service.get_all(
@@ -131,6 +181,9 @@ async def all_pricelists(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        projection=get_projection(info),
     )
 
 
@@ -152,3 +205,29 @@ async def all_pricelists_meta(
         filter=filter,
     )
     return {"count": meta["count"]}
+
+
+async def all_pricelists_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    return await pricelist_service.get_all_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        projection=get_projection(info, path=("rows",)),
+    )
@@ -6,6 +6,7 @@ from typing import List, Optional
 from graphene.types.resolver import dict_resolver  # type: ignore
 
 from ..services import pricelist as pricelist_service
+from ..services import loader as loader_service
 from ..services import storage as storage_service
 
 
@@ -20,6 +21,7 @@ class PricelistRateFilter(graphene.InputObjectType):
     carrier_tag = graphene.String()
     prefix = graphene.String()
     active = graphene.Boolean()
+    version = graphene.String()
 
     def to_dict(self):
         return {
@@ -33,6 +35,7 @@ class PricelistRateFilter(graphene.InputObjectType):
             "carrier_tag": self.carrier_tag,
             "prefix": self.prefix,
             "active": self.active,
+            "version": self.version,
         }
 
 
@@ -55,6 +58,24 @@ class PricelistRate(graphene.ObjectType):
     rate_increment = graphene.Int()
     interval_start = graphene.Int()
     description = graphene.String()
+    version = graphene.String()
+    cursor = graphene.String()
+
+
+class PricelistRatePage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(PricelistRate)
+    count = graphene.Int()
+
+
+class DestinationRate(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    destination = graphene.String(required=True)
+    rate = graphene.Field(PricelistRate)
 
 
 class upsertPricelistRate(graphene.Mutation):
@@ -74,6 +95,7 @@ class upsertPricelistRate(graphene.Mutation):
         rate_increment = graphene.Int()
         interval_start = graphene.Int()
         description = graphene.String()
+        version = graphene.String()
 
     class Meta:
         default_resolver = dict_resolver
@@ -98,6 +120,7 @@ class upsertPricelistRate(graphene.Mutation):
         rate_increment: int = None,
         interval_start: int = None,
         description: Optional[str] = None,
+        version: Optional[str] = None,
     ):
         if id is None and not (
             (tenant is not None or pricelist_id is not None)
@@ -109,6 +132,7 @@ class upsertPricelistRate(graphene.Mutation):
                 "Provide either the id or tenant, pricelist_tag, carrier_tag and prefix!"
             )
         storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
         return await pricelist_service.upsert_rate(
             storage,
             dict(
@@ -127,7 +151,9 @@ class upsertPricelistRate(graphene.Mutation):
                 rate_increment=rate_increment,
                 interval_start=interval_start,
                 description=description,
+                version=version,
             ),
+            loaders=loaders,
         )
 
 
@@ -160,6 +186,7 @@ class deletePricelistRate(graphene.Mutation):
                 "Provide either the id or tenant, pricelist_tag, carrier_tag and prefix!"
             )
         storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
         return await pricelist_service.delete_rate(
             storage,
             id=id,
@@ -167,6 +194,7 @@ class deletePricelistRate(graphene.Mutation):
             pricelist_tag=pricelist_tag,
             carrier_tag=carrier_tag,
             prefix=prefix,
+            loaders=loaders,
         )
 
 
@@ -188,6 +216,7 @@ async def get_pricelist_rate(
             "Provide either the id or tenant, pricelist_tag, carrier_tag and prefix!"
         )
     storage = storage_service.get(info.context["request"])
+    loaders = loader_service.get(info.context["request"])
     return await pricelist_service.get_rate(
         storage,
         id=id,
@@ -195,6 +224,7 @@ async def get_pricelist_rate(
         pricelist_tag=pricelist_tag,
         carrier_tag=carrier_tag,
         prefix=prefix,
+        loaders=loaders,
     )
 
 
@@ -207,6 +237,7 @@ async def get_pricelist_rate_by_destination(
     destination: Optional[str] = None,
 ):
     storage = storage_service.get(info.context["request"])
+    loaders = loader_service.get(info.context["request"])
     return await pricelist_service.get_rate_by_destination(
         storage,
         tenant=tenant,
@@ -214,6 +245,26 @@ async def get_pricelist_rate_by_destination(
         carrier_tags=carrier_tags,
         carrier_tags_override=carrier_tags_override,
         destination=destination,
+        loaders=loaders,
+    )
+
+
+async def get_rates_by_destinations(
+    info,
+    tenant: Optional[str] = None,
+    pricelist_tags: List[str] = None,
+    carrier_tags: List[str] = None,
+    destinations: List[str] = None,
+):
+    storage = storage_service.get(info.context["request"])
+    loaders = loader_service.get(info.context["request"])
+    return await pricelist_service.get_rates_by_destinations(
+        storage,
+        tenant=tenant,
+        pricelist_tags=pricelist_tags,
+        carrier_tags=carrier_tags,
+        destinations=destinations,
+        loaders=loaders,
     )
 
 
@@ -225,12 +276,14 @@ async def get_least_cost_routing(
     destination: Optional[str] = None,
 ):
     storage = storage_service.get(info.context["request"])
+    loaders = loader_service.get(info.context["request"])
     return await pricelist_service.get_least_cost_routing(
         storage,
         tenant=tenant,
         carrier_tags=carrier_tags,
         carrier_tags_override=carrier_tags_override,
         destination=destination,
+        loaders=loaders,
     )
 
 
@@ -241,8 +294,11 @@ async def all_pricelist_rates(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ):
     storage = storage_service.get(info.context["request"])
+    loaders = loader_service.get(info.context["request"])
     return await pricelist_service.get_all_rates(
         storage,
         page=page,
@@ -250,6 +306,9 @@ async def all_pricelist_rates(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        loaders=loaders,
     )
 
 
@@ -271,3 +330,30 @@ async def all_pricelist_rates_meta(
         filter=filter,
     )
     return {"count": meta["count"]}
+
+
+async def all_pricelist_rates_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    loaders = loader_service.get(info.context["request"])
+    return await pricelist_service.get_all_rates_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        loaders=loaders,
+    )
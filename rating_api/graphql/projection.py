@@ -0,0 +1,59 @@
+from typing import Dict, Optional, Set, Tuple
+
+from graphql.language import ast  # type: ignore
+
+
+def get_selections(info, field_asts: list) -> Dict[str, list]:
+    """
+    Group the fields selected below field_asts by name, expanding fragment
+    spreads and inline fragments.
+    """
+    fields: Dict[str, list] = {}
+    selections = [
+        selection
+        for field_ast in field_asts
+        if field_ast.selection_set is not None
+        for selection in field_ast.selection_set.selections
+    ]
+    while selections:
+        selection = selections.pop()
+        if isinstance(selection, ast.Field):
+            fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment is not None:
+                selections.extend(fragment.selection_set.selections)
+        elif isinstance(selection, ast.InlineFragment):
+            selections.extend(selection.selection_set.selections)
+    return fields
+
+
+def get_selected_fields(info, path: Tuple[str, ...] = ()) -> Set[str]:
+    """
+    Return the names of the fields selected on the object returned by the
+    current resolver, or on the object nested at path below it.
+    """
+    field_asts = info.field_asts
+    for name in path:
+        field_asts = get_selections(info, field_asts).get(name, [])
+    return set(get_selections(info, field_asts).keys())
+
+
+def get_projection(
+    info,
+    dependencies: Optional[Dict[str, Tuple[str, ...]]] = None,
+    path: Tuple[str, ...] = (),
+) -> dict:
+    """
+    Return the MongoDB projection for the current selection set; dependencies
+    map the GraphQL fields to the document fields they are resolved from.
+    """
+    dependencies = dependencies or {}
+    projection = {"_id": 1}
+    for field in get_selected_fields(info, path):
+        # id and cursor are derived from _id and the sort key
+        if field in ("id", "cursor") or field.startswith("__"):
+            continue
+        for name in dependencies.get(field, (field,)):
+            projection[name] = 1
+    return projection
@@ -4,6 +4,7 @@ import graphene  # type: ignore
 
 from graphene.types.resolver import dict_resolver  # type: ignore
 
+from .projection import get_projection
 from ..services import seller as seller_service
 from ..services import storage as storage_service
 
@@ -44,6 +45,15 @@ class Seller(graphene.ObjectType):
     province = graphene.String()
     country = graphene.String()
     active = graphene.Boolean()
+    cursor = graphene.String()
+
+
+class SellerPage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(Seller)
+    count = graphene.Int()
 
 
 class upsertSeller(graphene.Mutation):
@@ -146,7 +156,11 @@ async def get_seller(
         raise ValueError("Provide either the id or tenant and seller_tag!")
     storage = storage_service.get(info.context["request"])
     return await seller_service.get(
-        storage, id=id, tenant=tenant, seller_tag=seller_tag
+        storage,
+        id=id,
+        tenant=tenant,
+        seller_tag=seller_tag,
+        projection=get_projection(info),
     )
 
 
@@ -157,6 +171,8 @@ async def all_sellers(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     storage = storage_service.get(info.context["request"])
     return await seller_service.get_all(
@@ -166,6 +182,9 @@ async def all_sellers(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        projection=get_projection(info),
     )
 
 
@@ -187,3 +206,29 @@ async def all_sellers_meta(
         filter=filter,
     )
     return {"count": meta["count"]}
+
+
+async def all_sellers_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    return await seller_service.get_all_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        projection=get_projection(info, path=("rows",)),
+    )
@@ -8,6 +8,8 @@ from graphene.types.resolver import dict_resolver  # type: ignore
 from .account import Account, InputAccountPricelistRate
 from .invoice import Invoice
 from .pricelist_rate import PricelistRate
+from .projection import get_projection
+from ..services import loader as loader_service
 from ..services import storage as storage_service
 from ..services import transaction as transaction_service
 
@@ -62,6 +64,31 @@ class Transaction(graphene.ObjectType):
     inbound = graphene.Boolean()
     duration = graphene.Int()
     fee = graphene.Int()
+    cursor = graphene.String()
+
+    async def resolve_account(self, info):
+        storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
+        return await transaction_service.get_account(storage, self, loaders)
+
+    async def resolve_invoice(self, info):
+        storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
+        return await transaction_service.get_invoice(storage, self, loaders)
+
+
+TRANSACTION_DEPENDENCIES = {
+    "account": ("tenant", "account_tag"),
+    "invoice": ("tenant", "invoice_number"),
+}
+
+
+class TransactionPage(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    rows = graphene.List(Transaction)
+    count = graphene.Int()
 
 
 class upsertTransaction(graphene.Mutation):
@@ -125,6 +152,7 @@ class upsertTransaction(graphene.Mutation):
                 "Provide either the id or tenant, transaction_tag and account_tag!"
             )
         storage = storage_service.get(info.context["request"])
+        loaders = loader_service.get(info.context["request"])
         return await transaction_service.upsert(
             storage,
             dict(
@@ -149,6 +177,63 @@ class upsertTransaction(graphene.Mutation):
                 duration=duration,
                 fee=fee,
             ),
+            loaders=loaders,
+        )
+
+
+class InputTransaction(graphene.InputObjectType):
+    id = graphene.ID()
+    tenant = graphene.ID(default_value='default')
+    transaction_tag = graphene.String()
+    account_tag = graphene.String()
+    invoice_number = graphene.String()
+    source = graphene.String()
+    source_ip = graphene.String()
+    destination = graphene.String()
+    carrier_ip = graphene.String()
+    tags = graphene.List(graphene.String)
+    authorized = graphene.Boolean()
+    unauthorized_reason = graphene.String()
+    destination_rate = graphene.Field(InputAccountPricelistRate)
+    timestamp_auth = graphene.DateTime()
+    timestamp_begin = graphene.DateTime()
+    timestamp_end = graphene.DateTime()
+    primary = graphene.Boolean()
+    inbound = graphene.Boolean()
+    duration = graphene.Int()
+    fee = graphene.Int()
+
+
+class TransactionResult(graphene.ObjectType):
+    class Meta:
+        default_resolver = dict_resolver
+
+    transaction_tag = graphene.String()
+    account_tag = graphene.String()
+    ok = graphene.Boolean()
+    error = graphene.String()
+
+
+class upsertTransactions(graphene.Mutation):
+    class Arguments:
+        transactions = graphene.List(InputTransaction, required=True)
+
+    results = graphene.List(TransactionResult)
+
+    async def mutate(self, info, transactions=None):
+        storage = storage_service.get(info.context["request"])
+        transactions = [dict(transaction) for transaction in transactions]
+        errors = await transaction_service.upsert_many(storage, transactions)
+        return upsertTransactions(
+            results=[
+                dict(
+                    transaction_tag=transaction.get("transaction_tag"),
+                    account_tag=transaction.get("account_tag"),
+                    ok=error is None,
+                    error=error,
+                )
+                for transaction, error in zip(transactions, errors)
+            ]
         )
 
 
@@ -210,6 +295,7 @@ async def get_transaction(
         tenant=tenant,
         transaction_tag=transaction_tag,
         account_tag=account_tag,
+        projection=get_projection(info, TRANSACTION_DEPENDENCIES),
     )
 
 
@@ -220,6 +306,8 @@ async def all_transactions(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ):
     storage = storage_service.get(info.context["request"])
     return await transaction_service.get_all(
@@ -229,6 +317,9 @@ async def all_transactions(
         sortField=sortField,
         sortOrder=sortOrder,
         filter=filter,
+        after=after,
+        before=before,
+        projection=get_projection(info, TRANSACTION_DEPENDENCIES),
     )
 
 
@@ -250,3 +341,29 @@ async def all_transactions_meta(
         filter=filter,
     )
     return {"count": meta["count"]}
+
+
+async def all_transactions_page(
+    info,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    storage = storage_service.get(info.context["request"])
+    return await transaction_service.get_all_page(
+        storage,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        filter=filter,
+        after=after,
+        before=before,
+        estimate=estimate,
+        projection=get_projection(info, TRANSACTION_DEPENDENCIES, path=("rows",)),
+    )
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import sys
+
+from typing import AsyncIterator, BinaryIO, Optional
+
+import click
+
+from .services import rate_import as rate_import_service
+from .services.storage import StorageService
+
+
+async def read_lines(f: BinaryIO) -> AsyncIterator[bytes]:
+    for line in f:
+        yield line
+
+
+async def import_rates(
+    f: BinaryIO, errors_file: Optional[BinaryIO], config: dict
+) -> dict:
+    storage = StorageService(
+        mongodb_uri=config["mongodb_uri"], mongodb_db=config["mongodb_db"]
+    )
+    await storage.connect()
+
+    def progress(count: int, errors: int):
+        click.echo("%d rates imported, %d errors" % (count, errors), err=True)
+
+    def error(line_error: dict):
+        errors_file.write(json.dumps(line_error).encode("utf-8") + b"\n")
+
+    try:
+        result = await rate_import_service.import_rates(
+            storage,
+            read_lines(f),
+            format=config["format"],
+            tenant=config["tenant"],
+            pricelist_tag=config["pricelist_tag"],
+            carrier_tag=config["carrier_tag"],
+            version=config["version"],
+            progress=progress,
+            error=error if errors_file is not None else None,
+        )
+    finally:
+        await storage.close()
+    return result
+
+
+@click.command()
+@click.argument("deck", type=click.File("rb"))
+@click.option(
+    "--mongodb-uri",
+    type=click.STRING,
+    default="mongodb://localhost:27017",
+    show_default=True,
+)
+@click.option(
+    "--mongodb-db", type=click.STRING, default="rating_api", show_default=True
+)
+@click.option(
+    "-f",
+    "--format",
+    type=click.Choice(rate_import_service.FORMATS),
+    default="csv",
+    show_default=True,
+)
+@click.option("-t", "--tenant", type=click.STRING, default="default", show_default=True)
+@click.option("--pricelist-tag", type=click.STRING)
+@click.option("--carrier-tag", type=click.STRING)
+@click.option("--version", type=click.STRING, help="Stage the rates in this version")
+@click.option(
+    "-e", "--errors-file", type=click.File("wb"), help="Write the rejected lines here"
+)
+def main(
+    deck: BinaryIO,
+    mongodb_uri: str = "mongodb://localhost:27017",
+    mongodb_db: str = "rating_api",
+    format: str = "csv",
+    tenant: str = "default",
+    pricelist_tag: Optional[str] = None,
+    carrier_tag: Optional[str] = None,
+    version: Optional[str] = None,
+    errors_file: Optional[BinaryIO] = None,
+    **kw,
+):
+    config = dict(
+        mongodb_uri=mongodb_uri,
+        mongodb_db=mongodb_db,
+        format=format,
+        tenant=tenant,
+        pricelist_tag=pricelist_tag,
+        carrier_tag=carrier_tag,
+        version=version,
+    )
+    result = asyncio.get_event_loop().run_until_complete(
+        import_rates(deck, errors_file, config)
+    )
+    click.echo(
+        "%d rates imported, %d errors" % (result["count"], result["error_count"])
+    )
+    if result["error_count"]:
+        sys.exit(1)
+
+
+def main_with_env():  # pragma: no cover
+    main(auto_envvar_prefix="RATING_API")
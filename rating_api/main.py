@@ -1,3 +1,5 @@
+from typing import Optional
+
 import click
 import uvicorn  # type: ignore
 
@@ -16,12 +18,34 @@ from .app import get_app
 @click.option(
     "--mongodb-db", type=click.STRING, default="rating_api", show_default=True
 )
+@click.option("--rate-index/--no-rate-index", default=False, show_default=True)
+@click.option(
+    "--running-transactions-collection/--no-running-transactions-collection",
+    default=False,
+    show_default=True,
+)
+@click.option("--write-buffer/--no-write-buffer", default=False, show_default=True)
+@click.option("--entity-cache/--no-entity-cache", default=False, show_default=True)
+@click.option("--rate-cache/--no-rate-cache", default=False, show_default=True)
+@click.option("--change-streams/--no-change-streams", default=False, show_default=True)
+@click.option(
+    "--rate-table",
+    default=None,
+    help="Directory of the compiled rate tables, shared by the workers",
+)
 @click.option("-d", "--debug/--no-debug", default=False)
 def main(
     host: str = "0.0.0.0",
     port: int = 8000,
     mongodb_uri: str = "mongodb://localhost:27017",
     mongodb_db: str = "rating_api",
+    rate_index: bool = False,
+    running_transactions_collection: bool = False,
+    write_buffer: bool = False,
+    entity_cache: bool = False,
+    rate_cache: bool = False,
+    change_streams: bool = False,
+    rate_table: Optional[str] = None,
     debug: bool = False,
     **kw,
 ):
@@ -30,6 +54,13 @@ def main(
         port=port,
         mongodb_uri=mongodb_uri,
         mongodb_db=mongodb_db,
+        rate_index=rate_index,
+        running_transactions_collection=running_transactions_collection,
+        write_buffer=write_buffer,
+        entity_cache=entity_cache,
+        rate_cache=rate_cache,
+        change_streams=change_streams,
+        rate_table=rate_table,
         debug=debug,
     )
     app = get_app(config)
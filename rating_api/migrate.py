@@ -0,0 +1,65 @@
+import asyncio
+
+from typing import Tuple
+
+import click
+
+from .services import search
+from .services.storage import StorageService
+
+
+async def backfill_search_keys(collections: Tuple[str, ...], config: dict) -> dict:
+    storage = StorageService(
+        mongodb_uri=config["mongodb_uri"], mongodb_db=config["mongodb_db"]
+    )
+    await storage.connect()
+    counts = {}
+    try:
+        for collection in collections:
+            counts[collection] = await search.backfill_search_keys(
+                storage.db[collection], search.SEARCH_FIELDS[collection]
+            )
+    finally:
+        await storage.close()
+    return counts
+
+
+@click.command()
+@click.option(
+    "--mongodb-uri",
+    type=click.STRING,
+    default="mongodb://localhost:27017",
+    show_default=True,
+)
+@click.option(
+    "--mongodb-db", type=click.STRING, default="rating_api", show_default=True
+)
+@click.option(
+    "-c",
+    "--collection",
+    "collections",
+    type=click.Choice(sorted(search.SEARCH_FIELDS)),
+    multiple=True,
+    help="Backfill only this collection, can be repeated",
+)
+def main(
+    mongodb_uri: str = "mongodb://localhost:27017",
+    mongodb_db: str = "rating_api",
+    collections: Tuple[str, ...] = (),
+    **kw,
+):
+    """
+    Set the search keys of the documents written before they were
+    maintained, which the searches would never match otherwise. It can run
+    while the API is serving, and again safely.
+    """
+    config = dict(mongodb_uri=mongodb_uri, mongodb_db=mongodb_db)
+    counts = asyncio.get_event_loop().run_until_complete(
+        backfill_search_keys(collections or tuple(search.SEARCH_FIELDS), config)
+    )
+    for collection, count in counts.items():
+        click.echo("%s: %d documents backfilled" % (collection, count))
+
+
+def main_with_env():  # pragma: no cover
+    main(auto_envvar_prefix="RATING_API")
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import aniso8601  # type: ignore
+import click
+
+from .services import rerating as rerating_service
+from .services.storage import StorageService
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return aniso8601.parse_datetime(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def get_report_path(directory: str, tenant: str) -> str:
+    return os.path.join(directory, "%s.ndjson" % quote(tenant, safe=""))
+
+
+async def rerate(tenant: str, config: dict) -> dict:
+    storage = StorageService(
+        mongodb_uri=config["mongodb_uri"], mongodb_db=config["mongodb_db"]
+    )
+    report_file = (
+        open(get_report_path(config["report_dir"], tenant), "w")
+        if config["report_dir"]
+        else None
+    )
+
+    def report(batch: list):
+        for change in batch:
+            report_file.write(json.dumps(dict(change, tenant=tenant), default=str))
+            report_file.write("\n")
+
+    def progress(summary: dict):
+        click.echo(
+            "%s: %d transactions re-rated, %d changed"
+            % (tenant, summary["count"], summary["changed"]),
+            err=True,
+        )
+
+    await storage.connect()
+    try:
+        summary = await rerating_service.rerate_transactions(
+            storage,
+            tenant,
+            timestamp_from=config["timestamp_from"],
+            timestamp_to=config["timestamp_to"],
+            dry_run=config["dry_run"],
+            report=report if report_file is not None else None,
+            progress=progress,
+        )
+    finally:
+        await storage.close()
+        if report_file is not None:
+            report_file.close()
+    return summary
+
+
+def rerate_tenant(tenant: str, config: dict) -> dict:
+    """
+    Re-rate a tenant with its own event loop, database connection and report
+    file, as the processes of the pool share none of them.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(rerate(tenant, config))
+    finally:
+        loop.close()
+
+
+@click.command()
+@click.option(
+    "--mongodb-uri",
+    type=click.STRING,
+    default="mongodb://localhost:27017",
+    show_default=True,
+)
+@click.option(
+    "--mongodb-db", type=click.STRING, default="rating_api", show_default=True
+)
+@click.option(
+    "-t",
+    "--tenant",
+    "tenants",
+    type=click.STRING,
+    multiple=True,
+    required=True,
+    help="Re-rate the transactions of this tenant, can be repeated",
+)
+@click.option("--from", "timestamp_from", type=click.STRING, help="ISO 8601, inclusive")
+@click.option("--to", "timestamp_to", type=click.STRING, help="ISO 8601, exclusive")
+@click.option("--dry-run/--no-dry-run", default=False, show_default=True)
+@click.option(
+    "-r",
+    "--report-dir",
+    type=click.Path(file_okay=False),
+    help="Write the changed transactions of each tenant into <tenant>.ndjson here",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.INT,
+    default=1,
+    show_default=True,
+    help="Re-rate this many tenants in parallel processes",
+)
+def main(
+    tenants: Tuple[str, ...] = (),
+    mongodb_uri: str = "mongodb://localhost:27017",
+    mongodb_db: str = "rating_api",
+    timestamp_from: Optional[str] = None,
+    timestamp_to: Optional[str] = None,
+    dry_run: bool = False,
+    report_dir: Optional[str] = None,
+    jobs: int = 1,
+    **kw,
+):
+    """
+    Re-rate the authorized transactions of the tenants with the current
+    rates of the current price lists of their accounts; the transactions
+    whose rate was not valid when they began are left as is. The balances
+    of the accounts are NOT adjusted, the fee delta of each tenant is
+    reported instead.
+    """
+    config = dict(
+        mongodb_uri=mongodb_uri,
+        mongodb_db=mongodb_db,
+        timestamp_from=parse_datetime(timestamp_from),
+        timestamp_to=parse_datetime(timestamp_to),
+        dry_run=dry_run,
+        report_dir=report_dir,
+    )
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    if jobs > 1 and len(tenants) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(
+                executor.map(rerate_tenant, tenants, [config] * len(tenants))
+            )
+    else:
+        results = [rerate_tenant(tenant, config) for tenant in tenants]
+    for tenant, summary in zip(tenants, results):
+        click.echo(
+            "%s: %d transactions, %d changed%s, %d unrated, fee delta %d"
+            % (
+                tenant,
+                summary["count"],
+                summary["changed"],
+                " (dry run)" if dry_run else "",
+                summary["unrated"],
+                summary["fee_delta"],
+            )
+        )
+
+
+def main_with_env():  # pragma: no cover
+    main(auto_envvar_prefix="RATING_API")
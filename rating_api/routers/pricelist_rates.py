@@ -0,0 +1,79 @@
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from ..services import rate_export as rate_export_service
+from ..services import rate_import as rate_import_service
+from ..services import storage as storage_service
+from .transactions import read_lines
+
+
+router = APIRouter()
+
+
+@router.post("/pricelist_rates/import")
+async def import_pricelist_rates(
+    request: Request,
+    format: str = Query("csv", regex="^(csv|ndjson)$"),
+    tenant: str = "default",
+    pricelist_tag: Optional[str] = None,
+    carrier_tag: Optional[str] = None,
+    version: Optional[str] = None,
+):
+    """
+    Upsert the rates of a deck streamed as CSV or newline-delimited JSON;
+    the price list and carrier apply to the rows which do not set them. A
+    version stages the deck until activatePricelistVersion switches to it.
+    """
+    storage = storage_service.get(request)
+    return await rate_import_service.import_rates(
+        storage,
+        read_lines(request),
+        format=format,
+        tenant=tenant,
+        pricelist_tag=pricelist_tag,
+        carrier_tag=carrier_tag,
+        version=version,
+    )
+
+
+@router.get("/pricelist_rates/export")
+async def export_pricelist_rates(
+    request: Request,
+    format: str = Query("csv", regex="^(csv|ndjson)$"),
+    tenant: str = "default",
+    pricelist_id: Optional[str] = None,
+    pricelist_tag: Optional[str] = None,
+    carrier_id: Optional[str] = None,
+    carrier_tag: Optional[str] = None,
+    prefix: Optional[str] = None,
+    active: Optional[bool] = None,
+    version: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """
+    Stream the rates matching the filter as CSV or newline-delimited JSON,
+    in the format accepted by the import; the rates of a price list are
+    the ones of its active version, unless a version is given.
+    """
+    storage = storage_service.get(request)
+    return StreamingResponse(
+        rate_export_service.export_rates(
+            storage,
+            format,
+            dict(
+                tenant=tenant,
+                pricelist_id=pricelist_id,
+                pricelist_tag=pricelist_tag,
+                carrier_id=carrier_id,
+                carrier_tag=carrier_tag,
+                prefix=prefix,
+                active=active,
+                version=version,
+                q=q,
+            ),
+        ),
+        media_type=rate_export_service.MEDIA_TYPES[format],
+    )
@@ -1,8 +1,11 @@
 from fastapi import APIRouter
 
-from starlette.responses import Response
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
 from starlette.status import HTTP_204_NO_CONTENT
 
+from ..services import storage as storage_service
+
 
 router = APIRouter()
 
@@ -10,3 +13,15 @@ router = APIRouter()
 @router.get("/status")
 async def status():
     return Response(status_code=HTTP_204_NO_CONTENT)
+
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    storage = storage_service.get(request)
+    lines = []
+    for cache in storage.caches:
+        for name, value in cache.stats().items():
+            lines.append(
+                'rating_api_cache_%s{cache="%s"} %s' % (name, cache.name, value)
+            )
+    return PlainTextResponse("\n".join(lines) + "\n")
@@ -0,0 +1,58 @@
+import json
+
+from typing import AsyncIterator, List, Optional
+
+import aniso8601  # type: ignore
+from fastapi import APIRouter
+from starlette.requests import Request
+
+from ..services import pipeline
+from ..services import storage as storage_service
+from ..services import transaction as transaction_service
+
+BATCH_SIZE = 1000
+
+DATETIME_FIELDS = ("timestamp_auth", "timestamp_begin", "timestamp_end")
+
+
+router = APIRouter()
+
+
+async def read_lines(request: Request) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    yield buffer
+
+
+def parse_transaction(line: bytes, tenant: str) -> dict:
+    transaction = json.loads(line)
+    if not isinstance(transaction, dict):
+        raise ValueError("Expected a JSON object!")
+    transaction.setdefault("tenant", tenant)
+    for field in DATETIME_FIELDS:
+        if isinstance(transaction.get(field), str):
+            transaction[field] = aniso8601.parse_datetime(transaction[field])
+    return transaction
+
+
+@router.post("/transactions/import")
+async def import_transactions(request: Request, tenant: str = "default"):
+    """
+    Upsert the transactions streamed as newline-delimited JSON, in batches
+    of BATCH_SIZE; each batch is written while the next one is parsed.
+    """
+    storage = storage_service.get(request)
+
+    async def write(transactions: List[dict]) -> List[Optional[str]]:
+        return await transaction_service.upsert_many(storage, transactions)
+
+    return await pipeline.import_records(
+        pipeline.number_lines(read_lines(request)),
+        lambda line: parse_transaction(line, tenant),
+        write,
+        BATCH_SIZE,
+    )
@@ -1,24 +1,56 @@
-import re
+import asyncio
 
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from uuid import uuid4
-from pymongo import ASCENDING, DESCENDING  # type: ignore
+from pymongo import UpdateOne  # type: ignore
 from pymongo.collection import ReturnDocument  # type: ignore
 
 from . import customer as customer_service
+from .loader import Loaders
+from . import pagination
+from . import pricelist as pricelist_service
+from . import running_transaction as running_transaction_service
+from . import search
 from .storage import StorageService
 
+SEARCH_FIELDS = search.SEARCH_FIELDS["accounts"]
 
-async def process(storage: StorageService, account: dict) -> dict:
+PREPAID_MIN_BALANCE = 1
+
+ADMISSION_ATTEMPTS = 3
+
+# the markers of the last finish_transactions calls kept on an account
+FINISHED_BATCHES = 16
+
+REASON_ACCOUNT_INACTIVE = "ACCOUNT_INACTIVE"
+REASON_INSUFFICIENT_BALANCE = "INSUFFICIENT_BALANCE"
+REASON_MAX_CONCURRENT_TRANSACTIONS = "MAX_CONCURRENT_TRANSACTIONS"
+REASON_MAX_INBOUND_TRANSACTIONS = "MAX_INBOUND_TRANSACTIONS"
+REASON_MAX_OUTBOUND_TRANSACTIONS = "MAX_OUTBOUND_TRANSACTIONS"
+REASON_CONFLICT = "CONFLICT"
+REASON_DESTINATION_NOT_RATED = "DESTINATION_NOT_RATED"
+
+
+async def get_customer(
+    storage: StorageService, account: dict, loaders: Optional[Loaders] = None
+) -> Optional[dict]:
+    if not account.get("customer_tag"):
+        return None
+    loaders = loaders or Loaders(storage)
+    result = await loaders.get("customers", "tenant", "customer_tag").load(
+        (account.get("tenant"), account.get("customer_tag"))
+    )
+    return customer_service.serialize(result) if result is not None else None
+
+
+async def process(
+    storage: StorageService, account: dict, loaders: Optional[Loaders] = None
+) -> dict:
     account = account.copy()
     #
     if account.get("customer_tag"):
-        customer = await customer_service.get(
-            storage,
-            tenant=account.get("tenant"),
-            customer_tag=account.get("customer_tag"),
-        )
+        customer = await get_customer(storage, account, loaders)
         if customer is None:
             raise ValueError(
                 "Customer with tag = %s not found in tenant %s!"
@@ -28,31 +60,53 @@ async def process(storage: StorageService, account: dict) -> dict:
     return account
 
 
-async def serialize(storage: StorageService, account: dict) -> dict:
-    account = await process(storage, account)
-    customer = (
-        await customer_service.get(
-            storage,
-            tenant=account.get("tenant"),
-            customer_tag=account.get("customer_tag"),
-        )
-        if account.get("customer_tag")
-        else None
+def serialize_linked_account(tenant: str, result: dict) -> dict:
+    return {
+        "tenant": tenant,
+        "account_tag": result.get("account_tag"),
+        "name": result.get("name"),
+        "type": result.get("type"),
+        "balance": result.get("balance"),
+        "notification_email": result.get("notification_email"),
+        "notification_mobile": result.get("notification_mobile"),
+        "active": bool(result.get("active"))
+        if result.get("active") is not None
+        else None,
+        "max_concurrent_transactions": result.get("max_concurrent_transactions"),
+        "max_inbound_transactions": result.get("max_inbound_transactions"),
+        "max_outbound_transactions": result.get("max_outbound_transactions"),
+        "running_transactions": result.get("running_transactions") or (),
+        "carrier_tags": result.get("carrier_tags"),
+        "carrier_tags_override": result.get("carrier_tags_override"),
+        "pricelist_tags": result.get("pricelist_tags"),
+        "tags": result.get("tags"),
+    }
+
+
+async def get_linked_accounts(
+    storage: StorageService, account: dict, loaders: Optional[Loaders] = None
+) -> List[dict]:
+    if not account.get("linked_accounts"):
+        return []
+    loaders = loaders or Loaders(storage)
+    results = await loaders.get("accounts", "tenant", "account_tag").load_many(
+        [(account["tenant"], account_tag) for account_tag in account["linked_accounts"]]
     )
-    if account.get('linked_accounts') is not None:
-        linked_accounts = await get_accounts(
-            storage, account["tenant"], account["linked_accounts"]
-        )
-    else:
-        linked_accounts = []
+    return [
+        serialize_linked_account(account["tenant"], result)
+        for result in results
+        if result is not None
+    ]
+
+
+def serialize(account: dict) -> dict:
     return {
         "id": account.get("_id"),
         "tenant": account.get("tenant"),
         "account_tag": account.get("account_tag"),
         "name": account.get("name"),
         "type": account.get("type"),
-        "customer_tag": customer["id"] if customer else None,
-        "customer": customer,
+        "customer_tag": account.get("customer_tag"),
         "balance": account.get("balance"),
         "notification_email": account.get("notification_email"),
         "notification_mobile": account.get("notification_mobile"),
@@ -67,7 +121,7 @@ async def serialize(storage: StorageService, account: dict) -> dict:
         "carrier_tags_override": account.get("carrier_tags_override"),
         "pricelist_tags": account.get("pricelist_tags"),
         "tags": account.get("tags"),
-        "linked_accounts": linked_accounts,
+        "linked_accounts": account.get("linked_accounts"),
     }
 
 
@@ -77,29 +131,22 @@ async def get(
     tenant: Optional[str] = None,
     account_tag: Optional[str] = None,
     role: str = "R",
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
         params = {"_id": id}
     else:
         params = {"tenant": tenant, "account_tag": account_tag}
-    account = await storage.db["accounts"].find_one(params)
-    return await serialize(storage, account) if account is not None else None
+    account = await storage.db["accounts"].find_one(params, projection)
+    return serialize(account) if account is not None else None
 
 
 async def get_query(storage: StorageService, filter: Optional[dict] = None) -> dict:
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {"tenant": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"account_tag": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"name": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     if filter.get("ids"):
@@ -113,26 +160,38 @@ async def get_query(storage: StorageService, filter: Optional[dict] = None) -> d
     if filter.get("active"):
         filters_and.append({"active": filter["active"]})
     if filter.get("with_running_transactions"):
-        filters_and.append(
-            {
-                "running_transactions": {
-                    "$elemMatch": {"in_progress": True, "inbound": False}
+        if storage.running_transactions_collection:
+            filters_and.append(
+                {running_transaction_service.OUTBOUND_COUNTER: {"$gt": 0}}
+            )
+        else:
+            filters_and.append(
+                {
+                    "running_transactions": {
+                        "$elemMatch": {"in_progress": True, "inbound": False}
+                    }
                 }
-            }
-        )
+            )
     if filter.get("with_long_running_transactions"):
-        filters_and.append(
-            {
-                "running_transactions": {
-                    "$elemMatch": {
-                        "in_progress": True,
-                        "timestamp_begin": {
-                            "$lte": datetime.utcnow() - timedelta(seconds=3600 * 3)
-                        },
+        timestamp_begin = datetime.utcnow() - timedelta(seconds=3600 * 3)
+        if storage.running_transactions_collection:
+            account_tags = (
+                await running_transaction_service.get_long_running_account_tags(
+                    storage, filter.get("tenant"), timestamp_begin
+                )
+            )
+            filters_and.append({"account_tag": {"$in": account_tags}})
+        else:
+            filters_and.append(
+                {
+                    "running_transactions": {
+                        "$elemMatch": {
+                            "in_progress": True,
+                            "timestamp_begin": {"$lte": timestamp_begin},
+                        }
                     }
                 }
-            }
-        )
+            )
     return {"$and": filters_and} if filters_and else {}
 
 
@@ -143,18 +202,62 @@ async def get_all(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     query = await get_query(storage, filter)
-    result = storage.db["accounts"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["accounts"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    accounts = [
-        await serialize(storage, account)
-        for account in await result.skip(page * perPage).limit(perPage).to_list(None)
+    return [
+        dict(serialize(account), cursor=pagination.encode_cursor(account, sortField))
+        for account in result
     ]
-    return accounts
+
+
+async def get_all_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    query = await get_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["accounts"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
+    )
+    return {
+        "rows": [
+            dict(
+                serialize(account), cursor=pagination.encode_cursor(account, sortField)
+            )
+            for account in result
+        ],
+        "count": count,
+    }
 
 
 async def get_all_meta(
@@ -170,50 +273,21 @@ async def get_all_meta(
     return {"count": result}
 
 
-async def get_accounts(
-    storage: StorageService, tenant: str, account_tags: list
-) -> List[dict]:
-    if not account_tags:
-        return []
-    results = (
-        await storage.db["accounts"]
-        .find({"tenant": tenant, "account_tag": {"$in": account_tags}})
-        .to_list(None)
-    )
-    return (
-        [
-            {
-                "tenant": tenant,
-                "account_tag": result.get("account_tag"),
-                "name": result.get("name"),
-                "type": result.get("type"),
-                "balance": result.get("balance"),
-                "notification_email": result.get("notification_email"),
-                "notification_mobile": result.get("notification_mobile"),
-                "active": bool(result.get("active"))
-                if result.get("active") is not None
-                else None,
-                "max_concurrent_transactions": result.get(
-                    "max_concurrent_transactions"
-                ),
-                "max_inbound_transactions": result.get("max_inbound_transactions"),
-                "max_outbound_transactions": result.get("max_outbound_transactions"),
-                "running_transactions": result.get("running_transactions") or (),
-                "carrier_tags": result.get("carrier_tags"),
-                "carrier_tags_override": result.get("carrier_tags_override"),
-                "pricelist_tags": result.get("pricelist_tags"),
-                "tags": result.get("tags"),
-            }
-            for result in results
-        ]
-        if results is not None
-        else []
-    )
+async def get_running_transactions(storage: StorageService, account: dict) -> list:
+    if storage.running_transactions_collection:
+        return await running_transaction_service.get_all(
+            storage, account.get("tenant"), account.get("account_tag")
+        )
+    return account.get("running_transactions") or []
 
 
 async def get_transaction(
     storage: StorageService, tenant: str, account_tag: str, transaction_tag: str
 ) -> Optional[dict]:
+    if storage.running_transactions_collection:
+        return await running_transaction_service.get(
+            storage, tenant, account_tag, transaction_tag
+        )
     result = await storage.db["accounts"].find_one(
         {
             "tenant": tenant,
@@ -222,30 +296,18 @@ async def get_transaction(
         },
         {"_id": 1, "running_transactions.$": 1},
     )
-    transaction = result.get("running_transactions")[0] if result is not None else None
     return (
-        {
-            "destination_rate": transaction.get("destination_rate"),
-            "transaction_tag": transaction.get("transaction_tag"),
-            "proxy_tag": transaction.get("proxy_tag"),
-            "source": transaction.get("source"),
-            "source_ip": transaction.get("source_ip"),
-            "destination": transaction.get("destination"),
-            "carrier_ip": transaction.get("carrier_ip"),
-            "tags": transaction.get("tags"),
-            "in_progress": transaction.get("in_progress"),
-            "inbound": transaction.get("inbound"),
-            "primary": transaction.get("primary"),
-            "timestamp_begin": transaction.get("timestamp_begin"),
-            "timestamp_end": transaction.get("timestamp_end"),
-        }
+        running_transaction_service.serialize(result["running_transactions"][0])
         if result is not None
         else None
     )
 
 
-async def upsert(storage: StorageService, account: dict) -> Optional[dict]:
-    account = await process(storage, account)
+async def upsert(
+    storage: StorageService, account: dict, loaders: Optional[Loaders] = None
+) -> Optional[dict]:
+    loaders = loaders or Loaders(storage)
+    account = await process(storage, account, loaders)
     result = await storage.db["accounts"].find_one_and_update(
         {"_id": account.get("id")}
         if account.get("id")
@@ -255,6 +317,7 @@ async def upsert(storage: StorageService, account: dict) -> Optional[dict]:
         },
         {
             "$setOnInsert": {"_id": account.get("id") or str(uuid4())},
+            "$currentDate": {"updated_at": True},
             "$set": storage.filter_dict(
                 {
                     "tenant": account.get("tenant"),
@@ -280,13 +343,20 @@ async def upsert(storage: StorageService, account: dict) -> Optional[dict]:
                     "pricelist_tags": account.get("pricelist_tags"),
                     "tags": account.get("tags"),
                     "linked_accounts": account.get("linked_accounts"),
+                    "search_keys": search.get_complete_search_keys(
+                        account, SEARCH_FIELDS
+                    ),
                 }
             ),
         },
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return await serialize(storage, result)
+    result = await search.update_search_keys(
+        storage.db["accounts"], result, SEARCH_FIELDS
+    )
+    loaders.clear("accounts")
+    return serialize(result)
 
 
 async def delete(
@@ -294,12 +364,24 @@ async def delete(
     id: Optional[str] = None,
     tenant: Optional[str] = None,
     account_tag: Optional[str] = None,
+    loaders: Optional[Loaders] = None,
 ) -> Optional[dict]:
     account = await get(
-        storage, id=id, tenant=tenant, account_tag=account_tag, role="W"
+        storage,
+        id=id,
+        tenant=tenant,
+        account_tag=account_tag,
+        role="W",
     )
     if account is not None:
         await storage.db["accounts"].delete_one({"_id": account["id"]})
+        await storage.record_delete("accounts", account["id"], account)
+        if storage.running_transactions_collection:
+            await storage.db["running_transactions"].delete_many(
+                {"tenant": account["tenant"], "account_tag": account["account_tag"]}
+            )
+        if loaders is not None:
+            loaders.clear("accounts")
     return account
 
 
@@ -330,45 +412,280 @@ async def increment_balance(
     )
 
 
-async def begin_transaction(
-    storage: StorageService, tenant: str, account_tag: str, transaction: dict
-) -> Optional[dict]:
-    result = await storage.db["accounts"].find_one_and_update(
-        {"tenant": tenant, "account_tag": account_tag},
-        {
-            "$addToSet": {
-                "running_transactions": {
-                    "proxy_tag": transaction.get("proxy_tag"),
-                    "destination_rate": transaction.get("destination_rate"),
-                    "transaction_tag": transaction.get("transaction_tag"),
-                    "source": transaction.get("source"),
-                    "source_ip": transaction.get("source_ip"),
-                    "destination": transaction.get("destination"),
-                    "carrier_ip": transaction.get("carrier_ip"),
-                    "tags": transaction.get("tags"),
-                    "in_progress": True,
-                    "inbound": bool(transaction.get("inbound")),
-                    "primary": bool(transaction.get("primary")),
-                    "timestamp_begin": transaction.get("timestamp_begin"),
-                    "timestamp_end": None,
-                }
+def get_in_progress_expr(
+    storage: StorageService, inbound: Optional[bool] = None
+) -> dict:
+    """
+    Return the aggregation expression counting the transactions in progress
+    on the account, either all of them or only the inbound or outbound ones.
+    """
+    if storage.running_transactions_collection:
+        counters = (
+            (
+                running_transaction_service.INBOUND_COUNTER,
+                running_transaction_service.OUTBOUND_COUNTER,
+            )
+            if inbound is None
+            else (running_transaction_service.get_counter({"inbound": inbound}),)
+        )
+        return {"$add": [{"$ifNull": ["$" + counter, 0]} for counter in counters]}
+    cond: dict = {"$eq": ["$$transaction.in_progress", True]}
+    if inbound is not None:
+        cond = {
+            "$and": [
+                cond,
+                {"$eq": [{"$ifNull": ["$$transaction.inbound", False]}, inbound]},
+            ]
+        }
+    return {
+        "$size": {
+            "$filter": {
+                "input": {"$ifNull": ["$running_transactions", []]},
+                "as": "transaction",
+                "cond": cond,
             }
-        },
-        return_document=ReturnDocument.AFTER,
-    )
-    result = (
-        tuple(
-            filter(
-                lambda x: x["transaction_tag"] == x["transaction_tag"],
-                result.get("running_transactions"),
+        }
+    }
+
+
+def count_in_progress(
+    storage: StorageService, account: dict, inbound: Optional[bool] = None
+) -> int:
+    if storage.running_transactions_collection:
+        if inbound is None:
+            return (account.get(running_transaction_service.INBOUND_COUNTER) or 0) + (
+                account.get(running_transaction_service.OUTBOUND_COUNTER) or 0
             )
+        counter = running_transaction_service.get_counter({"inbound": inbound})
+        return account.get(counter) or 0
+    return len(
+        [
+            transaction
+            for transaction in account.get("running_transactions") or []
+            if transaction.get("in_progress")
+            and (inbound is None or bool(transaction.get("inbound")) == inbound)
+        ]
+    )
+
+
+def get_limits(transaction: dict) -> tuple:
+    if transaction.get("inbound"):
+        limit = ("max_inbound_transactions", True, REASON_MAX_INBOUND_TRANSACTIONS)
+    else:
+        limit = ("max_outbound_transactions", False, REASON_MAX_OUTBOUND_TRANSACTIONS)
+    return (
+        ("max_concurrent_transactions", None, REASON_MAX_CONCURRENT_TRANSACTIONS),
+        limit,
+    )
+
+
+def get_admission_query(
+    storage: StorageService, transaction: dict, min_balance: int
+) -> dict:
+    filters_and = [
+        {"active": {"$ne": False}},
+        {
+            "$or": [
+                {"type": {"$ne": "PREPAID"}},
+                {"$expr": {"$gte": [{"$ifNull": ["$balance", 0]}, min_balance]}},
+            ]
+        },
+    ]
+    for field, inbound, _ in get_limits(transaction):
+        filters_and.append(
+            {
+                "$or": [
+                    {field: None},
+                    {
+                        "$expr": {
+                            "$lt": [get_in_progress_expr(storage, inbound), "$" + field]
+                        }
+                    },
+                ]
+            }
         )
-        if result
-        else None
+    return {"$and": filters_and}
+
+
+def get_rejection_reason(
+    storage: StorageService, account: dict, transaction: dict, min_balance: int
+) -> Optional[str]:
+    if account.get("active") is False:
+        return REASON_ACCOUNT_INACTIVE
+    if account.get("type") == "PREPAID" and (account.get("balance") or 0) < min_balance:
+        return REASON_INSUFFICIENT_BALANCE
+    for field, inbound, reason in get_limits(transaction):
+        if account.get(field) is not None and count_in_progress(
+            storage, account, inbound
+        ) >= account.get(field):
+            return reason
+    return None
+
+
+async def begin_running_transaction(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction: dict,
+    query: Optional[dict] = None,
+) -> Optional[dict]:
+    if storage.running_transactions_collection:
+        return await running_transaction_service.begin(
+            storage, tenant, account_tag, transaction, query
+        )
+    document = {
+        "proxy_tag": transaction.get("proxy_tag"),
+        "destination_rate": transaction.get("destination_rate"),
+        "transaction_tag": transaction.get("transaction_tag"),
+        "source": transaction.get("source"),
+        "source_ip": transaction.get("source_ip"),
+        "destination": transaction.get("destination"),
+        "carrier_ip": transaction.get("carrier_ip"),
+        "tags": transaction.get("tags"),
+        "in_progress": True,
+        "inbound": bool(transaction.get("inbound")),
+        "primary": bool(transaction.get("primary")),
+        "timestamp_begin": transaction.get("timestamp_begin"),
+        "timestamp_end": None,
+    }
+    result = await storage.db["accounts"].find_one_and_update(
+        dict(
+            query or {},
+            **{
+                "tenant": tenant,
+                "account_tag": account_tag,
+                "running_transactions.transaction_tag": {
+                    "$ne": transaction.get("transaction_tag")
+                },
+            },
+        ),
+        {"$push": {"running_transactions": document}},
+        projection={"_id": 1},
     )
     if result is None:
         return None
-    return result[0]
+    return running_transaction_service.serialize(document)
+
+
+async def begin_transaction(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction: dict,
+    min_balance: int = PREPAID_MIN_BALANCE,
+) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Admit and begin the transaction with a single conditional update on the
+    account, checking the active flag, the balance of prepaid accounts and
+    the limits on the transactions in progress. The account is read only
+    when the update does not match, to tell apart a missing account (None,
+    None), a transaction already running and the rejection reason.
+    """
+    query = get_admission_query(storage, transaction, min_balance)
+    for _ in range(ADMISSION_ATTEMPTS):
+        result = await begin_running_transaction(
+            storage, tenant, account_tag, transaction, query
+        )
+        if result is not None:
+            return result, None
+        account = await storage.db["accounts"].find_one(
+            {"tenant": tenant, "account_tag": account_tag}
+        )
+        if account is None:
+            return None, None
+        result = await get_transaction(
+            storage, tenant, account_tag, transaction.get("transaction_tag")
+        )
+        if result is not None:
+            return result, None
+        reason = get_rejection_reason(storage, account, transaction, min_balance)
+        if reason is not None:
+            return None, reason
+        # the account changed after the update, try again
+    return None, REASON_CONFLICT
+
+
+def get_transaction_rate(rate: dict) -> dict:
+    return {
+        "pricelist_tag": rate.get("pricelist_tag"),
+        "prefix": rate.get("prefix"),
+        "datetime_start": rate.get("datetime_start"),
+        "datetime_end": rate.get("datetime_end"),
+        "connect_fee": rate.get("connect_fee"),
+        "rate": rate.get("rate"),
+        "rate_increment": rate.get("rate_increment"),
+        "interval_start": rate.get("interval_start"),
+        "carrier_tag": rate.get("carrier_tag"),
+        "description": rate.get("description"),
+    }
+
+
+async def authorize_transaction(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction: dict,
+    min_balance: int = PREPAID_MIN_BALANCE,
+    loaders: Optional[Loaders] = None,
+) -> Optional[dict]:
+    """
+    Authorize a call in one operation: fetch the account, rate the
+    destination and compute the least cost routing concurrently, then admit
+    and begin the transaction with the conditional update of
+    begin_transaction. Return None if the account does not exist.
+    """
+    account = await storage.db["accounts"].find_one(
+        {"tenant": tenant, "account_tag": account_tag}
+    )
+    if account is None:
+        return None
+    result = {
+        "ok": False,
+        "reason": get_rejection_reason(storage, account, transaction, min_balance),
+        "account": serialize(account),
+        "destination_rate": None,
+        "least_cost_routing": [],
+        "transaction": None,
+    }
+    if result["reason"] is not None:
+        return result
+    result["destination_rate"], result["least_cost_routing"] = await asyncio.gather(
+        pricelist_service.get_rate_by_destination(
+            storage,
+            tenant=tenant,
+            pricelist_tags=account.get("pricelist_tags"),
+            carrier_tags=account.get("carrier_tags"),
+            carrier_tags_override=account.get("carrier_tags_override"),
+            destination=transaction.get("destination"),
+            loaders=loaders,
+        ),
+        pricelist_service.get_least_cost_routing(
+            storage,
+            tenant=tenant,
+            carrier_tags=account.get("carrier_tags"),
+            carrier_tags_override=account.get("carrier_tags_override"),
+            destination=transaction.get("destination"),
+            loaders=loaders,
+        ),
+    )
+    if result["destination_rate"] is None:
+        result["reason"] = REASON_DESTINATION_NOT_RATED
+        return result
+    result["transaction"], result["reason"] = await begin_transaction(
+        storage,
+        tenant,
+        account_tag,
+        dict(
+            transaction,
+            destination_rate=get_transaction_rate(result["destination_rate"]),
+        ),
+        min_balance=min_balance,
+    )
+    if result["transaction"] is None and result["reason"] is None:
+        # the account was deleted in the meantime
+        return None
+    result["ok"] = result["transaction"] is not None
+    return result
 
 
 async def end_transaction(
@@ -378,6 +695,10 @@ async def end_transaction(
     transaction_tag: str,
     timestamp_end: datetime,
 ) -> Optional[dict]:
+    if storage.running_transactions_collection:
+        return await running_transaction_service.end(
+            storage, tenant, account_tag, transaction_tag, timestamp_end
+        )
     result = await storage.db["accounts"].find_one_and_update(
         {
             "tenant": tenant,
@@ -404,6 +725,10 @@ async def commit_transaction(
     transaction_tag: str,
     fee: int,
 ) -> Optional[bool]:
+    if storage.running_transactions_collection:
+        return await running_transaction_service.commit(
+            storage, tenant, account_tag, transaction_tag, fee
+        )
     result = await storage.db["accounts"].find_one_and_update(
         {
             "tenant": tenant,
@@ -424,6 +749,10 @@ async def commit_transaction(
 async def rollback_transaction(
     storage: StorageService, tenant: str, account_tag: str, transaction_tag: str
 ) -> Optional[bool]:
+    if storage.running_transactions_collection:
+        return await running_transaction_service.rollback(
+            storage, tenant, account_tag, transaction_tag
+        )
     result = await storage.db["accounts"].find_one_and_update(
         {
             "tenant": tenant,
@@ -436,3 +765,121 @@ async def rollback_transaction(
     if result:
         return True
     return False
+
+
+async def finish_transactions(
+    storage: StorageService, tenant: str, transactions: List[dict], commit: bool
+) -> List[bool]:
+    """
+    Commit or roll back many running transactions with one unordered bulk
+    write, with a single update per account which pulls its transactions
+    and debits the sum of their fees. Return whether each transaction was
+    finished by this call; the transactions of the accounts changed in the
+    meantime are finished one by one.
+    """
+    if not transactions:
+        return []
+    if storage.running_transactions_collection:
+        finished = await running_transaction_service.finish_many(
+            storage, tenant, transactions, commit
+        )
+        return [
+            (transaction["account_tag"], transaction["transaction_tag"]) in finished
+            for transaction in transactions
+        ]
+    account_tags = list({transaction["account_tag"] for transaction in transactions})
+    accounts = (
+        await storage.db["accounts"]
+        .find(
+            {"tenant": tenant, "account_tag": {"$in": account_tags}},
+            {"account_tag": 1, "running_transactions.transaction_tag": 1},
+        )
+        .to_list(None)
+    )
+    running = {
+        (account["account_tag"], running_transaction["transaction_tag"])
+        for account in accounts
+        for running_transaction in account.get("running_transactions") or []
+    }
+    groups: Dict[str, Dict[str, int]] = {}
+    for transaction in transactions:
+        key = (transaction["account_tag"], transaction["transaction_tag"])
+        if key in running:
+            groups.setdefault(key[0], {})[key[1]] = transaction.get("fee") or 0
+    finished: Set[Tuple[str, str]] = set()
+    if groups:
+        # tells which account updates applied when some did not
+        marker = str(uuid4())
+        requests = []
+        for account_tag, fees in groups.items():
+            update: dict = {
+                "$pull": {
+                    "running_transactions": {"transaction_tag": {"$in": list(fees)}}
+                },
+                "$push": {
+                    "finished_batches": {"$each": [marker], "$slice": -FINISHED_BATCHES}
+                },
+            }
+            if commit:
+                update["$inc"] = {"balance": -sum(fees.values())}
+            requests.append(
+                UpdateOne(
+                    {
+                        "tenant": tenant,
+                        "account_tag": account_tag,
+                        "running_transactions.transaction_tag": {"$all": list(fees)},
+                    },
+                    update,
+                )
+            )
+        result = await storage.db["accounts"].bulk_write(requests, ordered=False)
+        if result.modified_count == len(requests):
+            applied = set(groups)
+        else:
+            accounts = (
+                await storage.db["accounts"]
+                .find(
+                    {"tenant": tenant, "account_tag": {"$in": list(groups)}},
+                    {"account_tag": 1, "finished_batches": 1},
+                )
+                .to_list(None)
+            )
+            applied = {
+                account["account_tag"]
+                for account in accounts
+                if marker in (account.get("finished_batches") or [])
+            }
+        for account_tag, fees in groups.items():
+            if account_tag in applied:
+                finished.update((account_tag, tag) for tag in fees)
+                continue
+            # the account changed before the update, which did not apply:
+            # the transactions finished meanwhile by another call are not
+            # reported as finished by this one
+            for transaction_tag, fee in fees.items():
+                if commit:
+                    ok = await commit_transaction(
+                        storage, tenant, account_tag, transaction_tag, fee
+                    )
+                else:
+                    ok = await rollback_transaction(
+                        storage, tenant, account_tag, transaction_tag
+                    )
+                if ok:
+                    finished.add((account_tag, transaction_tag))
+    return [
+        (transaction["account_tag"], transaction["transaction_tag"]) in finished
+        for transaction in transactions
+    ]
+
+
+async def commit_transactions(
+    storage: StorageService, tenant: str, transactions: List[dict]
+) -> List[bool]:
+    return await finish_transactions(storage, tenant, transactions, commit=True)
+
+
+async def rollback_transactions(
+    storage: StorageService, tenant: str, transactions: List[dict]
+) -> List[bool]:
+    return await finish_transactions(storage, tenant, transactions, commit=False)
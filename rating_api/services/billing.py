@@ -0,0 +1,282 @@
+import math
+
+from datetime import datetime, timezone
+from typing import List, Optional, Union
+
+try:
+    import numpy  # type: ignore
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from . import running_transaction as running_transaction_service
+from . import transaction as transaction_service
+from .storage import StorageService
+
+SECONDS_PER_MINUTE = 60
+
+
+def get_duration(timestamp_begin: Optional[datetime], timestamp_end: datetime) -> int:
+    """
+    Return the duration in seconds, rounded up, with the millisecond
+    precision of the timestamps stored by MongoDB.
+    """
+    if timestamp_begin is None:
+        return 0
+    timestamp_end = get_utc_datetime(timestamp_end)
+    timestamp_begin = get_utc_datetime(timestamp_begin)
+    return max(0, math.ceil((timestamp_end - timestamp_begin).total_seconds()))
+
+
+def get_utc_datetime(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def compute_billable_seconds(destination_rate: dict, duration: int) -> int:
+    """
+    Return the seconds billed for a call lasting duration seconds: the first
+    interval_start seconds are always billed, then the call is billed in
+    blocks of rate_increment seconds.
+    """
+    if duration <= 0:
+        return 0
+    interval_start = destination_rate.get("interval_start") or 0
+    rate_increment = max(1, destination_rate.get("rate_increment") or 1)
+    blocks = math.ceil(max(0, duration - interval_start) / rate_increment)
+    return interval_start + blocks * rate_increment
+
+
+def compute_fee(destination_rate: Optional[dict], duration: int) -> int:
+    """
+    Return the fee of a call lasting duration seconds: the connection fee
+    plus the rate per minute applied to the billable seconds, rounded up.
+    Calls which were not answered are free.
+    """
+    if not destination_rate or duration <= 0:
+        return 0
+    billable = compute_billable_seconds(destination_rate, duration)
+    return (destination_rate.get("connect_fee") or 0) + math.ceil(
+        billable * (destination_rate.get("rate") or 0) / SECONDS_PER_MINUTE
+    )
+
+
+def compute_fees(
+    destination_rates: List[Optional[dict]], durations: List[int]
+) -> List[int]:
+    """
+    Return the fees computed by compute_fee for many calls at once, with
+    array arithmetic when numpy is installed.
+    """
+    if numpy is None or not durations:
+        return [
+            compute_fee(destination_rate, duration)
+            for destination_rate, duration in zip(destination_rates, durations)
+        ]
+
+    def column(field: str, default: int):
+        return numpy.array(
+            [
+                (destination_rate.get(field) or default)
+                if destination_rate
+                else default
+                for destination_rate in destination_rates
+            ],
+            dtype=numpy.int64,
+        )
+
+    duration = numpy.array(durations, dtype=numpy.int64)
+    rated = numpy.array([bool(rate) for rate in destination_rates]) & (duration > 0)
+    interval_start = column("interval_start", 0)
+    rate_increment = numpy.maximum(1, column("rate_increment", 1))
+    # ceiling divisions on integers, as -(-a // b)
+    blocks = -(-numpy.maximum(0, duration - interval_start) // rate_increment)
+    billable = interval_start + blocks * rate_increment
+    fees = column("connect_fee", 0) - (
+        -(billable * column("rate", 0)) // SECONDS_PER_MINUTE
+    )
+    return numpy.where(rated, fees, 0).tolist()
+
+
+def get_duration_expr(timestamp_begin: str, timestamp_end: datetime) -> dict:
+    return {
+        "$max": [
+            0,
+            {
+                "$ceil": {
+                    "$divide": [{"$subtract": [timestamp_end, timestamp_begin]}, 1000]
+                }
+            },
+        ]
+    }
+
+
+def get_fee_expr(destination_rate: str, duration: Union[int, dict]) -> dict:
+    """
+    Return the aggregation expression computing the same fee as compute_fee,
+    given the path of the destination rate and the duration expression.
+    """
+    blocks = {
+        "$ceil": {
+            "$divide": [
+                {"$max": [0, {"$subtract": ["$$duration", "$$interval_start"]}]},
+                "$$rate_increment",
+            ]
+        }
+    }
+    billable = {
+        "$add": ["$$interval_start", {"$multiply": [blocks, "$$rate_increment"]}]
+    }
+    fee = {
+        "$add": [
+            "$$connect_fee",
+            {
+                "$ceil": {
+                    "$divide": [{"$multiply": [billable, "$$rate"]}, SECONDS_PER_MINUTE]
+                }
+            },
+        ]
+    }
+    return {
+        "$let": {
+            "vars": {
+                "duration": duration,
+                "connect_fee": {"$ifNull": [destination_rate + ".connect_fee", 0]},
+                "rate": {"$ifNull": [destination_rate + ".rate", 0]},
+                "interval_start": {
+                    "$ifNull": [destination_rate + ".interval_start", 0]
+                },
+                "rate_increment": {
+                    "$max": [1, {"$ifNull": [destination_rate + ".rate_increment", 1]}]
+                },
+            },
+            "in": {
+                "$cond": [
+                    {
+                        "$and": [
+                            {"$gt": ["$$duration", 0]},
+                            {"$gt": [destination_rate, None]},
+                        ]
+                    },
+                    {"$toLong": fee},
+                    0,
+                ]
+            },
+        }
+    }
+
+
+async def settle_transaction(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction_tag: str,
+    timestamp_end: Optional[datetime] = None,
+    duration: Optional[int] = None,
+) -> Optional[dict]:
+    """
+    Commit the running transaction computing its fee from the stored
+    destination rate: the balance is debited and the running transaction
+    removed with a single update, then the transaction is recorded into the
+    transactions collection. Return None if the transaction is not running.
+    """
+    if timestamp_end is None and duration is None:
+        raise ValueError("Provide either the timestamp_end or the duration!")
+    if timestamp_end is not None:
+        timestamp_end = get_utc_datetime(timestamp_end)
+    if storage.running_transactions_collection:
+        running_transaction = await running_transaction_service.pop(
+            storage, tenant, account_tag, transaction_tag
+        )
+        if running_transaction is None:
+            return None
+    else:
+        transaction = {
+            "$arrayElemAt": [
+                {
+                    "$filter": {
+                        "input": "$running_transactions",
+                        "as": "transaction",
+                        "cond": {
+                            "$eq": ["$$transaction.transaction_tag", transaction_tag]
+                        },
+                    }
+                },
+                0,
+            ]
+        }
+        fee = get_fee_expr(
+            "$$transaction.destination_rate",
+            duration
+            if duration is not None
+            else get_duration_expr("$$transaction.timestamp_begin", timestamp_end),
+        )
+        result = await storage.db["accounts"].find_one_and_update(
+            {
+                "tenant": tenant,
+                "account_tag": account_tag,
+                "running_transactions.transaction_tag": transaction_tag,
+            },
+            [
+                {
+                    "$set": {
+                        "balance": {
+                            "$let": {
+                                "vars": {"transaction": transaction},
+                                "in": {
+                                    "$subtract": [{"$ifNull": ["$balance", 0]}, fee]
+                                },
+                            }
+                        },
+                        "running_transactions": {
+                            "$filter": {
+                                "input": "$running_transactions",
+                                "as": "transaction",
+                                "cond": {
+                                    "$ne": [
+                                        "$$transaction.transaction_tag",
+                                        transaction_tag,
+                                    ]
+                                },
+                            }
+                        },
+                    }
+                }
+            ],
+            projection={
+                "running_transactions": {
+                    "$elemMatch": {"transaction_tag": transaction_tag}
+                }
+            },
+        )
+        if result is None:
+            return None
+        running_transaction = result["running_transactions"][0]
+    if duration is None:
+        duration = get_duration(
+            running_transaction.get("timestamp_begin"), timestamp_end
+        )
+    fee = compute_fee(running_transaction.get("destination_rate"), duration)
+    if storage.running_transactions_collection:
+        await running_transaction_service.settle(storage, running_transaction, fee)
+    return await transaction_service.record(
+        storage,
+        {
+            "tenant": tenant,
+            "transaction_tag": transaction_tag,
+            "account_tag": account_tag,
+            "source": running_transaction.get("source"),
+            "source_ip": running_transaction.get("source_ip"),
+            "carrier_ip": running_transaction.get("carrier_ip"),
+            "destination": running_transaction.get("destination"),
+            "destination_rate": running_transaction.get("destination_rate"),
+            "primary": running_transaction.get("primary"),
+            "inbound": running_transaction.get("inbound"),
+            "tags": running_transaction.get("tags"),
+            "authorized": True,
+            "timestamp_begin": running_transaction.get("timestamp_begin"),
+            "timestamp_end": timestamp_end or running_transaction.get("timestamp_end"),
+            "duration": duration,
+            "fee": fee,
+        },
+    )
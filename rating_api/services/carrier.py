@@ -1,12 +1,13 @@
-import re
-
 from typing import List, Optional
 from uuid import uuid4
-from pymongo import ASCENDING, DESCENDING  # type: ignore
 from pymongo.collection import ReturnDocument  # type: ignore
 
+from . import pagination
+from . import search
 from .storage import StorageService
 
+SEARCH_FIELDS = search.SEARCH_FIELDS["carriers"]
+
 
 def serialize(result: dict) -> dict:
     return {
@@ -28,13 +29,14 @@ async def get(
     tenant: Optional[str] = None,
     carrier_tag: Optional[str] = None,
     role: str = "R",
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
         params = {"_id": id}
     else:
         params = {"tenant": tenant, "carrier_tag": carrier_tag}
-    result = await storage.db["carriers"].find_one(params)
+    result = await storage.find_one("carriers", params, projection)
     return serialize(result) if result is not None else None
 
 
@@ -42,15 +44,7 @@ async def get_query(storage: StorageService, filter: Optional[dict] = None) -> d
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {"tenant": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"carrier_tag": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"host": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     if filter.get("ids"):
@@ -69,18 +63,62 @@ async def get_all(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     query = await get_query(storage, filter)
-    result = storage.db["carriers"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["carriers"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    carriers = list(
-        serialize(carrier)
-        for carrier in await result.skip(page * perPage).limit(perPage).to_list(None)
+    return [
+        dict(serialize(carrier), cursor=pagination.encode_cursor(carrier, sortField))
+        for carrier in result
+    ]
+
+
+async def get_all_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    query = await get_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["carriers"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
     )
-    return carriers
+    return {
+        "rows": [
+            dict(
+                serialize(carrier), cursor=pagination.encode_cursor(carrier, sortField)
+            )
+            for carrier in result
+        ],
+        "count": count,
+    }
 
 
 async def get_all_meta(
@@ -106,6 +144,7 @@ async def upsert(storage: StorageService, carrier: dict) -> Optional[dict]:
         },
         {
             "$setOnInsert": {"_id": carrier.get("id") or str(uuid4())},
+            "$currentDate": {"updated_at": True},
             "$set": storage.filter_dict(
                 {
                     "tenant": carrier.get("tenant"),
@@ -116,13 +155,20 @@ async def upsert(storage: StorageService, carrier: dict) -> Optional[dict]:
                     "active": bool(carrier.get("active"))
                     if carrier.get("active") is not None
                     else None,
+                    "search_keys": search.get_complete_search_keys(
+                        carrier, SEARCH_FIELDS
+                    ),
                 }
             ),
         },
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return serialize(result) if result is not None else None
+    result = await search.update_search_keys(
+        storage.db["carriers"], result, SEARCH_FIELDS
+    )
+    storage.invalidate("carriers", result["_id"], result)
+    return serialize(result)
 
 
 async def delete(
@@ -136,4 +182,6 @@ async def delete(
     )
     if carrier is not None:
         await storage.db["carriers"].delete_one({"_id": carrier["id"]})
+        await storage.record_delete("carriers", carrier["id"], carrier)
+        storage.invalidate("carriers", carrier["id"])
     return carrier
@@ -0,0 +1,252 @@
+import asyncio
+import logging
+
+from typing import Any, Dict, Optional, Set, Tuple
+
+from bson import ObjectId  # type: ignore
+from pymongo import ASCENDING, DESCENDING  # type: ignore
+from pymongo.errors import OperationFailure, PyMongoError  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = (
+    "accounts",
+    "carriers",
+    "customers",
+    "pricelist_rates",
+    "pricelists",
+    "sellers",
+)
+
+# the fields locating a rate in the rate cache
+RATE_KEY_FIELDS = {"tenant", "pricelist_tag", "carrier_tag", "prefix"}
+
+# the collections whose caches need the fields of the deleted documents
+RATE_COLLECTIONS = ("pricelist_rates", "pricelists")
+
+# the deletes recorded for the workers polling for changes, which cannot see
+# them otherwise, and the fields of the deleted documents kept there
+DELETES_COLLECTION = "deleted_documents"
+DELETES_TTL = 86400
+DELETE_KEY_FIELDS = (
+    "tenant",
+    "account_tag",
+    "carrier_tag",
+    "customer_tag",
+    "seller_tag",
+    "pricelist_tag",
+    "prefix",
+    "version",
+)
+
+CHANGE_STREAM_HISTORY_LOST = 286
+
+CHANGE_STREAM_UNSUPPORTED = (40573,)
+
+
+class ChangeStreamListener(object):
+    """
+    ChangeStreamListener keeps the in-process caches of the storage coherent
+    with the writes of the other workers: it tails a change stream on the
+    watched collections, resuming after the last seen event when reconnecting,
+    and falls back to polling the updated_at field when change streams are
+    not available, e.g. on a standalone MongoDB server; the deletes are then
+    read from the records written by record_delete.
+    """
+
+    def __init__(
+        self,
+        collections: Tuple[str, ...] = WATCHED_COLLECTIONS,
+        poll_interval: float = 1.0,
+        retry_interval: float = 1.0,
+    ):
+        self.collections = collections
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.resume_token: Optional[dict] = None
+        self._storage: Any = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, storage):
+        self._storage = storage
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def apply(self, change: dict):
+        collection = change.get("ns", {}).get("coll")
+        operation = change["operationType"]
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self.invalidate_all()
+            return
+        id = change.get("documentKey", {}).get("_id")
+        document = change.get("fullDocument")
+        if collection == DELETES_COLLECTION:
+            # the records of the deletes, which expire unseen
+            if document is not None:
+                self.apply_polled(collection, document)
+            return
+        # known for the deletes read from their records
+        deleted = change.get("fullDocumentBeforeChange")
+        rate_index = self._storage.rate_index
+        if collection == "pricelist_rates" and rate_index is not None:
+            if document is not None:
+                rate_index.update(document)
+            else:
+                rate_index.remove(dict(deleted or {}, _id=id))
+        if operation == "delete" and deleted is None and collection in RATE_COLLECTIONS:
+            # applied from the record of the delete, which carries the tenant
+            # and the prefix; the rates deleted without a record belong to
+            # retired versions, which are neither cached nor compiled
+            return
+        if collection == "pricelists" and rate_index is not None:
+            pricelist = document or deleted
+            if pricelist is None:
+                rate_index.invalidate()
+            else:
+                rate_index.invalidate(
+                    pricelist.get("tenant"), pricelist.get("pricelist_tag")
+                )
+        if collection == "pricelist_rates" and operation == "update":
+            updated_fields = change.get("updateDescription", {}).get(
+                "updatedFields", {}
+            )
+            if RATE_KEY_FIELDS & set(updated_fields):
+                # the previous prefix of the rate is unknown, its tenant is
+                # unless it changed too
+                document = (
+                    {"tenant": document.get("tenant")}
+                    if document is not None and "tenant" not in updated_fields
+                    else None
+                )
+        self._storage.invalidate(collection, id, document or deleted)
+
+    def invalidate_all(self):
+        for collection in self.collections:
+            self._storage.invalidate(collection)
+        if self._storage.rate_index is not None:
+            self._storage.rate_index.invalidate()
+
+    async def watch(self):
+        collections = list(self.collections) + [DELETES_COLLECTION]
+        pipeline = [{"$match": {"ns.coll": {"$in": collections}}}]
+        async with self._storage.db.watch(
+            pipeline, full_document="updateLookup", resume_after=self.resume_token
+        ) as stream:
+            async for change in stream:
+                self.apply(change)
+                if change["operationType"] == "invalidate":
+                    # the stream cannot be resumed after an invalidate event
+                    self.resume_token = None
+                    return
+                self.resume_token = stream.resume_token
+
+    async def record_delete(self, db, collection: str, id: Any, document: dict):
+        """
+        Record the delete of the document, with its key fields, for the
+        workers polling for changes; the records expire after DELETES_TTL.
+        """
+        if collection not in self.collections:
+            return
+        deleted = dict(
+            (field, document[field]) for field in DELETE_KEY_FIELDS if field in document
+        )
+        deleted["_id"] = id
+        # upserted to be dated by the server, like the updated_at fields
+        await db[DELETES_COLLECTION].update_one(
+            {"_id": ObjectId()},
+            {
+                "$set": {"collection": collection, "document": deleted},
+                "$currentDate": {"updated_at": True},
+            },
+            upsert=True,
+        )
+
+    def apply_polled(self, collection: str, document: dict):
+        if collection == DELETES_COLLECTION:
+            self.apply(
+                {
+                    "ns": {"coll": document["collection"]},
+                    "operationType": "delete",
+                    "documentKey": {"_id": document["document"]["_id"]},
+                    "fullDocumentBeforeChange": document["document"],
+                }
+            )
+            return
+        # the previous fields of the document are unknown, the changes are
+        # applied to its current ones
+        self.apply(
+            {
+                "ns": {"coll": collection},
+                "operationType": "replace",
+                "documentKey": {"_id": document["_id"]},
+                "fullDocument": document,
+            }
+        )
+
+    async def poll(self):
+        db = self._storage.db
+        collections = self.collections + (DELETES_COLLECTION,)
+        since: Dict[str, Any] = {}
+        # the documents seen with the since updated_at of each collection,
+        # which is matched again as the writes sharing it may come later
+        seen: Dict[str, Set[Any]] = {}
+        for collection in collections:
+            latest = await db[collection].find_one(
+                {"updated_at": {"$ne": None}},
+                {"updated_at": 1},
+                sort=[("updated_at", DESCENDING)],
+            )
+            since[collection] = latest["updated_at"] if latest is not None else None
+            seen[collection] = set()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for collection in collections:
+                query = (
+                    {"updated_at": {"$gte": since[collection]}}
+                    if since[collection] is not None
+                    else {"updated_at": {"$ne": None}}
+                )
+                cursor = db[collection].find(query).sort("updated_at", ASCENDING)
+                async for document in cursor:
+                    if document["updated_at"] != since[collection]:
+                        since[collection] = document["updated_at"]
+                        seen[collection] = set()
+                    elif document["_id"] in seen[collection]:
+                        continue
+                    seen[collection].add(document["_id"])
+                    self.apply_polled(collection, document)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    logger.warning(
+                        "Change streams are not available, polling for changes"
+                    )
+                    break
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # the changes missed while disconnected are unknown
+                    self.resume_token = None
+                    self.invalidate_all()
+                else:
+                    logger.exception("Change stream failed, reconnecting")
+            except PyMongoError:
+                logger.exception("Change stream failed, reconnecting")
+            await asyncio.sleep(self.retry_interval)
+        while True:
+            try:
+                await self.poll()
+            except PyMongoError:
+                logger.exception("Polling for changes failed, retrying")
+                self.invalidate_all()
+                await asyncio.sleep(self.retry_interval)
@@ -1,12 +1,13 @@
-import re
-
 from typing import List, Optional
 from uuid import uuid4
-from pymongo import ASCENDING, DESCENDING  # type: ignore
 from pymongo.collection import ReturnDocument  # type: ignore
 
+from . import pagination
+from . import search
 from .storage import StorageService
 
+SEARCH_FIELDS = search.SEARCH_FIELDS["customers"]
+
 
 def serialize(result: dict) -> dict:
     return {
@@ -37,13 +38,14 @@ async def get(
     tenant: Optional[str] = None,
     customer_tag: Optional[str] = None,
     role: str = "R",
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
         params = {"_id": id}
     else:
         params = {"tenant": tenant, "customer_tag": customer_tag}
-    result = await storage.db["customers"].find_one(params)
+    result = await storage.find_one("customers", params, projection)
     return serialize(result) if result is not None else None
 
 
@@ -51,17 +53,7 @@ async def get_query(storage: StorageService, filter: Optional[dict] = None) -> d
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {"tenant": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"customer_tag": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"company_name": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"tax_number": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"vat_number": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     if filter.get("ids"):
@@ -80,18 +72,63 @@ async def get_all(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     query = await get_query(storage, filter)
-    result = storage.db["customers"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["customers"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    customers = list(
-        serialize(customer)
-        for customer in await result.skip(page * perPage).limit(perPage).to_list(None)
+    return [
+        dict(serialize(customer), cursor=pagination.encode_cursor(customer, sortField))
+        for customer in result
+    ]
+
+
+async def get_all_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    query = await get_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["customers"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
     )
-    return customers
+    return {
+        "rows": [
+            dict(
+                serialize(customer),
+                cursor=pagination.encode_cursor(customer, sortField),
+            )
+            for customer in result
+        ],
+        "count": count,
+    }
 
 
 async def get_all_meta(
@@ -117,6 +154,7 @@ async def upsert(storage: StorageService, customer: dict) -> Optional[dict]:
         },
         {
             "$setOnInsert": {"_id": customer.get("id") or str(uuid4())},
+            "$currentDate": {"updated_at": True},
             "$set": storage.filter_dict(
                 {
                     "tenant": customer.get("tenant"),
@@ -136,13 +174,20 @@ async def upsert(storage: StorageService, customer: dict) -> Optional[dict]:
                     "active": bool(customer.get("active"))
                     if customer.get("active") is not None
                     else None,
+                    "search_keys": search.get_complete_search_keys(
+                        customer, SEARCH_FIELDS
+                    ),
                 }
             ),
         },
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return serialize(result) if result is not None else None
+    result = await search.update_search_keys(
+        storage.db["customers"], result, SEARCH_FIELDS
+    )
+    storage.invalidate("customers", result["_id"], result)
+    return serialize(result)
 
 
 async def delete(
@@ -156,4 +201,6 @@ async def delete(
     )
     if customer is not None:
         await storage.db["customers"].delete_one({"_id": customer["id"]})
+        await storage.record_delete("customers", customer["id"], customer)
+        storage.invalidate("customers", customer["id"])
     return customer
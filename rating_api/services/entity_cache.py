@@ -0,0 +1,83 @@
+import time
+
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import bson  # type: ignore
+
+CACHED_COLLECTIONS = ("carriers", "customers", "pricelists", "sellers")
+
+
+class EntityCache(object):
+    """
+    EntityCache is a process-wide cache of the raw documents of the small
+    reference collections, looked up by a tuple of key fields, e.g. ("_id",)
+    or ("tenant", "carrier_tag"). Entries expire after ttl seconds and the
+    least recently used ones are evicted beyond max_bytes of BSON.
+    """
+
+    name = "entities"
+
+    def __init__(
+        self,
+        collections: Tuple[str, ...] = CACHED_COLLECTIONS,
+        ttl: float = 60.0,
+        max_bytes: int = 16 * 1024 * 1024,
+    ):
+        self.collections = collections
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, collection: str, fields: Tuple[str, ...], key: tuple) -> Any:
+        entry_key = (collection, fields, key)
+        entry = self._entries.get(entry_key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(entry_key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry_key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, collection: str, fields: Tuple[str, ...], key: tuple, document: dict):
+        entry_key = (collection, fields, key)
+        if entry_key in self._entries:
+            self._remove(entry_key)
+        size = len(bson.encode(document))
+        self._entries[entry_key] = (time.monotonic() + self.ttl, size, document)
+        self.size += size
+        while self.size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(
+        self, collection: str, id: Optional[Any] = None, document: dict = None
+    ):
+        if collection not in self.collections:
+            return
+        for entry_key, entry in list(self._entries.items()):
+            if entry_key[0] == collection and (id is None or entry[2]["_id"] == id):
+                self._remove(entry_key)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size,
+        }
+
+    def _remove(self, entry_key: tuple):
+        _, size, _ = self._entries.pop(entry_key)
+        self.size -= size
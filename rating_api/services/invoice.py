@@ -1,24 +1,36 @@
-import re
-
 from typing import List, Optional
 from datetime import datetime
 from uuid import uuid4
-from pymongo import ASCENDING, DESCENDING  # type: ignore
 from pymongo.collection import ReturnDocument  # type: ignore
 
 from . import customer as customer_service
+from .loader import Loaders
+from . import pagination
+from . import search
 from .storage import StorageService
 
+SEARCH_FIELDS = search.SEARCH_FIELDS["invoices"]
+
+
+async def get_customer(
+    storage: StorageService, invoice: dict, loaders: Optional[Loaders] = None
+) -> Optional[dict]:
+    if not invoice.get("customer_tag"):
+        return None
+    loaders = loaders or Loaders(storage)
+    result = await loaders.get("customers", "tenant", "customer_tag").load(
+        (invoice.get("tenant"), invoice.get("customer_tag"))
+    )
+    return customer_service.serialize(result) if result is not None else None
+
 
-async def process(storage: StorageService, invoice: dict) -> dict:
+async def process(
+    storage: StorageService, invoice: dict, loaders: Optional[Loaders] = None
+) -> dict:
     invoice = invoice.copy()
     #
     if invoice.get("customer_tag"):
-        customer = await customer_service.get(
-            storage,
-            tenant=invoice.get("tenant"),
-            customer_tag=invoice.get("customer_tag"),
-        )
+        customer = await get_customer(storage, invoice, loaders)
         if customer is None:
             raise ValueError(
                 "Customer with id = %s not found in tenant %s!"
@@ -28,21 +40,13 @@ async def process(storage: StorageService, invoice: dict) -> dict:
     return invoice
 
 
-async def serialize(storage: StorageService, result: dict) -> dict:
-    result = await process(storage, result)
+def serialize(result: dict) -> dict:
     return {
         "id": result.get("_id"),
         "tenant": result.get("tenant"),
         "invoice_number": result.get("invoice_number"),
         "invoice_date": result.get("invoice_date"),
         "customer_tag": result.get("customer_tag"),
-        "customer": await customer_service.get(
-            storage,
-            tenant=result.get("tenant"),
-            customer_tag=result.get("customer_tag"),
-        )
-        if result.get("customer_tag")
-        else None,
         "rows": [
             {
                 "prefix": item.get("prefix"),
@@ -65,32 +69,22 @@ async def get(
     tenant: Optional[str] = None,
     invoice_number: Optional[str] = None,
     role: str = "R",
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
         params = {"_id": id}
     else:
         params = {"tenant": tenant, "invoice_number": invoice_number}
-    result = await storage.db["invoices"].find_one(params)
-    return await serialize(storage, result) if result is not None else None
+    result = await storage.db["invoices"].find_one(params, projection)
+    return serialize(result) if result is not None else None
 
 
 async def get_query(storage: StorageService, filter: Optional[dict] = None) -> dict:
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {"tenant": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {
-                        "invoice_number": re.compile(
-                            re.escape(filter["q"]), re.IGNORECASE
-                        )
-                    },
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     if filter.get("ids"):
@@ -117,18 +111,62 @@ async def get_all(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     query = await get_query(storage, filter)
-    result = storage.db["invoices"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["invoices"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    invoices = [
-        await serialize(storage, invoice)
-        for invoice in await result.skip(page * perPage).limit(perPage).to_list(None)
+    return [
+        dict(serialize(invoice), cursor=pagination.encode_cursor(invoice, sortField))
+        for invoice in result
     ]
-    return invoices
+
+
+async def get_all_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    query = await get_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["invoices"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
+    )
+    return {
+        "rows": [
+            dict(
+                serialize(invoice), cursor=pagination.encode_cursor(invoice, sortField)
+            )
+            for invoice in result
+        ],
+        "count": count,
+    }
 
 
 async def get_all_meta(
@@ -144,8 +182,11 @@ async def get_all_meta(
     return {"count": result}
 
 
-async def upsert(storage: StorageService, invoice: dict) -> Optional[dict]:
-    invoice = await process(storage, invoice)
+async def upsert(
+    storage: StorageService, invoice: dict, loaders: Optional[Loaders] = None
+) -> Optional[dict]:
+    loaders = loaders or Loaders(storage)
+    invoice = await process(storage, invoice, loaders)
     result = await storage.db["invoices"].find_one_and_update(
         {"_id": invoice.get("id")}
         if invoice.get("id")
@@ -180,13 +221,20 @@ async def upsert(storage: StorageService, invoice: dict) -> Optional[dict]:
                     "net_total": invoice.get("net_total"),
                     "vat_rate": invoice.get("vat_rate"),
                     "total": invoice.get("total"),
+                    "search_keys": search.get_complete_search_keys(
+                        invoice, SEARCH_FIELDS
+                    ),
                 }
             ),
         },
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return await serialize(storage, result) if result is not None else None
+    result = await search.update_search_keys(
+        storage.db["invoices"], result, SEARCH_FIELDS
+    )
+    loaders.clear("invoices")
+    return serialize(result) if result is not None else None
 
 
 async def delete(
@@ -194,10 +242,17 @@ async def delete(
     id: Optional[str] = None,
     tenant: Optional[str] = None,
     invoice_number: Optional[str] = None,
+    loaders: Optional[Loaders] = None,
 ) -> Optional[dict]:
     invoice = await get(
-        storage, id=id, tenant=tenant, invoice_number=invoice_number, role="W"
+        storage,
+        id=id,
+        tenant=tenant,
+        invoice_number=invoice_number,
+        role="W",
     )
     if invoice is not None:
         await storage.db["invoices"].delete_one({"_id": invoice["id"]})
+        if loaders is not None:
+            loaders.clear("invoices")
     return invoice
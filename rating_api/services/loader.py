@@ -0,0 +1,130 @@
+import asyncio
+
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from starlette.requests import Request
+
+from . import storage as storage_service
+from .storage import StorageService
+
+
+class DataLoader(object):
+    """
+    DataLoader collects the keys requested during the same iteration of the
+    event loop, resolves them with a single call to batch_load and caches the
+    results for the lifetime of the loader.
+    """
+
+    def __init__(self, batch_load: Callable[[List[Any]], Awaitable[List[Any]]]):
+        self._batch_load = batch_load
+        self._cache: Dict[Any, asyncio.Future] = {}
+        self._queue: List[Tuple[Any, asyncio.Future]] = []
+
+    def load(self, key: Any) -> asyncio.Future:
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            if not self._queue:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+            self._queue.append((key, future))
+        return future
+
+    async def load_many(self, keys: List[Any]) -> List[Any]:
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    def prime(self, key: Any, value: Any):
+        future = asyncio.get_event_loop().create_future()
+        future.set_result(value)
+        self._cache[key] = future
+
+    def clear(self, key: Any = None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    async def _dispatch(self):
+        queue, self._queue = self._queue, []
+        try:
+            values = await self._batch_load([key for key, _ in queue])
+        except Exception as e:
+            for key, future in queue:
+                self._cache.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (key, future), value in zip(queue, values):
+            # missing documents are not cached, they may be created later on
+            if value is None:
+                self._cache.pop(key, None)
+            if not future.done():
+                future.set_result(value)
+
+
+async def find_by_keys(
+    storage: StorageService, collection: str, fields: Tuple[str, ...], keys: List[tuple]
+) -> List[Any]:
+    found: Dict[tuple, dict] = {}
+    cache = storage.entity_cache
+    if cache is not None and collection in cache.collections:
+        for key in keys:
+            document = cache.get(collection, fields, key)
+            if document is not None:
+                found[key] = document
+    groups: Dict[tuple, set] = {}
+    for key in keys:
+        if key not in found:
+            groups.setdefault(key[:-1], set()).add(key[-1])
+    if groups:
+        filters = [
+            dict(zip(fields[:-1], group), **{fields[-1]: {"$in": list(values)}})
+            for group, values in groups.items()
+        ]
+        documents = (
+            await storage.db[collection]
+            .find(filters[0] if len(filters) == 1 else {"$or": filters})
+            .to_list(None)
+        )
+        for document in documents:
+            key = tuple(document.get(field) for field in fields)
+            found[key] = document
+            if cache is not None and collection in cache.collections:
+                cache.set(collection, fields, key, document)
+    return [found.get(key) for key in keys]
+
+
+class Loaders(object):
+    """
+    Loaders is a registry of DataLoaders fetching raw documents by a tuple of
+    key fields, e.g. ("_id",) or ("tenant", "carrier_tag").
+    """
+
+    def __init__(self, storage: StorageService):
+        self._storage = storage
+        self._loaders: Dict[tuple, DataLoader] = {}
+
+    def get(self, collection: str, *fields: str) -> DataLoader:
+        key = (collection, fields)
+        loader = self._loaders.get(key)
+        if loader is None:
+            loader = DataLoader(
+                partial(find_by_keys, self._storage, collection, fields)
+            )
+            self._loaders[key] = loader
+        return loader
+
+    def clear(self, collection: str = None):
+        for key, loader in self._loaders.items():
+            if collection is None or key[0] == collection:
+                loader.clear()
+
+
+def get(request: Request) -> Loaders:
+    loaders = getattr(request.state, "loaders", None)
+    if loaders is None:
+        loaders = Loaders(storage_service.get(request))
+        request.state.loaders = loaders
+    return loaders
@@ -0,0 +1,190 @@
+import base64
+import time
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import SON, ObjectId, json_util  # type: ignore
+from motor.motor_asyncio import AsyncIOMotorCollection  # type: ignore
+from pymongo import ASCENDING, DESCENDING  # type: ignore
+
+COUNT_CACHE_TTL = 60
+
+_counts: Dict[Tuple[str, Any], Tuple[float, int]] = {}
+
+# the types of the sort values and of the ids of a cursor
+CURSOR_VALUE_TYPES = (str, int, float, bool, datetime, ObjectId, type(None))
+CURSOR_ID_TYPES = (str, ObjectId)
+
+
+def get_sort_field(sortField: str) -> str:
+    return sortField if sortField != "id" else "_id"
+
+
+def encode_cursor(document: dict, sortField: str) -> str:
+    value = [document.get(get_sort_field(sortField)), document.get("_id")]
+    return base64.urlsafe_b64encode(json_util.dumps(value).encode("utf-8")).decode(
+        "ascii"
+    )
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    try:
+        value, id = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor %s!" % cursor)
+    # the values are used as is in the queries, operators must not pass
+    if not isinstance(value, CURSOR_VALUE_TYPES) or not isinstance(id, CURSOR_ID_TYPES):
+        raise ValueError("Invalid cursor %s!" % cursor)
+    return value, id
+
+
+def get_cursor_query(sort_field: str, operator: str, cursor: str) -> dict:
+    value, id = decode_cursor(cursor)
+    if sort_field == "_id":
+        return {"_id": {operator: id}}
+    # missing values sort before any other value
+    filters: List[dict] = [{sort_field: value, "_id": {operator: id}}]
+    if value is None:
+        if operator == "$gt":
+            filters.append({sort_field: {"$ne": None}})
+    else:
+        filters.append({sort_field: {operator: value}})
+        if operator == "$lt":
+            filters.append({sort_field: None})
+    return {"$or": filters}
+
+
+def get_page_args(
+    query: dict,
+    projection: Optional[dict] = None,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> Tuple[dict, Optional[dict], List[Tuple[str, int]], int, bool]:
+    sort_field = get_sort_field(sortField)
+    ascending = sortOrder.lower() == "asc"
+    filters_and = [query] if query else []
+    if after is not None:
+        filters_and.append(
+            get_cursor_query(sort_field, "$gt" if ascending else "$lt", after)
+        )
+    if before is not None:
+        filters_and.append(
+            get_cursor_query(sort_field, "$lt" if ascending else "$gt", before)
+        )
+    # paginating backwards scans the index in the opposite direction
+    backwards = before is not None and after is None
+    direction = ASCENDING if ascending != backwards else DESCENDING
+    sort = [(sort_field, direction)]
+    if sort_field != "_id":
+        sort.append(("_id", direction))
+    if projection is not None:
+        projection = dict(projection, **{sort_field: 1})
+    if len(filters_and) > 1:
+        query = {"$and": filters_and}
+    elif filters_and:
+        query = filters_and[0]
+    skip = page * perPage if after is None and before is None else 0
+    return query, projection, sort, skip, backwards
+
+
+async def find(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    projection: Optional[dict] = None,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> List[dict]:
+    """
+    Find a page of documents, either by offset (page and perPage) or, when
+    the after or before cursors are provided, by seeking on the sort key.
+    """
+    query, projection, sort, skip, backwards = get_page_args(
+        query, projection, page, perPage, sortField, sortOrder, after, before
+    )
+    result = collection.find(query, projection).sort(sort)
+    documents = await result.skip(skip).limit(perPage).to_list(None)
+    if backwards:
+        documents.reverse()
+    return documents
+
+
+async def estimate_count(
+    collection: AsyncIOMotorCollection, query: dict
+) -> Optional[int]:
+    """
+    Estimate the count of unfiltered or tenant-only queries, using the
+    collection metadata or a count cached for COUNT_CACHE_TTL seconds.
+    """
+    if not query:
+        return await collection.estimated_document_count()
+    filters = query.get("$and", [query])
+    if len(filters) != 1 or list(filters[0].keys()) != ["tenant"]:
+        return None
+    key = (collection.full_name, filters[0]["tenant"])
+    timestamp, count = _counts.get(key, (0.0, 0))
+    if time.monotonic() - timestamp > COUNT_CACHE_TTL:
+        count = await collection.count_documents(filters[0])
+        _counts[key] = (time.monotonic(), count)
+    return count
+
+
+async def find_with_count(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    projection: Optional[dict] = None,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> Tuple[List[dict], int]:
+    """
+    Find a page of documents and the total count of the query with a single
+    $facet aggregation, or with an estimated count when requested.
+    """
+    count = await estimate_count(collection, query) if estimate else None
+    if count is not None:
+        documents = await find(
+            collection,
+            query,
+            projection,
+            page=page,
+            perPage=perPage,
+            sortField=sortField,
+            sortOrder=sortOrder,
+            after=after,
+            before=before,
+        )
+        return documents, count
+    page_query, projection, sort, skip, backwards = get_page_args(
+        query, projection, page, perPage, sortField, sortOrder, after, before
+    )
+    rows: List[dict] = []
+    if page_query is not query:
+        rows.append({"$match": page_query})
+    rows.append({"$sort": SON(sort)})
+    if skip:
+        rows.append({"$skip": skip})
+    rows.append({"$limit": perPage})
+    if projection is not None:
+        rows.append({"$project": projection})
+    pipeline = [
+        {"$match": query},
+        {"$facet": {"rows": rows, "count": [{"$count": "count"}]}},
+    ]
+    result = await collection.aggregate(pipeline).to_list(None)
+    documents = result[0]["rows"]
+    if backwards:
+        documents.reverse()
+    return documents, result[0]["count"][0]["count"] if result[0]["count"] else 0
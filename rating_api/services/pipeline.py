@@ -0,0 +1,164 @@
+import asyncio
+import csv
+
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    List,
+    Optional,
+    Tuple,
+)
+
+MAX_ERRORS = 1000
+
+# the most lines a quoted CSV value may span
+MAX_ROW_LINES = 100
+
+
+async def number_lines(lines: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Yield the lines which are not blank along with their line number.
+    """
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line.strip():
+            yield line_number, line
+
+
+class _Lines(object):
+    """
+    _Lines feeds a csv.reader the lines of a row, which it is given only
+    once they are all available.
+    """
+
+    def __init__(self):
+        self.lines: Deque[str] = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def read_csv_rows(
+    lines: AsyncIterator[bytes],
+) -> AsyncIterator[Tuple[int, List[str]]]:
+    """
+    Yield the rows of a UTF-8 CSV stream along with the number of their
+    first line, read with a single csv.reader: a quoted value may span up
+    to MAX_ROW_LINES lines. A ValueError is yielded instead of the rows
+    whose quoted value is not terminated by then.
+    """
+    pending = _Lines()
+    reader = csv.reader(pending)
+    quotes = 0
+    line_number = 0
+    first_line = 0
+    async for line in lines:
+        line_number += 1
+        text = line.decode("utf-8")
+        if not pending.lines:
+            if not text.strip():
+                continue
+            first_line = line_number
+        pending.lines.append(text if text.endswith("\n") else text + "\n")
+        quotes += text.count('"')
+        if quotes % 2 == 0:
+            quotes = 0
+            yield first_line, next(reader)
+        elif len(pending.lines) >= MAX_ROW_LINES:
+            quotes = 0
+            pending.lines.clear()
+            yield first_line, ValueError("Unterminated quoted value!")
+    if pending.lines:
+        pending.lines.clear()
+        yield first_line, ValueError("Unterminated quoted value!")
+
+
+async def import_records(
+    records: AsyncIterator[Tuple[int, Any]],
+    parse: Callable[[Any], Optional[Any]],
+    write: Callable[[List[Any]], Awaitable[List[Optional[str]]]],
+    batch_size: int,
+    progress: Optional[Callable[[int, int], None]] = None,
+    error: Optional[Callable[[dict], None]] = None,
+    max_errors: int = MAX_ERRORS,
+) -> dict:
+    """
+    Parse the numbered records and write the parsed documents in batches of
+    batch_size, each batch being written while the next one is parsed.
+    parse returns None for the records to skip and raises ValueError for
+    the invalid ones, the records which are a ValueError are invalid too;
+    write returns the error of each document, or None. The errors are
+    passed to error in line order as each batch completes, and only the
+    first max_errors are kept: return the count of the written documents,
+    the kept errors and the count of all of them. progress is called with
+    both counts after each batch.
+    """
+    count = 0
+    error_count = 0
+    errors: List[dict] = []
+    batch: List[Any] = []
+    line_numbers: List[int] = []
+    parse_errors: List[dict] = []
+    pending: Optional[asyncio.Future] = None
+
+    async def wait_pending():
+        nonlocal count, error_count
+        if pending is None:
+            return
+        numbers, results, batch_errors = await pending
+        for line_number, result in zip(numbers, results):
+            if result is None:
+                count += 1
+            else:
+                batch_errors.append({"line": line_number, "error": result})
+        batch_errors.sort(key=lambda batch_error: batch_error["line"])
+        for batch_error in batch_errors:
+            error_count += 1
+            if len(errors) < max_errors:
+                errors.append(batch_error)
+            if error is not None:
+                error(batch_error)
+        if progress is not None:
+            progress(count, error_count)
+
+    async def write_batch(
+        numbers: List[int], documents: List[Any], batch_errors: List[dict]
+    ):
+        results = await write(documents) if documents else []
+        return numbers, results, batch_errors
+
+    async for line_number, record in records:
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            document = parse(record)
+            if document is not None:
+                batch.append(document)
+                line_numbers.append(line_number)
+        except ValueError as e:
+            parse_errors.append({"line": line_number, "error": str(e)})
+        if len(batch) + len(parse_errors) >= batch_size:
+            await wait_pending()
+            pending = asyncio.ensure_future(
+                write_batch(line_numbers, batch, parse_errors)
+            )
+            batch, line_numbers, parse_errors = [], [], []
+            # let the write start before parsing the next batch, the records
+            # may be read without ever yielding to the event loop
+            await asyncio.sleep(0)
+    await wait_pending()
+    pending = None
+    if batch or parse_errors:
+        pending = asyncio.ensure_future(write_batch(line_numbers, batch, parse_errors))
+        await wait_pending()
+    return {"count": count, "errors": errors, "error_count": error_count}
@@ -1,14 +1,48 @@
-import re
+import asyncio
 
-from typing import List, Optional
-from operator import itemgetter
+from typing import Dict, List, Optional
 from uuid import uuid4
-from pymongo import ASCENDING, DESCENDING  # type: ignore
+from pymongo import ASCENDING, DESCENDING, UpdateOne  # type: ignore
 from pymongo.collection import ReturnDocument  # type: ignore
+from pymongo.errors import BulkWriteError  # type: ignore
 
 from . import carrier as carrier_service
+from . import pagination
+from . import rate_cache
+from . import rate_table
+from . import search
+from .loader import Loaders
 from .storage import StorageService
 
+PRICELIST_SEARCH_FIELDS = search.SEARCH_FIELDS["pricelists"]
+
+PRICELIST_RATE_SEARCH_FIELDS = search.SEARCH_FIELDS["pricelist_rates"]
+
+PRICELIST_RATE_PROJECTION = {
+    "tenant": 1,
+    "pricelist_tag": 1,
+    "carrier_tag": 1,
+    "prefix": 1,
+    "datetime_start": 1,
+    "datetime_end": 1,
+    "active": 1,
+    "connect_fee": 1,
+    "rate": 1,
+    "rate_increment": 1,
+    "interval_start": 1,
+    "description": 1,
+    "version": 1,
+}
+
+# the retired versions kept after a switch-over, besides the active one
+RETAINED_VERSIONS = 1
+
+# the destinations whose candidate prefixes are fetched with one query
+DESTINATIONS_BATCH_SIZE = 1000
+
+# the destinations rated by a single request
+MAX_DESTINATIONS = 10000
+
 
 def serialize_pricelist(result: dict) -> dict:
     return {
@@ -17,19 +51,30 @@ def serialize_pricelist(result: dict) -> dict:
         "pricelist_tag": result.get("pricelist_tag"),
         "name": result.get("name"),
         "currency": result.get("currency"),
+        "active_version": result.get("active_version"),
     }
 
 
-async def process_pricelist_rate(storage: StorageService, pricelist_rate: dict) -> dict:
+async def process_pricelist_rate(
+    storage: StorageService, pricelist_rate: dict, loaders: Optional[Loaders] = None
+) -> dict:
     pricelist_rate = pricelist_rate.copy()
+    loaders = loaders or Loaders(storage)
     #
     if pricelist_rate.get("pricelist_id") or pricelist_rate.get("pricelist_tag"):
-        pricelist = await get(
-            storage,
-            id=pricelist_rate.get("pricelist_id"),
-            tenant=pricelist_rate.get("tenant"),
-            pricelist_tag=pricelist_rate.get("pricelist_tag"),
-        )
+        if pricelist_rate.get("pricelist_id") is not None:
+            result = await loaders.get("pricelists", "_id").load(
+                (pricelist_rate["pricelist_id"],)
+            )
+            if result is not None:
+                loaders.get("pricelists", "tenant", "pricelist_tag").prime(
+                    (result.get("tenant"), result.get("pricelist_tag")), result
+                )
+        else:
+            result = await loaders.get("pricelists", "tenant", "pricelist_tag").load(
+                (pricelist_rate.get("tenant"), pricelist_rate.get("pricelist_tag"))
+            )
+        pricelist = serialize_pricelist(result) if result is not None else None
         if pricelist is None:
             raise ValueError(
                 "Price list with id = %s and tag = %s not found in tenant %s!"
@@ -42,14 +87,23 @@ async def process_pricelist_rate(storage: StorageService, pricelist_rate: dict)
         pricelist_rate["tenant"] = pricelist["tenant"]
         pricelist_rate["pricelist_id"] = pricelist["id"]
         pricelist_rate["pricelist_tag"] = pricelist["pricelist_tag"]
+        if pricelist_rate.get("version") is None:
+            pricelist_rate["version"] = pricelist["active_version"]
     #
     if pricelist_rate.get("carrier_id") or pricelist_rate.get("carrier_tag"):
-        carrier = await carrier_service.get(
-            storage,
-            id=pricelist_rate.get("carrier_id"),
-            tenant=pricelist_rate.get("tenant"),
-            carrier_tag=pricelist_rate.get("carrier_tag"),
-        )
+        if pricelist_rate.get("carrier_id") is not None:
+            result = await loaders.get("carriers", "_id").load(
+                (pricelist_rate["carrier_id"],)
+            )
+            if result is not None:
+                loaders.get("carriers", "tenant", "carrier_tag").prime(
+                    (result.get("tenant"), result.get("carrier_tag")), result
+                )
+        else:
+            result = await loaders.get("carriers", "tenant", "carrier_tag").load(
+                (pricelist_rate.get("tenant"), pricelist_rate.get("carrier_tag"))
+            )
+        carrier = carrier_service.serialize(result) if result is not None else None
         if carrier is None:
             raise ValueError(
                 "Carrier with id = %s and tag = %s not found in tenant %s!"
@@ -65,9 +119,9 @@ async def process_pricelist_rate(storage: StorageService, pricelist_rate: dict)
 
 
 async def serialize_pricelist_rate(
-    storage: StorageService, pricelist_rate: dict
+    storage: StorageService, pricelist_rate: dict, loaders: Optional[Loaders] = None
 ) -> dict:
-    pricelist_rate = await process_pricelist_rate(storage, pricelist_rate)
+    pricelist_rate = await process_pricelist_rate(storage, pricelist_rate, loaders)
     return {
         "id": pricelist_rate.get("_id"),
         "tenant": pricelist_rate.get("tenant"),
@@ -86,6 +140,7 @@ async def serialize_pricelist_rate(
         "rate_increment": pricelist_rate.get("rate_increment"),
         "interval_start": pricelist_rate.get("interval_start"),
         "description": pricelist_rate.get("description"),
+        "version": pricelist_rate.get("version"),
     }
 
 
@@ -95,13 +150,14 @@ async def get(
     tenant: Optional[str] = None,
     pricelist_tag: Optional[str] = None,
     role="R",
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
         params = {"_id": id}
     else:
         params = {"tenant": tenant, "pricelist_tag": pricelist_tag}
-    result = await storage.db["pricelists"].find_one(params)
+    result = await storage.find_one("pricelists", params, projection)
     return serialize_pricelist(result) if result is not None else None
 
 
@@ -109,19 +165,7 @@ async def get_query(storage: StorageService, filter: Optional[dict] = None) -> d
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {"tenant": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {
-                        "pricelist_tag": re.compile(
-                            re.escape(filter["q"]), re.IGNORECASE
-                        )
-                    },
-                    {"name": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     elif filter.get("ids"):
@@ -140,18 +184,66 @@ async def get_all(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     query = await get_query(storage, filter)
-    result = storage.db["pricelists"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["pricelists"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    pricelists = list(
-        serialize_pricelist(pricelist)
-        for pricelist in await result.skip(page * perPage).limit(perPage).to_list(None)
+    return [
+        dict(
+            serialize_pricelist(pricelist),
+            cursor=pagination.encode_cursor(pricelist, sortField),
+        )
+        for pricelist in result
+    ]
+
+
+async def get_all_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    query = await get_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["pricelists"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
     )
-    return pricelists
+    return {
+        "rows": [
+            dict(
+                serialize_pricelist(pricelist),
+                cursor=pagination.encode_cursor(pricelist, sortField),
+            )
+            for pricelist in result
+        ],
+        "count": count,
+    }
 
 
 async def get_all_meta(
@@ -177,6 +269,7 @@ async def upsert(storage: StorageService, pricelist: dict) -> Optional[dict]:
         },
         {
             "$setOnInsert": {"_id": pricelist.get("id") or str(uuid4())},
+            "$currentDate": {"updated_at": True},
             "$set": storage.filter_dict(
                 {
                     "tenant": pricelist["tenant"],
@@ -186,13 +279,20 @@ async def upsert(storage: StorageService, pricelist: dict) -> Optional[dict]:
                     "active": bool(pricelist.get("active"))
                     if pricelist.get("active") is not None
                     else None,
+                    "search_keys": search.get_complete_search_keys(
+                        pricelist, PRICELIST_SEARCH_FIELDS
+                    ),
                 }
             ),
         },
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return serialize_pricelist(result) if result is not None else None
+    result = await search.update_search_keys(
+        storage.db["pricelists"], result, PRICELIST_SEARCH_FIELDS
+    )
+    storage.invalidate("pricelists", result["_id"], result)
+    return serialize_pricelist(result)
 
 
 async def delete(
@@ -206,9 +306,212 @@ async def delete(
     )
     if pricelist is not None:
         await storage.db["pricelists"].delete_one({"_id": pricelist["id"]})
+        await storage.record_delete("pricelists", pricelist["id"], pricelist)
+        storage.invalidate("pricelists", pricelist["id"], pricelist)
     return pricelist
 
 
+async def get_active_version(
+    storage: StorageService, tenant: Optional[str], pricelist_tag: Optional[str]
+) -> Optional[str]:
+    result = await storage.find_one(
+        "pricelists", {"tenant": tenant, "pricelist_tag": pricelist_tag}
+    )
+    return result.get("active_version") if result is not None else None
+
+
+async def get_versions_query(
+    storage: StorageService,
+    tenant: Optional[str],
+    pricelist_tags: Optional[List[str]] = None,
+) -> dict:
+    """
+    Return the filter matching only the rates of the active version of the
+    price lists, or of all the price lists of the tenant when no tags are
+    given; the rates of the price lists never switched have no version.
+    """
+    if pricelist_tags:
+        pricelists = await asyncio.gather(
+            *[
+                storage.find_one(
+                    "pricelists", {"tenant": tenant, "pricelist_tag": pricelist_tag}
+                )
+                for pricelist_tag in pricelist_tags
+            ]
+        )
+    else:
+        pricelists = (
+            await storage.db["pricelists"]
+            .find(
+                storage.filter_dict(
+                    {"tenant": tenant, "active_version": {"$ne": None}}
+                ),
+                {"tenant": 1, "pricelist_tag": 1, "active_version": 1},
+            )
+            .to_list(None)
+        )
+    versioned = [
+        pricelist
+        for pricelist in pricelists
+        if pricelist is not None and pricelist.get("active_version") is not None
+    ]
+    if not versioned:
+        return {"version": None}
+    return {
+        "$or": [
+            {
+                "version": None,
+                "$nor": [
+                    {
+                        "tenant": pricelist["tenant"],
+                        "pricelist_tag": pricelist["pricelist_tag"],
+                    }
+                    for pricelist in versioned
+                ],
+            }
+        ]
+        + [
+            {
+                "tenant": pricelist["tenant"],
+                "pricelist_tag": pricelist["pricelist_tag"],
+                "version": pricelist["active_version"],
+            }
+            for pricelist in versioned
+        ]
+    }
+
+
+async def activate_version(
+    storage: StorageService, tenant: str, pricelist_tag: str, version: str
+) -> Optional[dict]:
+    """
+    Switch the rate lookups of the price list to the rates loaded with the
+    given version, with a single update of the price list; the previously
+    active version is retired, and the rates of the versions retired before
+    the last RETAINED_VERSIONS are deleted in the background.
+    """
+    count = await storage.db["pricelist_rates"].count_documents(
+        {"tenant": tenant, "pricelist_tag": pricelist_tag, "version": version},
+        limit=1,
+    )
+    if not count:
+        raise ValueError(
+            "Version %s of the price list %s has no rates in tenant %s!"
+            % (version, pricelist_tag, tenant)
+        )
+    retired_versions = {"$ifNull": ["$retired_versions", []]}
+    result = await storage.db["pricelists"].find_one_and_update(
+        {
+            "tenant": tenant,
+            "pricelist_tag": pricelist_tag,
+            "deleting_versions": {"$ne": version},
+        },
+        [
+            {
+                "$set": {
+                    "active_version": version,
+                    "retired_versions": {
+                        "$cond": [
+                            {"$eq": [{"$ifNull": ["$active_version", None]}, version]},
+                            retired_versions,
+                            {
+                                "$concatArrays": [
+                                    {
+                                        "$filter": {
+                                            "input": retired_versions,
+                                            "cond": {"$ne": ["$$this", version]},
+                                        }
+                                    },
+                                    [{"$ifNull": ["$active_version", None]}],
+                                ]
+                            },
+                        ]
+                    },
+                }
+            },
+            {"$set": {"updated_at": "$$NOW"}},
+        ],
+        return_document=ReturnDocument.AFTER,
+    )
+    if result is None:
+        if await storage.db["pricelists"].count_documents(
+            {
+                "tenant": tenant,
+                "pricelist_tag": pricelist_tag,
+                "deleting_versions": version,
+            },
+            limit=1,
+        ):
+            raise ValueError(
+                "Version %s of the price list %s is being deleted in tenant %s!"
+                % (version, pricelist_tag, tenant)
+            )
+        return None
+    storage.invalidate("pricelists", result["_id"], result)
+    if storage.rate_index is not None:
+        storage.rate_index.invalidate(tenant, pricelist_tag)
+    expired_versions = result["retired_versions"][:-RETAINED_VERSIONS]
+    if expired_versions:
+        storage.run_in_background(
+            delete_versions(storage, tenant, pricelist_tag, expired_versions),
+            "Deleting the versions %s of the price list %s in tenant %s"
+            % (expired_versions, pricelist_tag, tenant),
+        )
+    return serialize_pricelist(result)
+
+
+async def delete_versions(
+    storage: StorageService,
+    tenant: str,
+    pricelist_tag: str,
+    versions: List[Optional[str]],
+) -> int:
+    """
+    Delete the rates of the versions of the price list which are not active,
+    returning the number of deleted rates; the versions are marked as being
+    deleted first, so that they cannot be activated in the meantime.
+    """
+    pricelist = await storage.db["pricelists"].find_one(
+        {"tenant": tenant, "pricelist_tag": pricelist_tag},
+        {"active_version": 1},
+    )
+    if pricelist is None:
+        return 0
+    versions = [
+        version for version in versions if version != pricelist.get("active_version")
+    ]
+    if not versions:
+        return 0
+    result = await storage.db["pricelists"].update_one(
+        {
+            "tenant": tenant,
+            "pricelist_tag": pricelist_tag,
+            "active_version": {"$nin": versions},
+        },
+        {
+            "$pullAll": {"retired_versions": versions},
+            "$addToSet": {"deleting_versions": {"$each": versions}},
+        },
+    )
+    if not result.matched_count:
+        # activated in the meantime
+        return await delete_versions(storage, tenant, pricelist_tag, versions)
+    try:
+        result = await storage.db["pricelist_rates"].delete_many(
+            {
+                "tenant": tenant,
+                "pricelist_tag": pricelist_tag,
+                "version": {"$in": versions},
+            }
+        )
+    finally:
+        await storage.db["pricelists"].update_one(
+            {"tenant": tenant, "pricelist_tag": pricelist_tag},
+            {"$pullAll": {"deleting_versions": versions}},
+        )
+    return result.deleted_count
+
+
 async def get_rate(
     storage: StorageService,
     id: Optional[str] = None,
@@ -216,7 +519,9 @@ async def get_rate(
     pricelist_tag: Optional[str] = None,
     carrier_tag: Optional[str] = None,
     prefix: Optional[str] = None,
+    version: Optional[str] = None,
     role="R",
+    loaders: Optional[Loaders] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
@@ -227,10 +532,15 @@ async def get_rate(
             "pricelist_tag": pricelist_tag,
             "carrier_tag": carrier_tag,
             "prefix": prefix,
+            "version": version
+            if version is not None
+            else await get_active_version(storage, tenant, pricelist_tag),
         }
     result = await storage.db["pricelist_rates"].find_one(params)
     return (
-        await serialize_pricelist_rate(storage, result) if result is not None else None
+        await serialize_pricelist_rate(storage, result, loaders)
+        if result is not None
+        else None
     )
 
 
@@ -240,19 +550,7 @@ async def get_rates_query(
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {
-                        "pricelist_tag": re.compile(
-                            re.escape(filter["q"]), re.IGNORECASE
-                        )
-                    },
-                    {"prefix": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"description": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     if filter.get("ids"):
@@ -277,6 +575,8 @@ async def get_rates_query(
         filters_and.append({"prefix": filter["prefix"]})
     if filter.get("active"):
         filters_and.append({"active": filter["active"]})
+    if filter.get("version"):
+        filters_and.append({"version": filter["version"]})
     return {"$and": filters_and} if filters_and else {}
 
 
@@ -287,20 +587,78 @@ async def get_all_rates(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    loaders: Optional[Loaders] = None,
 ) -> List[dict]:
     query = await get_rates_query(storage, filter)
-    result = storage.db["pricelist_rates"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "pricelist_rate_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["pricelist_rates"],
+        query,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    pricelist_rates = [
-        await serialize_pricelist_rate(storage, pricelist_rate)
-        for pricelist_rate in await result.skip(page * perPage)
-        .limit(perPage)
-        .to_list(None)
+    loaders = loaders or Loaders(storage)
+    pricelist_rates = await asyncio.gather(
+        *[
+            serialize_pricelist_rate(storage, pricelist_rate, loaders)
+            for pricelist_rate in result
+        ]
+    )
+    return [
+        dict(
+            pricelist_rate,
+            cursor=pagination.encode_cursor(document, sortField),
+        )
+        for pricelist_rate, document in zip(pricelist_rates, result)
     ]
-    return pricelist_rates
+
+
+async def get_all_rates_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+    loaders: Optional[Loaders] = None,
+) -> dict:
+    query = await get_rates_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["pricelist_rates"],
+        query,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
+    )
+    loaders = loaders or Loaders(storage)
+    pricelist_rates = await asyncio.gather(
+        *[
+            serialize_pricelist_rate(storage, pricelist_rate, loaders)
+            for pricelist_rate in result
+        ]
+    )
+    return {
+        "rows": [
+            dict(
+                pricelist_rate,
+                cursor=pagination.encode_cursor(document, sortField),
+            )
+            for pricelist_rate, document in zip(pricelist_rates, result)
+        ],
+        "count": count,
+    }
 
 
 async def get_all_rates_meta(
@@ -316,9 +674,8 @@ async def get_all_rates_meta(
     return {"count": result}
 
 
-async def upsert_rate(storage: StorageService, pricelist_rate: dict) -> Optional[dict]:
-    pricelist_rate = await process_pricelist_rate(storage, pricelist_rate)
-    result = await storage.db["pricelist_rates"].find_one_and_update(
+def get_rate_upsert_query(pricelist_rate: dict) -> dict:
+    return (
         {"_id": pricelist_rate.get("id")}
         if pricelist_rate.get("id")
         else {
@@ -326,34 +683,155 @@ async def upsert_rate(storage: StorageService, pricelist_rate: dict) -> Optional
             "pricelist_tag": pricelist_rate.get("pricelist_tag"),
             "carrier_tag": pricelist_rate.get("carrier_tag"),
             "prefix": pricelist_rate.get("prefix"),
-        },
-        {
-            "$setOnInsert": {"_id": pricelist_rate.get("id") or str(uuid4())},
-            "$set": storage.filter_dict(
-                {
-                    "tenant": pricelist_rate.get("tenant"),
-                    "pricelist_tag": pricelist_rate.get("pricelist_tag"),
-                    "carrier_tag": pricelist_rate.get("carrier_tag"),
-                    "prefix": pricelist_rate.get("prefix"),
-                    "datetime_start": pricelist_rate.get("datetime_start"),
-                    "datetime_end": pricelist_rate.get("datetime_end"),
-                    "active": bool(pricelist_rate.get("active"))
-                    if pricelist_rate.get("active") is not None
-                    else None,
-                    "connect_fee": pricelist_rate.get("connect_fee"),
-                    "rate": pricelist_rate.get("rate"),
-                    "rate_increment": pricelist_rate.get("rate_increment"),
-                    "interval_start": pricelist_rate.get("interval_start"),
-                    "description": pricelist_rate.get("description"),
-                }
-            ),
-        },
+            "version": pricelist_rate.get("version"),
+        }
+    )
+
+
+def get_rate_upsert_update(storage: StorageService, pricelist_rate: dict) -> dict:
+    return {
+        "$setOnInsert": {"_id": pricelist_rate.get("id") or str(uuid4())},
+        "$currentDate": {"updated_at": True},
+        "$set": storage.filter_dict(
+            {
+                "tenant": pricelist_rate.get("tenant"),
+                "pricelist_tag": pricelist_rate.get("pricelist_tag"),
+                "carrier_tag": pricelist_rate.get("carrier_tag"),
+                "prefix": pricelist_rate.get("prefix"),
+                "datetime_start": pricelist_rate.get("datetime_start"),
+                "datetime_end": pricelist_rate.get("datetime_end"),
+                "active": bool(pricelist_rate.get("active"))
+                if pricelist_rate.get("active") is not None
+                else None,
+                "connect_fee": pricelist_rate.get("connect_fee"),
+                "rate": pricelist_rate.get("rate"),
+                "rate_increment": pricelist_rate.get("rate_increment"),
+                "interval_start": pricelist_rate.get("interval_start"),
+                "description": pricelist_rate.get("description"),
+                "version": pricelist_rate.get("version"),
+                "search_keys": search.get_complete_search_keys(
+                    pricelist_rate, PRICELIST_RATE_SEARCH_FIELDS
+                ),
+            }
+        ),
+    }
+
+
+async def upsert_rate(
+    storage: StorageService, pricelist_rate: dict, loaders: Optional[Loaders] = None
+) -> Optional[dict]:
+    loaders = loaders or Loaders(storage)
+    pricelist_rate = await process_pricelist_rate(storage, pricelist_rate, loaders)
+    previous = None
+    if storage.rate_cache is not None and pricelist_rate.get("id"):
+        # the update may move the rate to another prefix
+        previous = await storage.db["pricelist_rates"].find_one(
+            {"_id": pricelist_rate["id"]}, PRICELIST_RATE_PROJECTION
+        )
+    result = await storage.db["pricelist_rates"].find_one_and_update(
+        get_rate_upsert_query(pricelist_rate),
+        get_rate_upsert_update(storage, pricelist_rate),
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
+    result = await search.update_search_keys(
+        storage.db["pricelist_rates"], result, PRICELIST_RATE_SEARCH_FIELDS
+    )
+    if result is not None and storage.rate_index is not None:
+        storage.rate_index.update(result)
+    if previous is not None:
+        storage.invalidate("pricelist_rates", previous["_id"], previous)
+    if result is not None:
+        storage.invalidate("pricelist_rates", result["_id"], result)
     return (
-        await serialize_pricelist_rate(storage, result) if result is not None else None
+        await serialize_pricelist_rate(storage, result, loaders)
+        if result is not None
+        else None
+    )
+
+
+async def upsert_rates(
+    storage: StorageService,
+    pricelist_rates: List[dict],
+    loaders: Optional[Loaders] = None,
+) -> List[Optional[str]]:
+    """
+    Validate and upsert a batch of rates, identified by their tenant, price
+    list, carrier and prefix, with an unordered bulk write, returning the
+    error of each rate or None if it was saved. Reuse the loaders across
+    batches to look up each price list and carrier once.
+    """
+    loaders = loaders or Loaders(storage)
+    pricelists = await loaders.get("pricelists", "tenant", "pricelist_tag").load_many(
+        [
+            (pricelist_rate.get("tenant"), pricelist_rate.get("pricelist_tag"))
+            for pricelist_rate in pricelist_rates
+        ]
+    )
+    carriers = await loaders.get("carriers", "tenant", "carrier_tag").load_many(
+        [
+            (pricelist_rate.get("tenant"), pricelist_rate.get("carrier_tag"))
+            for pricelist_rate in pricelist_rates
+        ]
     )
+    pricelist_rates = [
+        dict(pricelist_rate, version=pricelist.get("active_version"))
+        if pricelist is not None and pricelist_rate.get("version") is None
+        else pricelist_rate
+        for pricelist_rate, pricelist in zip(pricelist_rates, pricelists)
+    ]
+    errors: List[Optional[str]] = []
+    requests = []
+    indexes = []
+    for index, (pricelist_rate, pricelist, carrier) in enumerate(
+        zip(pricelist_rates, pricelists, carriers)
+    ):
+        error = None
+        if not pricelist_rate.get("prefix"):
+            error = "Provide the prefix!"
+        elif pricelist is None:
+            error = "Price list with tag = %s not found in tenant %s!" % (
+                pricelist_rate.get("pricelist_tag"),
+                pricelist_rate.get("tenant"),
+            )
+        elif carrier is None:
+            error = "Carrier with tag = %s not found in tenant %s!" % (
+                pricelist_rate.get("carrier_tag"),
+                pricelist_rate.get("tenant"),
+            )
+        else:
+            requests.append(
+                UpdateOne(
+                    get_rate_upsert_query(pricelist_rate),
+                    get_rate_upsert_update(storage, pricelist_rate),
+                    upsert=True,
+                )
+            )
+            indexes.append(index)
+        errors.append(error)
+    if requests:
+        try:
+            await storage.db["pricelist_rates"].bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                errors[indexes[write_error["index"]]] = write_error["errmsg"]
+    # the rates staged in another version do not affect the lookups
+    active_rates = [
+        pricelist_rate
+        for pricelist_rate, pricelist, error in zip(pricelist_rates, pricelists, errors)
+        if error is None
+        and pricelist_rate.get("version") == pricelist.get("active_version")
+    ]
+    for pricelist_rate in active_rates:
+        storage.invalidate("pricelist_rates", None, pricelist_rate)
+    if storage.rate_index is not None:
+        for tenant, pricelist_tag in {
+            (pricelist_rate.get("tenant"), pricelist_rate.get("pricelist_tag"))
+            for pricelist_rate in active_rates
+        }:
+            # reloaded on the next lookup
+            storage.rate_index.invalidate(tenant, pricelist_tag)
+    return errors
 
 
 async def delete_rate(
@@ -363,6 +841,7 @@ async def delete_rate(
     pricelist_tag: Optional[str] = None,
     carrier_tag: Optional[str] = None,
     prefix: Optional[str] = None,
+    loaders: Optional[Loaders] = None,
 ) -> Optional[dict]:
     pricelist_rate = await get_rate(
         storage,
@@ -372,9 +851,33 @@ async def delete_rate(
         carrier_tag=carrier_tag,
         prefix=prefix,
         role="W",
+        loaders=loaders,
     )
     if pricelist_rate is not None:
         await storage.db["pricelist_rates"].delete_one({"_id": pricelist_rate["id"]})
+        await storage.record_delete(
+            "pricelist_rates", pricelist_rate["id"], pricelist_rate
+        )
+        if storage.rate_index is not None:
+            storage.rate_index.remove(
+                {
+                    "_id": pricelist_rate["id"],
+                    "tenant": pricelist_rate["tenant"],
+                    "pricelist_tag": pricelist_rate["pricelist_tag"],
+                    "carrier_tag": pricelist_rate["carrier_tag"],
+                    "prefix": pricelist_rate["prefix"],
+                }
+            )
+        storage.invalidate(
+            "pricelist_rates",
+            pricelist_rate["id"],
+            {
+                "tenant": pricelist_rate["tenant"],
+                "pricelist_tag": pricelist_rate["pricelist_tag"],
+                "carrier_tag": pricelist_rate["carrier_tag"],
+                "prefix": pricelist_rate["prefix"],
+            },
+        )
     return pricelist_rate
 
 
@@ -385,29 +888,208 @@ async def get_rate_by_destination(
     carrier_tags: List[str] = None,
     carrier_tags_override: List[str] = None,
     destination: Optional[str] = None,
+    loaders: Optional[Loaders] = None,
 ) -> Optional[dict]:
     destination = destination if destination is not None else ""
+    cache = storage.rate_cache
+    if cache is None:
+        result = await find_rate_by_destination(
+            storage, tenant, pricelist_tags, carrier_tags, destination
+        )
+    else:
+        key = rate_cache.get_key(tenant, pricelist_tags, carrier_tags, destination)
+        result = cache.get(key)
+        if result is rate_cache.NOT_FOUND:
+            version = cache.version
+            result = await find_rate_by_destination(
+                storage, tenant, pricelist_tags, carrier_tags, destination
+            )
+            cache.set(key, result, version)
+    return (
+        await serialize_pricelist_rate(storage, result, loaders)
+        if result is not None
+        else None
+    )
+
+
+async def find_rate_by_destination(
+    storage: StorageService,
+    tenant: Optional[str],
+    pricelist_tags: Optional[List[str]],
+    carrier_tags: Optional[List[str]],
+    destination: str,
+) -> Optional[dict]:
+    if storage.rate_table is not None and tenant is not None and pricelist_tags:
+        result = storage.rate_table.lookup(
+            tenant,
+            pricelist_tags,
+            carrier_tags,
+            destination,
+            max_length=min(9, len(destination) - 1),
+        )
+        if result is not rate_table.NOT_LOADED:
+            return result
+    if storage.rate_index is not None and pricelist_tags:
+        return await storage.rate_index.lookup(
+            storage,
+            tenant=tenant,
+            pricelist_tags=pricelist_tags,
+            carrier_tags=carrier_tags,
+            destination=destination,
+            max_length=min(9, len(destination) - 1),
+        )
     prefixes = [destination[:i] for i in range(1, min(10, len(destination)))]
-    results = (
-        await storage.db["pricelist_rates"]
-        .find(
-            storage.filter_dict(
+    versions_query = await get_versions_query(storage, tenant, pricelist_tags)
+    results = await (
+        storage.db["pricelist_rates"]
+        .aggregate(
+            [
                 {
-                    "tenant": tenant,
-                    "pricelist_tag": {"$in": pricelist_tags}
-                    if pricelist_tags
-                    else None,
-                    "carrier_tag": {"$in": carrier_tags} if carrier_tags else None,
-                    "prefix": {"$in": prefixes},
-                    "active": True,
-                }
+                    "$match": dict(
+                        storage.filter_dict(
+                            {
+                                "tenant": tenant,
+                                "pricelist_tag": {"$in": pricelist_tags}
+                                if pricelist_tags
+                                else None,
+                                "carrier_tag": {"$in": carrier_tags}
+                                if carrier_tags
+                                else None,
+                                "prefix": {"$in": prefixes},
+                                "active": True,
+                            }
+                        ),
+                        **versions_query,
+                    )
+                },
+                {"$addFields": {"prefix_length": {"$strLenCP": "$prefix"}}},
+                {"$sort": {"prefix_length": DESCENDING}},
+                {"$limit": 1},
+                {"$project": PRICELIST_RATE_PROJECTION},
+            ]
+        )
+        .to_list(1)
+    )
+    return results[0] if results else None
+
+
+async def find_rates_by_destinations(
+    storage: StorageService,
+    tenant: Optional[str],
+    pricelist_tags: Optional[List[str]],
+    carrier_tags: Optional[List[str]],
+    destinations: List[str],
+) -> Dict[str, Optional[dict]]:
+    """
+    Return the rate of each destination, as find_rate_by_destination does:
+    the rates of the candidate prefixes of DESTINATIONS_BATCH_SIZE
+    destinations are fetched with a single query and the longest prefix of
+    each destination is matched in memory. The compiled rate table or the
+    rate index answer instead, when they are enabled and loaded.
+    """
+    results: Dict[str, Optional[dict]] = {}
+    destinations = list(dict.fromkeys(destinations))
+    if storage.rate_table is not None and tenant is not None and pricelist_tags:
+        for destination in destinations:
+            result = storage.rate_table.lookup(
+                tenant,
+                pricelist_tags,
+                carrier_tags,
+                destination,
+                max_length=min(9, len(destination) - 1),
+            )
+            if result is rate_table.NOT_LOADED:
+                break
+            results[destination] = result
+        else:
+            return results
+    if storage.rate_index is not None and pricelist_tags:
+        for destination in destinations:
+            results[destination] = await storage.rate_index.lookup(
+                storage,
+                tenant=tenant,
+                pricelist_tags=pricelist_tags,
+                carrier_tags=carrier_tags,
+                destination=destination,
+                max_length=min(9, len(destination) - 1),
             )
+        return results
+    versions_query = await get_versions_query(storage, tenant, pricelist_tags)
+    while destinations:
+        batch = destinations[:DESTINATIONS_BATCH_SIZE]
+        destinations = destinations[DESTINATIONS_BATCH_SIZE:]
+        prefixes = {
+            destination[:length]
+            for destination in batch
+            for length in range(1, min(10, len(destination)))
+        }
+        rates: Dict[str, dict] = {}
+        if prefixes:
+            async for rate in storage.db["pricelist_rates"].find(
+                dict(
+                    storage.filter_dict(
+                        {
+                            "tenant": tenant,
+                            "pricelist_tag": {"$in": pricelist_tags}
+                            if pricelist_tags
+                            else None,
+                            "carrier_tag": {"$in": carrier_tags}
+                            if carrier_tags
+                            else None,
+                            "prefix": {"$in": sorted(prefixes)},
+                            "active": True,
+                        }
+                    ),
+                    **versions_query,
+                ),
+                PRICELIST_RATE_PROJECTION,
+            ):
+                rates.setdefault(rate["prefix"], rate)
+        for destination in batch:
+            results[destination] = next(
+                (
+                    rates[destination[:length]]
+                    for length in range(min(9, len(destination) - 1), 0, -1)
+                    if destination[:length] in rates
+                ),
+                None,
+            )
+    return results
+
+
+async def get_rates_by_destinations(
+    storage: StorageService,
+    tenant: Optional[str] = None,
+    pricelist_tags: List[str] = None,
+    carrier_tags: List[str] = None,
+    destinations: List[str] = None,
+    loaders: Optional[Loaders] = None,
+) -> List[dict]:
+    """
+    Return the destination and its rate, or None, for each destination.
+    """
+    destinations = [destination or "" for destination in destinations or []]
+    if len(destinations) > MAX_DESTINATIONS:
+        raise ValueError(
+            "Too many destinations, at most %d can be rated at once!" % MAX_DESTINATIONS
         )
-        .to_list(None)
+    rates = await find_rates_by_destinations(
+        storage, tenant, pricelist_tags, carrier_tags, destinations
     )
-    results = list(results)
-    results.sort(key=lambda x: len(x["prefix"]), reverse=True)
-    return await serialize_pricelist_rate(storage, results[0]) if len(results) else None
+    results = await asyncio.gather(
+        *[
+            serialize_pricelist_rate(storage, rate, loaders)
+            for rate in rates.values()
+            if rate is not None
+        ]
+    )
+    serialized = dict(
+        zip([key for key, rate in rates.items() if rate is not None], results)
+    )
+    return [
+        {"destination": destination, "rate": serialized.get(destination)}
+        for destination in destinations
+    ]
 
 
 async def get_least_cost_routing(
@@ -416,26 +1098,31 @@ async def get_least_cost_routing(
     carrier_tags: List[str] = None,
     carrier_tags_override: List[str] = None,
     destination: Optional[str] = None,
+    loaders: Optional[Loaders] = None,
 ) -> List[dict]:
     destination = destination if destination is not None else ""
     prefixes = [destination[:i] for i in range(1, min(10, len(destination)))]
     params = {"tenant": tenant, "prefix": {"$in": prefixes}, "active": True}
     if carrier_tags is not None:
         params["carrier_tag"] = {"$in": carrier_tags}
-    results = (
-        await storage.db["pricelist_rates"]
-        .find(storage.filter_dict(params))
-        .to_list(None)
-    )
-    results.sort(key=itemgetter("rate"))
-    return list(
-        filter(
-            None,
+    results = await (
+        storage.db["pricelist_rates"]
+        .aggregate(
             [
-                await carrier_service.get(
-                    storage, tenant=tenant, carrier_tag=result["carrier_tag"]
-                )
-                for result in results
-            ],
+                {
+                    "$match": dict(
+                        storage.filter_dict(params),
+                        **await get_versions_query(storage, tenant),
+                    )
+                },
+                {"$sort": {"rate": ASCENDING}},
+                {"$project": {"_id": 0, "carrier_tag": 1}},
+            ]
         )
+        .to_list(None)
+    )
+    loaders = loaders or Loaders(storage)
+    carriers = await loaders.get("carriers", "tenant", "carrier_tag").load_many(
+        [(tenant, result["carrier_tag"]) for result in results]
     )
+    return [carrier_service.serialize(carrier) for carrier in carriers if carrier]
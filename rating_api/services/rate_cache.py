@@ -0,0 +1,143 @@
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+MAX_PREFIX_LENGTH = 9
+
+NOT_FOUND = object()
+
+
+def get_key(
+    tenant: Optional[str],
+    pricelist_tags: Optional[List[str]],
+    carrier_tags: Optional[List[str]],
+    destination: str,
+) -> tuple:
+    """
+    Return the cache key of a destination rate lookup: only the digits of the
+    destination which can match a rate prefix are part of the key.
+    """
+    return (
+        tenant,
+        tuple(pricelist_tags or ()),
+        tuple(carrier_tags or ()),
+        destination[: min(MAX_PREFIX_LENGTH, len(destination) - 1)],
+    )
+
+
+class RateCache(object):
+    """
+    RateCache is a bounded LRU cache of the results of the destination rate
+    lookups, including the destinations without a rate. A change to a rate
+    only evicts the entries whose destination prefix starts with its prefix
+    in the same tenant, price list and carrier; a change to a price list
+    evicts all its entries, a change without a price list all the entries of
+    the tenant.
+    """
+
+    name = "rates"
+
+    def __init__(self, max_entries: int = 100000, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+        # (tenant, prefix) -> keys whose destination prefix starts with prefix
+        self._prefixes: Dict[Tuple[Optional[str], str], Set[tuple]] = {}
+
+    def get(self, key: tuple) -> Any:
+        """
+        Return the cached rate, None when the destination has no rate, or
+        NOT_FOUND when the lookup is not cached.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return NOT_FOUND
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: tuple, rate: Optional[dict], version: int):
+        """
+        Cache the result of a lookup started at the given version: it is
+        discarded if a rate changed while the lookup was running.
+        """
+        if version != self.version:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, rate)
+        tenant, _, _, prefix = key
+        for i in range(1, len(prefix) + 1):
+            self._prefixes.setdefault((tenant, prefix[:i]), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(
+        self, collection: str, id: Optional[Any] = None, document: dict = None
+    ):
+        if collection not in ("pricelist_rates", "pricelists"):
+            return
+        self.version += 1
+        if collection == "pricelists" and document is not None:
+            # the active version of the price list may have changed
+            for key in list(self._entries.keys()):
+                tenant, pricelist_tags, _, _ = key
+                if tenant in (document.get("tenant"), None) and (
+                    not pricelist_tags
+                    or not document.get("pricelist_tag")
+                    or document["pricelist_tag"] in pricelist_tags
+                ):
+                    self._remove(key)
+                    self.invalidations += 1
+            return
+        if document is None or not document.get("prefix"):
+            self.invalidations += len(self._entries)
+            self.clear()
+            return
+        tenant = document.get("tenant")
+        keys = self._prefixes.get((tenant, document["prefix"]), set()) | (
+            self._prefixes.get((None, document["prefix"]), set())
+        )
+        for key in keys:
+            _, pricelist_tags, carrier_tags, _ = key
+            if (
+                not pricelist_tags or document.get("pricelist_tag") in pricelist_tags
+            ) and (not carrier_tags or document.get("carrier_tag") in carrier_tags):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._prefixes.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+    def _remove(self, key: tuple):
+        if self._entries.pop(key, None) is None:
+            return
+        tenant, _, _, prefix = key
+        for i in range(1, len(prefix) + 1):
+            keys = self._prefixes.get((tenant, prefix[:i]))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._prefixes[(tenant, prefix[:i])]
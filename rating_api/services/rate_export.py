@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from . import pricelist as pricelist_service
+from .storage import StorageService
+
+# the cursor batch size, and the rows written to the response at once
+BATCH_SIZE = 5000
+
+CHUNK_SIZE = 1000
+
+FORMATS = ("csv", "ndjson")
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# the columns of the rate decks, which can be imported back
+FIELDS = (
+    "tenant",
+    "pricelist_tag",
+    "carrier_tag",
+    "prefix",
+    "datetime_start",
+    "datetime_end",
+    "active",
+    "connect_fee",
+    "rate",
+    "rate_increment",
+    "interval_start",
+    "description",
+)
+
+
+def format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def format_rows(rows: List[dict], format: str, header: bool = False) -> bytes:
+    if format == "ndjson":
+        return b"".join(
+            json.dumps(
+                {field: format_value(row.get(field)) for field in FIELDS}
+            ).encode("utf-8")
+            + b"\n"
+            for row in rows
+        )
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    if header:
+        writer.writerow(FIELDS)
+    for row in rows:
+        values = []
+        for field in FIELDS:
+            value = format_value(row.get(field))
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            values.append(value)
+        writer.writerow(values)
+    return output.getvalue().encode("utf-8")
+
+
+async def export_rates(
+    storage: StorageService, format: str = "csv", filter: Optional[dict] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yield the rates matching the filter as CSV, with a header row, or as
+    newline-delimited JSON, CHUNK_SIZE rows at a time while iterating over
+    a single cursor, so that the memory does not grow with the deck.
+    """
+    if format not in FORMATS:
+        raise ValueError("Unsupported format %s!" % format)
+    filter = filter or {}
+    query = await pricelist_service.get_rates_query(storage, filter)
+    if filter.get("version") is None:
+        # only the active versions, the rates of the other ones would
+        # replace them when imported back
+        tenant = filter.get("tenant")
+        pricelist_tags = None
+        if filter.get("pricelist_tag"):
+            pricelist_tags = [filter["pricelist_tag"]]
+        elif filter.get("pricelist_id"):
+            pricelist = await pricelist_service.get(storage, id=filter["pricelist_id"])
+            if pricelist is not None:
+                tenant = pricelist["tenant"]
+                pricelist_tags = [pricelist["pricelist_tag"]]
+        versions_query = await pricelist_service.get_versions_query(
+            storage, tenant, pricelist_tags
+        )
+        query = {"$and": [query, versions_query]} if query else versions_query
+    cursor = storage.db["pricelist_rates"].find(
+        query, dict({field: 1 for field in FIELDS}, _id=0), batch_size=BATCH_SIZE
+    )
+    rows: List[dict] = []
+    header = format == "csv"
+    async for row in cursor:
+        rows.append(row)
+        if len(rows) >= CHUNK_SIZE:
+            yield format_rows(rows, format, header)
+            rows, header = [], False
+    if rows or header:
+        yield format_rows(rows, format, header)
@@ -0,0 +1,108 @@
+import json
+
+from typing import AsyncIterator, Callable, List, Optional
+
+import aniso8601  # type: ignore
+
+from . import pipeline
+from . import pricelist as pricelist_service
+from .loader import Loaders
+from .storage import StorageService
+
+BATCH_SIZE = 5000
+
+FORMATS = ("csv", "ndjson")
+
+INT_FIELDS = ("connect_fee", "rate", "rate_increment", "interval_start")
+
+DATETIME_FIELDS = ("datetime_start", "datetime_end")
+
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+def parse_rate(
+    values: dict,
+    tenant: str,
+    pricelist_tag: Optional[str] = None,
+    carrier_tag: Optional[str] = None,
+    version: Optional[str] = None,
+) -> dict:
+    """
+    Return the rate of a row of the deck, converting the values of the CSV
+    cells; the price list, carrier and version default to the ones of the
+    deck.
+    """
+    rate = {key: value for key, value in values.items() if value not in (None, "")}
+    rate.setdefault("tenant", tenant)
+    if pricelist_tag is not None:
+        rate.setdefault("pricelist_tag", pricelist_tag)
+    if carrier_tag is not None:
+        rate.setdefault("carrier_tag", carrier_tag)
+    if version is not None:
+        rate.setdefault("version", version)
+    if rate.get("prefix") is not None:
+        rate["prefix"] = str(rate["prefix"])
+    for field in INT_FIELDS:
+        if rate.get(field) is not None:
+            try:
+                rate[field] = int(rate[field])
+            except (TypeError, ValueError):
+                raise ValueError("Invalid %s: %s" % (field, rate[field]))
+    for field in DATETIME_FIELDS:
+        if isinstance(rate.get(field), str):
+            rate[field] = aniso8601.parse_datetime(rate[field])
+    if isinstance(rate.get("active"), str):
+        rate["active"] = rate["active"].lower() in TRUE_VALUES
+    rate.setdefault("active", True)
+    return rate
+
+
+async def import_rates(
+    storage: StorageService,
+    lines: AsyncIterator[bytes],
+    format: str = "csv",
+    tenant: str = "default",
+    pricelist_tag: Optional[str] = None,
+    carrier_tag: Optional[str] = None,
+    version: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    error: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Upsert the rates of a deck streamed as CSV, with a header row, or as
+    newline-delimited JSON, in batches of BATCH_SIZE; each batch is written
+    while the next one is parsed. Return the count of the saved rates and
+    the errors of the rejected lines, see pipeline.import_records for
+    progress and error. The rates are loaded into the given version of
+    their price list, by default the active one.
+    """
+    if format not in FORMATS:
+        raise ValueError("Unsupported format %s!" % format)
+    loaders = Loaders(storage)
+    header: Optional[List[str]] = None
+
+    def parse_row(row: List[str]) -> Optional[dict]:
+        nonlocal header
+        if header is None:
+            header = [column.strip() for column in row]
+            return None
+        return parse_rate(
+            dict(zip(header, row)), tenant, pricelist_tag, carrier_tag, version
+        )
+
+    def parse_line(line: bytes) -> dict:
+        values = json.loads(line)
+        if not isinstance(values, dict):
+            raise ValueError("Expected a JSON object!")
+        return parse_rate(values, tenant, pricelist_tag, carrier_tag, version)
+
+    async def write(rates: List[dict]) -> List[Optional[str]]:
+        return await pricelist_service.upsert_rates(storage, rates, loaders)
+
+    if format == "csv":
+        return await pipeline.import_records(
+            pipeline.read_csv_rows(lines), parse_row, write, BATCH_SIZE, progress, error
+        )
+    return await pipeline.import_records(
+        pipeline.number_lines(lines), parse_line, write, BATCH_SIZE, progress, error
+    )
@@ -0,0 +1,142 @@
+import asyncio
+
+from typing import Dict, List, Optional, Tuple
+
+
+class PrefixTrie(object):
+    """
+    PrefixTrie stores the active rates of a version of a single price list,
+    indexed by prefix.
+    """
+
+    def __init__(self, version: Optional[str] = None):
+        self.root: dict = {}
+        self.version = version
+
+    def insert(self, rate: dict):
+        node = self.root
+        for digit in rate["prefix"]:
+            node = node.setdefault(digit, {})
+        node.setdefault(None, {})[rate.get("carrier_tag")] = rate
+
+    def remove(self, prefix: str, carrier_tag: Optional[str]):
+        node = self.root
+        for digit in prefix:
+            node = node.get(digit)
+            if node is None:
+                return
+        rates = node.get(None)
+        if rates is not None:
+            rates.pop(carrier_tag, None)
+
+    def lookup(
+        self, destination: str, max_length: int, carrier_tags: List[str] = None
+    ) -> Optional[dict]:
+        found = None
+        node = self.root
+        for digit in destination[:max_length]:
+            node = node.get(digit)
+            if node is None:
+                break
+            for carrier_tag, rate in (node.get(None) or {}).items():
+                if not carrier_tags or carrier_tag in carrier_tags:
+                    found = rate
+                    break
+        return found
+
+
+class RateIndex(object):
+    """
+    RateIndex keeps an in-process prefix trie for each (tenant, pricelist_tag),
+    loaded lazily from MongoDB and updated incrementally on rate changes.
+    """
+
+    def __init__(self):
+        self._tries: Dict[Tuple[str, str], PrefixTrie] = {}
+        self._rates: Dict[str, dict] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self._generation = 0
+
+    async def get_trie(self, storage, tenant: str, pricelist_tag: str) -> PrefixTrie:
+        key = (tenant, pricelist_tag)
+        trie = self._tries.get(key)
+        if trie is not None:
+            return trie
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            trie = self._tries.get(key)
+            if trie is None:
+                generation = self._generation
+                pricelist = await storage.find_one(
+                    "pricelists", {"tenant": tenant, "pricelist_tag": pricelist_tag}
+                )
+                trie = PrefixTrie(
+                    pricelist.get("active_version") if pricelist is not None else None
+                )
+                rates = {}
+                async for rate in storage.db["pricelist_rates"].find(
+                    {
+                        "tenant": tenant,
+                        "pricelist_tag": pricelist_tag,
+                        "version": trie.version,
+                        "active": True,
+                    }
+                ):
+                    trie.insert(rate)
+                    rates[rate["_id"]] = rate
+                # the price list switched version while loading
+                if generation == self._generation:
+                    self._tries[key] = trie
+                    self._rates.update(rates)
+        return trie
+
+    async def lookup(
+        self,
+        storage,
+        tenant: str,
+        pricelist_tags: List[str],
+        carrier_tags: List[str],
+        destination: str,
+        max_length: int,
+    ) -> Optional[dict]:
+        found = None
+        for pricelist_tag in pricelist_tags:
+            trie = await self.get_trie(storage, tenant, pricelist_tag)
+            rate = trie.lookup(destination, max_length, carrier_tags)
+            if rate is not None and (
+                found is None or len(rate["prefix"]) > len(found["prefix"])
+            ):
+                found = rate
+        return found
+
+    def update(self, rate: dict):
+        self.remove(rate)
+        trie = self._tries.get((rate.get("tenant"), rate.get("pricelist_tag")))
+        if (
+            trie is not None
+            and rate.get("active")
+            and rate.get("version") == trie.version
+        ):
+            trie.insert(rate)
+            self._rates[rate["_id"]] = rate
+
+    def remove(self, rate: dict):
+        previous = self._rates.pop(rate.get("_id"), None) or rate
+        if previous.get("prefix") is None:
+            return
+        trie = self._tries.get((previous.get("tenant"), previous.get("pricelist_tag")))
+        if trie is not None and previous.get("version") == trie.version:
+            trie.remove(previous["prefix"], previous.get("carrier_tag"))
+
+    def invalidate(
+        self, tenant: Optional[str] = None, pricelist_tag: Optional[str] = None
+    ):
+        self._generation += 1
+        for key in list(self._tries.keys()):
+            if (tenant is None or key[0] == tenant) and (
+                pricelist_tag is None or key[1] == pricelist_tag
+            ):
+                del self._tries[key]
+        for id, rate in list(self._rates.items()):
+            if (rate["tenant"], rate["pricelist_tag"]) not in self._tries:
+                del self._rates[id]
@@ -0,0 +1,457 @@
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from pymongo.errors import PyMongoError  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CRT1"
+
+# magic, number of records, offsets of the records, metadata and strings
+HEADER = struct.Struct(">4sIQQQ")
+
+# pricelist, prefix, carrier, connect_fee, rate, rate_increment,
+# interval_start, datetime_start, datetime_end, offset and length of the id
+# and of the description; records are sorted by the first two fields
+RECORD = struct.Struct(">H16sHqqqqqqIIII")
+
+KEY_SIZE = 18
+
+PREFIX_SIZE = 16
+
+NO_NAME = 0xFFFF
+
+NULL = -(2**63)
+
+NULL_STRING = 0xFFFFFFFF
+
+EPOCH = datetime(1970, 1, 1)
+
+NOT_LOADED = object()
+
+
+def get_path(directory: str, tenant: str) -> str:
+    return os.path.join(directory, "%s.rates" % quote(tenant, safe=""))
+
+
+def get_key(pricelist: int, prefix: bytes) -> bytes:
+    return struct.pack(">H", pricelist) + prefix.ljust(PREFIX_SIZE, b"\0")
+
+
+def to_int(value: Optional[int]) -> int:
+    return NULL if value is None else int(value)
+
+
+def from_int(value: int) -> Optional[int]:
+    return None if value == NULL else value
+
+
+def to_milliseconds(value: Optional[datetime]) -> int:
+    if value is None:
+        return NULL
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // (EPOCH.resolution * 1000)
+
+
+def from_milliseconds(value: int) -> Optional[datetime]:
+    if value == NULL:
+        return None
+    return EPOCH + value * (EPOCH.resolution * 1000)
+
+
+def write_rate_table(
+    path: str,
+    tenant: str,
+    versions: Dict[str, Optional[str]],
+    rates: List[dict],
+):
+    """
+    Write the rates into a compiled rate table, replacing the file at path
+    atomically; rates with a prefix longer than PREFIX_SIZE are not stored,
+    their count is, and the lookups which may match them are not served
+    from the table.
+    """
+    names = sorted(
+        {rate["pricelist_tag"] for rate in rates}
+        | {rate["carrier_tag"] for rate in rates if rate.get("carrier_tag")}
+    )
+    if len(names) >= NO_NAME:
+        raise ValueError("Too many price lists and carriers for tenant %s!" % tenant)
+    indexes = {name: index for index, name in enumerate(names)}
+    strings = bytearray()
+
+    def add_string(value: Optional[Any]) -> Tuple[int, int]:
+        if value is None:
+            return NULL_STRING, 0
+        data = str(value).encode("utf-8")
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    records = []
+    long_prefixes = 0
+    for rate in rates:
+        prefix = rate["prefix"].encode("utf-8")
+        if len(prefix) > PREFIX_SIZE:
+            long_prefixes += 1
+            continue
+        pricelist = indexes[rate["pricelist_tag"]]
+        carrier = indexes[rate["carrier_tag"]] if rate.get("carrier_tag") else NO_NAME
+        records.append((get_key(pricelist, prefix), carrier, pricelist, prefix, rate))
+    records.sort(key=lambda record: (record[0], record[1]))
+    meta = json.dumps(
+        {
+            "tenant": tenant,
+            "names": names,
+            "versions": versions,
+            "long_prefixes": long_prefixes,
+        }
+    )
+    records_offset = HEADER.size
+    meta_offset = records_offset + RECORD.size * len(records)
+    strings_offset = meta_offset + len(meta.encode("utf-8"))
+    directory = os.path.dirname(path) or "."
+    temporary = os.path.join(
+        directory, ".%s.%d.tmp" % (os.path.basename(path), os.getpid())
+    )
+    with open(temporary, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC, len(records), records_offset, meta_offset, strings_offset
+            )
+        )
+        for _, carrier, pricelist, prefix, rate in records:
+            id_offset, id_length = add_string(rate.get("_id"))
+            description_offset, description_length = add_string(rate.get("description"))
+            f.write(
+                RECORD.pack(
+                    pricelist,
+                    prefix,
+                    carrier,
+                    to_int(rate.get("connect_fee")),
+                    to_int(rate.get("rate")),
+                    to_int(rate.get("rate_increment")),
+                    to_int(rate.get("interval_start")),
+                    to_milliseconds(rate.get("datetime_start")),
+                    to_milliseconds(rate.get("datetime_end")),
+                    id_offset,
+                    id_length,
+                    description_offset,
+                    description_length,
+                )
+            )
+        f.write(meta.encode("utf-8"))
+        f.write(strings)
+    os.replace(temporary, path)
+
+
+class RateTable(object):
+    """
+    RateTable is a read-only view over a compiled rate table mapped in
+    memory, shared by the page cache of all the processes mapping it; the
+    longest prefix lookups binary search the sorted records in place.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            self.count,
+            self._records_offset,
+            meta_offset,
+            strings_offset,
+        ) = HEADER.unpack_from(self._mmap, 0)
+        self._strings_offset = strings_offset
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError("Invalid rate table %s!" % path)
+        meta = json.loads(self._mmap[meta_offset:strings_offset])
+        self.tenant = meta["tenant"]
+        self.names = meta["names"]
+        self.versions = meta["versions"]
+        self.long_prefixes = meta.get("long_prefixes", 0)
+        self._indexes = {name: index for index, name in enumerate(self.names)}
+
+    def close(self):
+        self._mmap.close()
+
+    def _get_key(self, index: int) -> bytes:
+        start = self._records_offset + index * RECORD.size
+        end = start + KEY_SIZE
+        return self._mmap[start:end]
+
+    def _bisect(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _get_string(self, offset: int, length: int) -> Optional[str]:
+        if offset == NULL_STRING:
+            return None
+        start = self._strings_offset + offset
+        end = start + length
+        return self._mmap[start:end].decode("utf-8")
+
+    def get_rate(self, index: int) -> dict:
+        (
+            pricelist,
+            prefix,
+            carrier,
+            connect_fee,
+            rate,
+            rate_increment,
+            interval_start,
+            datetime_start,
+            datetime_end,
+            id_offset,
+            id_length,
+            description_offset,
+            description_length,
+        ) = RECORD.unpack_from(self._mmap, self._records_offset + index * RECORD.size)
+        pricelist_tag = self.names[pricelist]
+        return {
+            "_id": self._get_string(id_offset, id_length),
+            "tenant": self.tenant,
+            "pricelist_tag": pricelist_tag,
+            "carrier_tag": self.names[carrier] if carrier != NO_NAME else None,
+            "prefix": prefix.rstrip(b"\0").decode("utf-8"),
+            "datetime_start": from_milliseconds(datetime_start),
+            "datetime_end": from_milliseconds(datetime_end),
+            "active": True,
+            "connect_fee": from_int(connect_fee),
+            "rate": from_int(rate),
+            "rate_increment": from_int(rate_increment),
+            "interval_start": from_int(interval_start),
+            "description": self._get_string(description_offset, description_length),
+            "version": self.versions.get(pricelist_tag),
+        }
+
+    def lookup(
+        self,
+        pricelist_tags: List[str],
+        carrier_tags: Optional[List[str]],
+        destination: str,
+        max_length: int,
+    ) -> Optional[dict]:
+        carriers = (
+            {self._indexes.get(carrier_tag) for carrier_tag in carrier_tags}
+            if carrier_tags
+            else None
+        )
+        found = None
+        found_length = 0
+        for pricelist_tag in pricelist_tags:
+            pricelist = self._indexes.get(pricelist_tag)
+            if pricelist is None:
+                continue
+            for length in range(min(max_length, PREFIX_SIZE), found_length, -1):
+                prefix = destination[:length].encode("utf-8")
+                if len(prefix) < length:
+                    continue
+                key = get_key(pricelist, prefix)
+                index = self._bisect(key)
+                while index < self.count and self._get_key(index) == key:
+                    offset = self._records_offset + index * RECORD.size
+                    carrier = struct.unpack_from(">H", self._mmap, offset + KEY_SIZE)[0]
+                    if carriers is None or carrier in carriers:
+                        found, found_length = index, length
+                        break
+                    index += 1
+                if found_length == length:
+                    break
+        return self.get_rate(found) if found is not None else None
+
+
+async def compile_rate_table(storage, tenant: str, path: str) -> int:
+    """
+    Compile the active rates of the active version of every price list of
+    the tenant into the rate table at path, returning the number of rates.
+    """
+    from . import pricelist as pricelist_service
+
+    versions = {
+        pricelist["pricelist_tag"]: pricelist.get("active_version")
+        for pricelist in await storage.db["pricelists"]
+        .find({"tenant": tenant}, {"pricelist_tag": 1, "active_version": 1})
+        .to_list(None)
+    }
+    query = dict(
+        await pricelist_service.get_versions_query(storage, tenant),
+        tenant=tenant,
+        active=True,
+    )
+    rates = []
+    async for rate in storage.db["pricelist_rates"].find(
+        query, pricelist_service.PRICELIST_RATE_PROJECTION
+    ):
+        if rate.get("pricelist_tag") and isinstance(rate.get("prefix"), str):
+            rates.append(rate)
+    await asyncio.get_event_loop().run_in_executor(
+        None, write_rate_table, path, tenant, versions, rates
+    )
+    return len(rates)
+
+
+class RateTables(object):
+    """
+    RateTables serves the destination rate lookups from a compiled rate
+    table per tenant, stored in directory and reopened when replaced. Rate
+    changes mark the tenant for a rebuild, done in the background after
+    delay seconds by a single worker at a time. Until a table exists, and
+    while the table of the tenant is being rebuilt after a change, the
+    lookups fall back to the database.
+    """
+
+    name = "rate_table"
+
+    def __init__(self, directory: str, delay: float = 1.0, check_interval: float = 1.0):
+        self.directory = directory
+        self.delay = delay
+        self.check_interval = check_interval
+        self.lookups = 0
+        self.rebuilds = 0
+        self._tables: Dict[str, Tuple[float, Optional[RateTable]]] = {}
+        self._dirty: Set[str] = set()
+        self._rebuilding: Set[str] = set()
+        self._storage: Any = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, storage):
+        os.makedirs(self.directory, exist_ok=True)
+        self._storage = storage
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, table in self._tables.values():
+            if table is not None:
+                table.close()
+        self._tables = {}
+
+    def get(self, tenant: str) -> Optional[RateTable]:
+        now = time.monotonic()
+        checked, table = self._tables.get(tenant, (0.0, None))
+        if checked + self.check_interval > now:
+            return table
+        path = get_path(self.directory, tenant)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None:
+            self.mark(tenant)
+        elif table is None or (stat.st_ino, stat.st_mtime_ns) != (
+            table.stat.st_ino,
+            table.stat.st_mtime_ns,
+        ):
+            # the mappings of the previous table are released with it
+            table = RateTable(path)
+        self._tables[tenant] = (now, table)
+        return table
+
+    def lookup(
+        self,
+        tenant: str,
+        pricelist_tags: List[str],
+        carrier_tags: Optional[List[str]],
+        destination: str,
+        max_length: int,
+    ) -> Any:
+        """
+        Return the rate found in the table of the tenant, or NOT_LOADED if
+        the table was not compiled yet, misses some changes or may miss the
+        rate, when the destination is longer than the prefixes it stores.
+        """
+        if tenant in self._dirty or tenant in self._rebuilding:
+            return NOT_LOADED
+        table = self.get(tenant)
+        if table is None:
+            return NOT_LOADED
+        if table.long_prefixes and len(destination.encode("utf-8")) > PREFIX_SIZE:
+            return NOT_LOADED
+        self.lookups += 1
+        return table.lookup(pricelist_tags, carrier_tags, destination, max_length)
+
+    def mark(self, tenant: Optional[str] = None):
+        if self._task is None:
+            return
+        if tenant is None:
+            self._dirty.update(self._tables.keys())
+        else:
+            self._dirty.add(tenant)
+        self._changed.set()
+
+    def invalidate(
+        self, collection: str, id: Optional[Any] = None, document: dict = None
+    ):
+        if collection not in ("pricelist_rates", "pricelists"):
+            return
+        self.mark(document.get("tenant") if document is not None else None)
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "rebuilds": self.rebuilds,
+            "tables": sum(1 for _, table in self._tables.values() if table),
+        }
+
+    async def rebuild(self, tenant: str) -> bool:
+        """
+        Compile the table of the tenant, unless another worker is compiling
+        it: return False in that case.
+        """
+        path = get_path(self.directory, tenant)
+        with open(path + ".lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            await compile_rate_table(self._storage, tenant, path)
+        self.rebuilds += 1
+        # reopened on the next lookup
+        self._tables.pop(tenant, None)
+        if self._storage.rate_cache is not None:
+            # the results read from the previous table
+            self._storage.rate_cache.invalidate("pricelists", None, {"tenant": tenant})
+        return True
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            await asyncio.sleep(self.delay)
+            self._changed.clear()
+            self._rebuilding, self._dirty = self._dirty, set()
+            for tenant in list(self._rebuilding):
+                try:
+                    if await self.rebuild(tenant):
+                        continue
+                except (OSError, PyMongoError, ValueError):
+                    logger.exception("Compiling the rate table of %s failed", tenant)
+                # retried, the changes may not be in the table being compiled
+                self._dirty.add(tenant)
+                self._changed.set()
+            self._rebuilding = set()
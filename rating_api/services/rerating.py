@@ -0,0 +1,215 @@
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne  # type: ignore
+
+from . import account as account_service
+from . import billing as billing_service
+from . import pricelist as pricelist_service
+from .loader import Loaders
+from .storage import StorageService
+
+BATCH_SIZE = 5000
+
+TRANSACTION_PROJECTION = {
+    "transaction_tag": 1,
+    "account_tag": 1,
+    "destination": 1,
+    "destination_rate": 1,
+    "duration": 1,
+    "timestamp_begin": 1,
+    "timestamp_end": 1,
+    "fee": 1,
+}
+
+
+def get_duration(transaction: dict) -> Optional[int]:
+    """
+    Return the duration of the transaction, computed from its timestamps
+    when it was not stored, or None when it is unknown.
+    """
+    if transaction.get("duration") is not None:
+        return transaction["duration"]
+    if transaction.get("timestamp_begin") and transaction.get("timestamp_end"):
+        return billing_service.get_duration(
+            transaction["timestamp_begin"], transaction["timestamp_end"]
+        )
+    return None
+
+
+def is_valid_at(rate: dict, timestamp: Optional[datetime]) -> bool:
+    """
+    Return whether the rate was valid at timestamp, from its datetime_start
+    included to its datetime_end excluded.
+    """
+    if timestamp is None:
+        return True
+    if rate.get("datetime_start") is not None and timestamp < rate["datetime_start"]:
+        return False
+    if rate.get("datetime_end") is not None and timestamp >= rate["datetime_end"]:
+        return False
+    return True
+
+
+def get_change(transaction: dict, destination_rate: dict, fee: int) -> dict:
+    previous = transaction.get("destination_rate") or {}
+    return {
+        "id": transaction["_id"],
+        "transaction_tag": transaction.get("transaction_tag"),
+        "account_tag": transaction.get("account_tag"),
+        "destination": transaction.get("destination"),
+        "duration": transaction.get("duration"),
+        "prefix": [previous.get("prefix"), destination_rate.get("prefix")],
+        "rate": [previous.get("rate"), destination_rate.get("rate")],
+        "fee": [transaction.get("fee"), fee],
+        "destination_rate": destination_rate,
+    }
+
+
+async def rerate_batch(
+    storage: StorageService, transactions: List[dict], loaders: Loaders
+) -> Tuple[List[dict], int]:
+    """
+    Rate again the destinations of the transactions with the current rates
+    of the current price lists of their accounts, resolved in bulk per
+    account, and return the changes along with the number of transactions
+    left unrated: the ones whose current rate was not valid when they began
+    are left unrated too.
+    """
+    accounts = await loaders.get("accounts", "tenant", "account_tag").load_many(
+        [
+            (transaction["tenant"], transaction.get("account_tag"))
+            for transaction in transactions
+        ]
+    )
+    groups: Dict[tuple, set] = {}
+    for transaction, account in zip(transactions, accounts):
+        if account is not None and transaction.get("destination"):
+            groups.setdefault(
+                (
+                    transaction["tenant"],
+                    tuple(account.get("pricelist_tags") or ()),
+                    tuple(account.get("carrier_tags") or ()),
+                ),
+                set(),
+            ).add(transaction["destination"])
+    rates: Dict[tuple, Dict[str, Optional[dict]]] = {}
+    for key, destinations in groups.items():
+        tenant, pricelist_tags, carrier_tags = key
+        rates[key] = await pricelist_service.find_rates_by_destinations(
+            storage,
+            tenant,
+            list(pricelist_tags),
+            list(carrier_tags),
+            list(destinations),
+        )
+    rated: List[Tuple[dict, dict]] = []
+    durations: List[int] = []
+    unrated = 0
+    for transaction, account in zip(transactions, accounts):
+        rate = None
+        duration = get_duration(transaction)
+        if (
+            account is not None
+            and transaction.get("destination")
+            and duration is not None
+        ):
+            rate = rates[
+                (
+                    transaction["tenant"],
+                    tuple(account.get("pricelist_tags") or ()),
+                    tuple(account.get("carrier_tags") or ()),
+                )
+            ].get(transaction["destination"])
+        if rate is None or not is_valid_at(rate, transaction.get("timestamp_begin")):
+            unrated += 1
+        else:
+            rated.append((transaction, account_service.get_transaction_rate(rate)))
+            durations.append(duration)
+    fees = billing_service.compute_fees(
+        [destination_rate for _, destination_rate in rated], durations
+    )
+    changes = [
+        get_change(transaction, destination_rate, fee)
+        for (transaction, destination_rate), fee in zip(rated, fees)
+        if fee != transaction.get("fee")
+        or destination_rate
+        != account_service.get_transaction_rate(
+            transaction.get("destination_rate") or {}
+        )
+    ]
+    return changes, unrated
+
+
+async def rerate_transactions(
+    storage: StorageService,
+    tenant: str,
+    timestamp_from: Optional[datetime] = None,
+    timestamp_to: Optional[datetime] = None,
+    dry_run: bool = False,
+    report: Optional[Callable[[List[dict]], None]] = None,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Re-rate the authorized transactions of the tenant which began in the
+    given time range, streamed BATCH_SIZE at a time, and write the changed
+    fee and destination_rate back with bulk writes, unless dry_run is set.
+    report is called with the changes of each batch, progress with the
+    summary so far. The balances of the accounts are left untouched: the
+    summary includes the total fee_delta instead. The transactions whose
+    destination is no longer rated, whose current rate was not valid when
+    they began, or whose duration is unknown, are counted as unrated and
+    kept as is. The rates are looked up with the current price lists and
+    carriers of the accounts, not the ones at the time of the transactions.
+    """
+    query: dict = {"tenant": tenant, "authorized": True}
+    if timestamp_from is not None or timestamp_to is not None:
+        query["timestamp_begin"] = storage.filter_dict(
+            {"$gte": timestamp_from, "$lt": timestamp_to}
+        )
+    summary = {"count": 0, "changed": 0, "unrated": 0, "fee_delta": 0}
+    loaders = Loaders(storage)
+    cursor = (
+        storage.db["transactions"]
+        .find(query, dict(TRANSACTION_PROJECTION, tenant=1), batch_size=BATCH_SIZE)
+        .sort([("timestamp_begin", ASCENDING), ("_id", ASCENDING)])
+    )
+    batch: List[dict] = []
+
+    async def flush():
+        changes, unrated = await rerate_batch(storage, batch, loaders)
+        if changes and not dry_run:
+            await storage.db["transactions"].bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": change["id"]},
+                        {
+                            "$set": {
+                                "fee": change["fee"][1],
+                                "destination_rate": change["destination_rate"],
+                            }
+                        },
+                    )
+                    for change in changes
+                ],
+                ordered=False,
+            )
+        summary["count"] += len(batch)
+        summary["changed"] += len(changes)
+        summary["unrated"] += unrated
+        summary["fee_delta"] += sum(
+            change["fee"][1] - (change["fee"][0] or 0) for change in changes
+        )
+        if report is not None and changes:
+            report(changes)
+        if progress is not None:
+            progress(summary)
+
+    async for transaction in cursor:
+        batch.append(transaction)
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+            batch = []
+    if batch:
+        await flush()
+    return summary
@@ -0,0 +1,410 @@
+import asyncio
+import logging
+
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from fastapi import FastAPI
+from pymongo import UpdateOne  # type: ignore
+from pymongo.collection import ReturnDocument  # type: ignore
+from pymongo.errors import DuplicateKeyError, PyMongoError  # type: ignore
+
+from .storage import StorageService
+
+logger = logging.getLogger(__name__)
+
+INBOUND_COUNTER = "inbound_transactions_in_progress"
+
+OUTBOUND_COUNTER = "outbound_transactions_in_progress"
+
+COUNTERS = (INBOUND_COUNTER, OUTBOUND_COUNTER)
+
+
+def get_counter(transaction: dict) -> str:
+    return INBOUND_COUNTER if transaction.get("inbound") else OUTBOUND_COUNTER
+
+
+def serialize(transaction: dict) -> dict:
+    return {
+        "destination_rate": transaction.get("destination_rate"),
+        "transaction_tag": transaction.get("transaction_tag"),
+        "proxy_tag": transaction.get("proxy_tag"),
+        "source": transaction.get("source"),
+        "source_ip": transaction.get("source_ip"),
+        "destination": transaction.get("destination"),
+        "carrier_ip": transaction.get("carrier_ip"),
+        "tags": transaction.get("tags"),
+        "in_progress": transaction.get("in_progress"),
+        "inbound": transaction.get("inbound"),
+        "primary": transaction.get("primary"),
+        "timestamp_begin": transaction.get("timestamp_begin"),
+        "timestamp_end": transaction.get("timestamp_end"),
+    }
+
+
+async def get(
+    storage: StorageService, tenant: str, account_tag: str, transaction_tag: str
+) -> Optional[dict]:
+    result = await storage.db["running_transactions"].find_one(
+        {
+            "tenant": tenant,
+            "account_tag": account_tag,
+            "transaction_tag": transaction_tag,
+        }
+    )
+    return serialize(result) if result is not None else None
+
+
+async def get_all(storage: StorageService, tenant: str, account_tag: str) -> List[dict]:
+    result = storage.db["running_transactions"].find(
+        {"tenant": tenant, "account_tag": account_tag}
+    )
+    return [
+        serialize(transaction)
+        for transaction in await result.sort("timestamp_begin").to_list(None)
+    ]
+
+
+async def get_long_running_account_tags(
+    storage: StorageService, tenant: Optional[str], timestamp_begin: datetime
+) -> List[str]:
+    query: dict = {"in_progress": True, "timestamp_begin": {"$lte": timestamp_begin}}
+    if tenant:
+        query["tenant"] = tenant
+    return await storage.db["running_transactions"].distinct("account_tag", query)
+
+
+async def begin(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction: dict,
+    query: Optional[dict] = None,
+) -> Optional[dict]:
+    """
+    Insert the running transaction, then count it on the account if the
+    account matches query, the admission conditions, removing it otherwise;
+    a transaction already running is returned as is and not counted again.
+    """
+    document = {
+        "tenant": tenant,
+        "account_tag": account_tag,
+        "proxy_tag": transaction.get("proxy_tag"),
+        "destination_rate": transaction.get("destination_rate"),
+        "transaction_tag": transaction.get("transaction_tag"),
+        "source": transaction.get("source"),
+        "source_ip": transaction.get("source_ip"),
+        "destination": transaction.get("destination"),
+        "carrier_ip": transaction.get("carrier_ip"),
+        "tags": transaction.get("tags"),
+        "in_progress": True,
+        "inbound": bool(transaction.get("inbound")),
+        "primary": bool(transaction.get("primary")),
+        "timestamp_begin": transaction.get("timestamp_begin"),
+        "timestamp_end": None,
+    }
+    try:
+        result = await storage.db["running_transactions"].insert_one(document)
+    except DuplicateKeyError:
+        return await get(
+            storage, tenant, account_tag, transaction.get("transaction_tag")
+        )
+    account = await storage.db["accounts"].find_one_and_update(
+        dict(query or {}, tenant=tenant, account_tag=account_tag),
+        {"$inc": {get_counter(transaction): 1}},
+        projection={"_id": 1},
+    )
+    if account is None:
+        await storage.db["running_transactions"].delete_one({"_id": result.inserted_id})
+        return None
+    return serialize(document)
+
+
+async def end(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction_tag: str,
+    timestamp_end: datetime,
+) -> Optional[dict]:
+    result = await storage.db["running_transactions"].find_one_and_update(
+        {
+            "tenant": tenant,
+            "account_tag": account_tag,
+            "transaction_tag": transaction_tag,
+        },
+        {"$set": {"timestamp_end": timestamp_end, "in_progress": False}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if result is None:
+        return None
+    if result.get("in_progress"):
+        await storage.db["accounts"].update_one(
+            {"tenant": tenant, "account_tag": account_tag},
+            {"$inc": {get_counter(result): -1}},
+        )
+    return serialize(dict(result, timestamp_end=timestamp_end, in_progress=False))
+
+
+async def pop(
+    storage: StorageService, tenant: str, account_tag: str, transaction_tag: str
+) -> Optional[dict]:
+    return await storage.db["running_transactions"].find_one_and_delete(
+        {
+            "tenant": tenant,
+            "account_tag": account_tag,
+            "transaction_tag": transaction_tag,
+            # claimed by finish_many
+            "finishing": None,
+        }
+    )
+
+
+async def settle(
+    storage: StorageService, transaction: dict, fee: Optional[int] = None
+) -> None:
+    inc = {}
+    if fee is not None:
+        inc["balance"] = -fee
+    if transaction.get("in_progress"):
+        inc[get_counter(transaction)] = -1
+    if inc:
+        await storage.db["accounts"].update_one(
+            {
+                "tenant": transaction["tenant"],
+                "account_tag": transaction["account_tag"],
+            },
+            {"$inc": inc},
+        )
+
+
+async def finish(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction_tag: str,
+    fee: Optional[int] = None,
+) -> bool:
+    result = await pop(storage, tenant, account_tag, transaction_tag)
+    if result is None:
+        return False
+    await settle(storage, result, fee)
+    return True
+
+
+async def commit(
+    storage: StorageService,
+    tenant: str,
+    account_tag: str,
+    transaction_tag: str,
+    fee: int,
+) -> bool:
+    return await finish(storage, tenant, account_tag, transaction_tag, fee)
+
+
+async def rollback(
+    storage: StorageService, tenant: str, account_tag: str, transaction_tag: str
+) -> bool:
+    return await finish(storage, tenant, account_tag, transaction_tag)
+
+
+async def finish_many(
+    storage: StorageService, tenant: str, transactions: List[dict], commit: bool
+) -> Set[Tuple[str, str]]:
+    """
+    Commit or roll back many running transactions, returning the keys of
+    the finished ones: they are first claimed with a marker, so that only
+    the transactions removed by this call are settled on the accounts with
+    a single unordered bulk write.
+    """
+    marker = str(uuid4())
+    query = {
+        "tenant": tenant,
+        "$or": [
+            {
+                "account_tag": transaction["account_tag"],
+                "transaction_tag": transaction["transaction_tag"],
+            }
+            for transaction in transactions
+        ],
+    }
+    await storage.db["running_transactions"].update_many(
+        dict(query, finishing=None), {"$set": {"finishing": marker}}
+    )
+    documents = (
+        await storage.db["running_transactions"]
+        .find(dict(query, finishing=marker))
+        .to_list(None)
+    )
+    if not documents:
+        return set()
+    await storage.db["running_transactions"].delete_many(
+        {"_id": {"$in": [document["_id"] for document in documents]}}
+    )
+    fees = {
+        (transaction["account_tag"], transaction["transaction_tag"]): transaction.get(
+            "fee"
+        )
+        for transaction in transactions
+    }
+    incs: Dict[str, Dict[str, int]] = {}
+    for document in documents:
+        inc = incs.setdefault(document["account_tag"], {})
+        if commit:
+            fee = fees[(document["account_tag"], document["transaction_tag"])]
+            inc["balance"] = inc.get("balance", 0) - (fee or 0)
+        if document.get("in_progress"):
+            counter = get_counter(document)
+            inc[counter] = inc.get(counter, 0) - 1
+    requests = [
+        UpdateOne({"tenant": tenant, "account_tag": account_tag}, {"$inc": inc})
+        for account_tag, inc in incs.items()
+        if inc
+    ]
+    if requests:
+        await storage.db["accounts"].bulk_write(requests, ordered=False)
+    return {
+        (document["account_tag"], document["transaction_tag"]) for document in documents
+    }
+
+
+async def get_counter_mismatches(
+    storage: StorageService, tenant: Optional[str] = None
+) -> Dict[Tuple[str, str], Dict[str, Tuple[int, int]]]:
+    """
+    Return the counters of the accounts which differ from the number of
+    their transactions in progress, as (counter, expected) by counter name.
+    """
+    expected: Dict[Tuple[str, str], Dict[str, int]] = {}
+    async for result in storage.db["running_transactions"].aggregate(
+        [
+            {"$match": storage.filter_dict({"tenant": tenant, "in_progress": True})},
+            {
+                "$group": {
+                    "_id": {
+                        "tenant": "$tenant",
+                        "account_tag": "$account_tag",
+                        "inbound": {"$ifNull": ["$inbound", False]},
+                    },
+                    "count": {"$sum": 1},
+                }
+            },
+        ]
+    ):
+        key = (result["_id"]["tenant"], result["_id"]["account_tag"])
+        counter = get_counter(result["_id"])
+        expected.setdefault(key, {})[counter] = result["count"]
+    account_tags: Dict[str, List[str]] = {}
+    for account_tenant, account_tag in expected.keys():
+        account_tags.setdefault(account_tenant, []).append(account_tag)
+    # served by the partial indexes of the counters
+    query: dict = {
+        "$or": [{counter: {"$gt": 0}} for counter in COUNTERS]
+        + [{counter: {"$lt": 0}} for counter in COUNTERS]
+        + [
+            {"tenant": account_tenant, "account_tag": {"$in": tags}}
+            for account_tenant, tags in account_tags.items()
+        ]
+    }
+    if tenant is not None:
+        query["tenant"] = tenant
+    mismatches: Dict[Tuple[str, str], Dict[str, Tuple[int, int]]] = {}
+    async for account in storage.db["accounts"].find(
+        query, dict({counter: 1 for counter in COUNTERS}, tenant=1, account_tag=1)
+    ):
+        key = (account["tenant"], account["account_tag"])
+        for counter in COUNTERS:
+            value = account.get(counter) or 0
+            count = expected.get(key, {}).get(counter, 0)
+            if value != count:
+                mismatches.setdefault(key, {})[counter] = (value, count)
+    return mismatches
+
+
+async def reconcile_counters(
+    storage: StorageService, tenant: Optional[str] = None, delay: float = 1.0
+) -> int:
+    """
+    Recompute the counters of the transactions in progress of the accounts
+    from the running transactions, returning the number of fixed accounts.
+    A counter is changed in a separate write from the running transaction,
+    so only the mismatches observed twice, delay seconds apart, and not
+    updated in the meantime are fixed.
+    """
+    first = await get_counter_mismatches(storage, tenant)
+    if not first:
+        return 0
+    await asyncio.sleep(delay)
+    second = await get_counter_mismatches(storage, tenant)
+    requests = []
+    for (account_tenant, account_tag), counters in second.items():
+        stable = {
+            counter: values
+            for counter, values in counters.items()
+            if first.get((account_tenant, account_tag), {}).get(counter) == values
+        }
+        if not stable:
+            continue
+        logger.warning(
+            "Fixing the transactions in progress of account %s in tenant %s: %s",
+            account_tag,
+            account_tenant,
+            stable,
+        )
+        query: dict = {"tenant": account_tenant, "account_tag": account_tag}
+        for counter, (value, _) in stable.items():
+            query[counter] = value if value else {"$in": [0, None]}
+        requests.append(
+            UpdateOne(
+                query,
+                {"$set": {counter: count for counter, (_, count) in stable.items()}},
+            )
+        )
+    if not requests:
+        return 0
+    result = await storage.db["accounts"].bulk_write(requests, ordered=False)
+    return result.modified_count
+
+
+class CounterReconciler(object):
+    """
+    CounterReconciler runs reconcile_counters at startup and then every
+    interval seconds.
+    """
+
+    def __init__(self, interval: float = 300.0):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, storage: StorageService):
+        self._task = asyncio.ensure_future(self._run(storage))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, storage: StorageService):
+        while True:
+            try:
+                await reconcile_counters(storage)
+            except PyMongoError:
+                logger.exception("Reconciling the transactions in progress failed")
+            await asyncio.sleep(self.interval)
+
+
+def setup(app: FastAPI) -> FastAPI:
+    reconciler = CounterReconciler()
+    storage_service = getattr(app, "storage_service")
+
+    async def start():
+        reconciler.start(storage_service)
+
+    app.add_event_handler("startup", start)
+    app.add_event_handler("shutdown", reconciler.close)
+    return app
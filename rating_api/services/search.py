@@ -0,0 +1,114 @@
+import re
+
+from typing import List, Optional, Sequence
+
+from motor.motor_asyncio import AsyncIOMotorCollection  # type: ignore
+from pymongo import UpdateOne  # type: ignore
+
+SEARCH_KEY_MAX_LENGTH = 32
+
+BACKFILL_BATCH_SIZE = 1000
+
+# the fields of the search keys of each collection
+SEARCH_FIELDS = {
+    "accounts": ("account_tag", "name"),
+    "carriers": ("carrier_tag", "host"),
+    "customers": ("customer_tag", "company_name", "tax_number", "vat_number"),
+    "invoices": ("invoice_number",),
+    "pricelists": ("pricelist_tag", "name"),
+    "pricelist_rates": ("pricelist_tag", "prefix", "description"),
+    "sellers": ("seller_tag", "company_name", "tax_number", "vat_number"),
+    "transactions": ("transaction_tag", "account_tag"),
+}
+
+TOKEN_SEPARATOR = re.compile(r"[\W_]+")
+
+
+def get_tokens(value: str) -> List[str]:
+    return [
+        token[:SEARCH_KEY_MAX_LENGTH]
+        for token in TOKEN_SEPARATOR.split(value.lower())
+        if token
+    ]
+
+
+def get_search_keys(document: dict, fields: Sequence[str]) -> List[str]:
+    """
+    Return the lowercase prefixes of every token of the given fields, which
+    are stored in the search_keys array of the document.
+    """
+    keys = set()
+    for field in fields:
+        if document.get(field) is None:
+            continue
+        for token in get_tokens(str(document[field])):
+            keys.update(token[:i] for i in range(1, len(token) + 1))
+    return sorted(keys)
+
+
+def get_complete_search_keys(
+    document: dict, fields: Sequence[str]
+) -> Optional[List[str]]:
+    """
+    Return the search keys of the document when all the fields are provided,
+    so that they can be written with the same update, otherwise None.
+    """
+    if any(document.get(field) is None for field in fields):
+        return None
+    return get_search_keys(document, fields)
+
+
+async def update_search_keys(
+    collection: AsyncIOMotorCollection, document: dict, fields: Sequence[str]
+) -> dict:
+    keys = get_search_keys(document, fields)
+    if document.get("search_keys") != keys:
+        await collection.update_one(
+            {"_id": document["_id"]}, {"$set": {"search_keys": keys}}
+        )
+        document = dict(document, search_keys=keys)
+    return document
+
+
+async def backfill_search_keys(
+    collection: AsyncIOMotorCollection, fields: Sequence[str]
+) -> int:
+    """
+    Set the search keys of the documents written before they were
+    maintained, BACKFILL_BATCH_SIZE at a time, and return their count; run
+    by the rating-api-migrate command.
+    Documents which got their search keys meanwhile are left untouched.
+    """
+    count = 0
+    requests: List[UpdateOne] = []
+    cursor = collection.find(
+        {"search_keys": {"$exists": False}},
+        {field: 1 for field in fields},
+        batch_size=BACKFILL_BATCH_SIZE,
+    )
+    async for document in cursor:
+        requests.append(
+            UpdateOne(
+                {"_id": document["_id"], "search_keys": {"$exists": False}},
+                {"$set": {"search_keys": get_search_keys(document, fields)}},
+            )
+        )
+        if len(requests) >= BACKFILL_BATCH_SIZE:
+            await collection.bulk_write(requests, ordered=False)
+            count += len(requests)
+            requests = []
+    if requests:
+        await collection.bulk_write(requests, ordered=False)
+        count += len(requests)
+    return count
+
+
+def get_search_query(q: str) -> dict:
+    """
+    Match the q tokens as prefixes of the indexed search keys; q without
+    any token does not filter.
+    """
+    tokens = get_tokens(q)
+    if not tokens:
+        return {}
+    return {"search_keys": {"$all": tokens}}
@@ -1,12 +1,13 @@
-import re
-
 from typing import List, Optional
 from uuid import uuid4
-from pymongo import ASCENDING, DESCENDING  # type: ignore
 from pymongo.collection import ReturnDocument  # type: ignore
 
+from . import pagination
+from . import search
 from .storage import StorageService
 
+SEARCH_FIELDS = search.SEARCH_FIELDS["sellers"]
+
 
 def serialize(result: dict) -> dict:
     return {
@@ -36,13 +37,14 @@ async def get(
     tenant: Optional[str] = None,
     seller_tag: Optional[str] = None,
     role: str = "R",
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
         params = {"_id": id}
     else:
         params = {"tenant": tenant, "seller_tag": seller_tag}
-    result = await storage.db["sellers"].find_one(params)
+    result = await storage.find_one("sellers", params, projection)
     return serialize(result) if result is not None else None
 
 
@@ -50,17 +52,7 @@ async def get_query(storage: StorageService, filter: Optional[dict] = None) -> d
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {"tenant": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"seller_tag": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"company_name": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"tax_number": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {"vat_number": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     if filter.get("ids"):
@@ -79,18 +71,60 @@ async def get_all(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     query = await get_query(storage, filter)
-    result = storage.db["sellers"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["sellers"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    sellers = list(
-        serialize(seller)
-        for seller in await result.skip(page * perPage).limit(perPage).to_list(None)
+    return [
+        dict(serialize(seller), cursor=pagination.encode_cursor(seller, sortField))
+        for seller in result
+    ]
+
+
+async def get_all_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    query = await get_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["sellers"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
     )
-    return sellers
+    return {
+        "rows": [
+            dict(serialize(seller), cursor=pagination.encode_cursor(seller, sortField))
+            for seller in result
+        ],
+        "count": count,
+    }
 
 
 async def get_all_meta(
@@ -113,6 +147,7 @@ async def upsert(storage: StorageService, seller: dict) -> Optional[dict]:
         else {"tenant": seller.get("tenant"), "seller_tag": seller.get("seller_tag")},
         {
             "$setOnInsert": {"_id": seller.get("id") or str(uuid4())},
+            "$currentDate": {"updated_at": True},
             "$set": storage.filter_dict(
                 {
                     "tenant": seller.get("tenant"),
@@ -131,13 +166,20 @@ async def upsert(storage: StorageService, seller: dict) -> Optional[dict]:
                     "active": bool(seller.get("active"))
                     if seller.get("active") is not None
                     else None,
+                    "search_keys": search.get_complete_search_keys(
+                        seller, SEARCH_FIELDS
+                    ),
                 }
             ),
         },
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return serialize(result) if result is not None else None
+    result = await search.update_search_keys(
+        storage.db["sellers"], result, SEARCH_FIELDS
+    )
+    storage.invalidate("sellers", result["_id"], result)
+    return serialize(result)
 
 
 async def delete(
@@ -149,4 +191,6 @@ async def delete(
     seller = await get(storage, id=id, tenant=tenant, seller_tag=seller_tag, role="W")
     if seller is not None:
         await storage.db["sellers"].delete_one({"_id": seller["id"]})
+        await storage.record_delete("sellers", seller["id"], seller)
+        storage.invalidate("sellers", seller["id"])
     return seller
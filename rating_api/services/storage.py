@@ -1,22 +1,68 @@
+import asyncio
+import logging
+
+from typing import Any, Awaitable, List, Optional, Set
+
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase  # type: ignore
 from pymongo import ASCENDING  # type: ignore
+from pymongo.errors import OperationFailure  # type: ignore
 
 from fastapi import FastAPI
 from starlette.requests import Request
 
+from . import search
+from .change_stream import DELETES_COLLECTION, DELETES_TTL, ChangeStreamListener
+from .entity_cache import EntityCache
+from .rate_cache import RateCache
+from .rate_index import RateIndex
+from .rate_table import RateTables
+from .write_buffer import WriteBuffer
+
+logger = logging.getLogger(__name__)
+
 
 class StorageService(object):
 
     client: AsyncIOMotorClient
     db: AsyncIOMotorDatabase
 
-    def __init__(self, mongodb_uri: str, mongodb_db: str):
+    def __init__(
+        self,
+        mongodb_uri: str,
+        mongodb_db: str,
+        rate_index: bool = False,
+        running_transactions_collection: bool = False,
+        write_buffer: bool = False,
+        entity_cache: bool = False,
+        rate_cache: bool = False,
+        change_streams: bool = False,
+        rate_table: Optional[str] = None,
+    ):
         self._mongodb_uri = mongodb_uri
         self._mongodb_db = mongodb_db
+        self.rate_index = RateIndex() if rate_index else None
+        self.running_transactions_collection = running_transactions_collection
+        self.write_buffer = WriteBuffer() if write_buffer else None
+        self.entity_cache = EntityCache() if entity_cache else None
+        self.rate_cache = RateCache() if rate_cache else None
+        self.rate_table = RateTables(rate_table) if rate_table else None
+        self.caches: List[Any] = [
+            cache
+            for cache in (self.entity_cache, self.rate_cache, self.rate_table)
+            if cache is not None
+        ]
+        self.change_stream = ChangeStreamListener() if change_streams else None
+        self._background: Set[asyncio.Future] = set()
 
     async def connect(self):
         self.client = AsyncIOMotorClient(self._mongodb_uri)
         self.db = self.client[self._mongodb_db]
+        if self.write_buffer is not None:
+            self.write_buffer.start(self.db)
+        if self.change_stream is not None:
+            self.change_stream.start(self)
+        if self.rate_table is not None:
+            self.rate_table.start(self)
 
     async def create_indexes(self):
         await self.db["users"].create_index([("email", ASCENDING)], unique=True)
@@ -36,10 +82,18 @@ class StorageService(object):
         await self.db["pricelists"].create_index(
             [("tenant", ASCENDING), ("pricelist_tag", ASCENDING)], unique=True
         )
+        try:
+            # replaced by the index including the version
+            await self.db["pricelist_rates"].drop_index(
+                "tenant_1_pricelist_tag_1_prefix_1_carrier_tag_1"
+            )
+        except OperationFailure:
+            pass
         await self.db["pricelist_rates"].create_index(
             [
                 ("tenant", ASCENDING),
                 ("pricelist_tag", ASCENDING),
+                ("version", ASCENDING),
                 ("prefix", ASCENDING),
                 ("carrier_tag", ASCENDING),
             ],
@@ -73,14 +127,123 @@ class StorageService(object):
             ],
             unique=True,
         )
+        await self.db["transactions"].create_index(
+            [
+                ("tenant", ASCENDING),
+                ("timestamp_begin", ASCENDING),
+                ("_id", ASCENDING),
+            ]
+        )
+        for collection in search.SEARCH_FIELDS:
+            await self.db[collection].create_index(
+                [("tenant", ASCENDING), ("search_keys", ASCENDING)]
+            )
+            # used by the searches across the tenants, and by the backfill
+            await self.db[collection].create_index([("search_keys", ASCENDING)])
+        if self.change_stream is not None:
+            # used when polling for changes
+            for collection in self.change_stream.collections:
+                await self.db[collection].create_index(
+                    [("updated_at", ASCENDING)], sparse=True
+                )
+            await self.db[DELETES_COLLECTION].create_index(
+                [("updated_at", ASCENDING)], expireAfterSeconds=DELETES_TTL
+            )
+        if self.running_transactions_collection:
+            await self.db["running_transactions"].create_index(
+                [
+                    ("tenant", ASCENDING),
+                    ("account_tag", ASCENDING),
+                    ("transaction_tag", ASCENDING),
+                ],
+                unique=True,
+            )
+            await self.db["running_transactions"].create_index(
+                [
+                    ("tenant", ASCENDING),
+                    ("in_progress", ASCENDING),
+                    ("timestamp_begin", ASCENDING),
+                ]
+            )
+            # the accounts with transactions in progress
+            for counter in (
+                "inbound_transactions_in_progress",
+                "outbound_transactions_in_progress",
+            ):
+                await self.db["accounts"].create_index(
+                    [(counter, ASCENDING)],
+                    partialFilterExpression={counter: {"$exists": True}},
+                )
 
     async def connect_and_create_indexes(self):
         await self.connect()
         await self.create_indexes()
 
+    def run_in_background(self, coroutine: Awaitable, name: str) -> asyncio.Future:
+        """
+        Run the coroutine in a task kept until it is done, logging its
+        failure; close waits for it.
+        """
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+
+        def done(task: asyncio.Future):
+            self._background.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("%s failed", name, exc_info=task.exception())
+
+        task.add_done_callback(done)
+        return task
+
+    async def wait_background(self):
+        while self._background:
+            await asyncio.wait(list(self._background))
+
     async def close(self):
+        await self.wait_background()
+        if self.change_stream is not None:
+            await self.change_stream.close()
+        if self.rate_table is not None:
+            await self.rate_table.close()
+        if self.write_buffer is not None:
+            await self.write_buffer.close()
         self.client.close()
 
+    async def find_one(
+        self, collection: str, params: dict, projection: Optional[dict] = None
+    ) -> Optional[dict]:
+        """
+        Find a document by its key fields, through the entity cache for the
+        reference collections; cached documents are complete, so projection
+        only applies to the documents read from the collection.
+        """
+        cache = self.entity_cache
+        if cache is None or collection not in cache.collections:
+            return await self.db[collection].find_one(params, projection)
+        fields, key = tuple(params.keys()), tuple(params.values())
+        result = cache.get(collection, fields, key)
+        if result is None:
+            result = await self.db[collection].find_one(params)
+            if result is not None:
+                cache.set(collection, fields, key, result)
+        return result
+
+    async def record_delete(self, collection: str, id: Any, document: dict):
+        """
+        Record the delete of the document for the other workers, when they
+        keep their caches coherent through polling.
+        """
+        if self.change_stream is not None:
+            await self.change_stream.record_delete(self.db, collection, id, document)
+
+    def invalidate(self, collection: str, id: Any = None, document: dict = None):
+        """
+        Notify the registered caches that the document with the given id, or
+        any document when id is None, of the collection has changed.
+        """
+        for cache in self.caches:
+            cache.invalidate(collection, id, document)
+
     def filter_dict(self, d: dict) -> dict:
         return dict([(k, v) for k, v in d.items() if v is not None])
 
@@ -91,7 +254,17 @@ def get(request: Request) -> StorageService:
 
 def setup(app: FastAPI, config: dict) -> FastAPI:
     storage_service = StorageService(
-        mongodb_uri=config["mongodb_uri"], mongodb_db=config["mongodb_db"]
+        mongodb_uri=config["mongodb_uri"],
+        mongodb_db=config["mongodb_db"],
+        rate_index=config.get("rate_index", False),
+        running_transactions_collection=config.get(
+            "running_transactions_collection", False
+        ),
+        write_buffer=config.get("write_buffer", False),
+        entity_cache=config.get("entity_cache", False),
+        rate_cache=config.get("rate_cache", False),
+        change_streams=config.get("change_streams", False),
+        rate_table=config.get("rate_table"),
     )
     setattr(app, "storage_service", storage_service)
 
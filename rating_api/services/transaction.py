@@ -1,57 +1,77 @@
-import re
-
-from typing import List, Optional
-from uuid import uuid4
-from pymongo import ASCENDING, DESCENDING  # type: ignore
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID, uuid4, uuid5
+from pymongo import UpdateOne  # type: ignore
 from pymongo.collection import ReturnDocument  # type: ignore
+from pymongo.errors import BulkWriteError  # type: ignore
 
 from . import account as account_service
 from . import invoice as invoice_service
+from .loader import Loaders
+from . import pagination
+from . import search
 from .storage import StorageService
 
+SEARCH_FIELDS = search.SEARCH_FIELDS["transactions"]
+
+TRANSACTION_ID_NAMESPACE = UUID("4f0e6a7c-3d2b-5e81-9a6f-2c1b8d7e5a43")
+
+
+async def get_account(
+    storage: StorageService, transaction: dict, loaders: Optional[Loaders] = None
+) -> Optional[dict]:
+    if not transaction.get("account_tag"):
+        return None
+    loaders = loaders or Loaders(storage)
+    result = await loaders.get("accounts", "tenant", "account_tag").load(
+        (transaction.get("tenant"), transaction.get("account_tag"))
+    )
+    return account_service.serialize(result) if result is not None else None
+
+
+async def get_invoice(
+    storage: StorageService, transaction: dict, loaders: Optional[Loaders] = None
+) -> Optional[dict]:
+    if not transaction.get("invoice_number"):
+        return None
+    loaders = loaders or Loaders(storage)
+    result = await loaders.get("invoices", "tenant", "invoice_number").load(
+        (transaction.get("tenant"), transaction.get("invoice_number"))
+    )
+    return invoice_service.serialize(result) if result is not None else None
+
 
-async def process(storage: StorageService, transaction: dict) -> dict:
+async def process(
+    storage: StorageService, transaction: dict, loaders: Optional[Loaders] = None
+) -> dict:
     transaction = transaction.copy()
     #
     if transaction.get("account_tag"):
-        account = await account_service.get(
-            storage,
-            tenant=transaction.get("tenant"),
-            account_tag=transaction.get("account_tag"),
-        )
+        account = await get_account(storage, transaction, loaders)
         if account is None:
             raise ValueError(
                 "Account with id = %s not found in tenant %s!"
                 % (transaction.get("account_tag"), transaction.get("tenant"))
             )
-        transaction["account"] = account
         transaction["account_tag"] = account["account_tag"]
     #
     if transaction.get("invoice_number"):
-        invoice = await invoice_service.get(
-            storage,
-            tenant=transaction.get("tenant"),
-            invoice_number=transaction.get("invoice_number"),
-        )
+        invoice = await get_invoice(storage, transaction, loaders)
         if invoice is None:
             raise ValueError(
                 "Invoice with number = %s not found in tenant %s!"
                 % (transaction.get("invoice_number"), transaction.get("tenant"))
             )
-        transaction["invoice"] = invoice
         transaction["invoice_number"] = invoice["invoice_number"]
     return transaction
 
 
-async def serialize(storage: StorageService, transaction: dict) -> dict:
-    transaction = await process(storage, transaction)
+def serialize(transaction: dict) -> dict:
     return {
         "id": transaction.get("_id"),
         "tenant": transaction.get("tenant"),
         "transaction_tag": transaction.get("transaction_tag"),
-        "account": transaction.get("account"),
         "account_tag": transaction.get("account_tag"),
-        "invoice": transaction.get("invoice"),
+        "invoice_number": transaction.get("invoice_number"),
         "source": transaction.get("source"),
         "source_ip": transaction.get("source_ip"),
         "carrier_ip": transaction.get("carrier_ip"),
@@ -77,6 +97,7 @@ async def get(
     transaction_tag: Optional[str] = None,
     account_tag: Optional[str] = None,
     role: str = "R",
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     params: dict
     if id is not None:
@@ -87,27 +108,15 @@ async def get(
             "transaction_tag": transaction_tag,
             "account_tag": account_tag,
         }
-    result = await storage.db["transactions"].find_one(params)
-    return await serialize(storage, result) if result is not None else None
+    result = await storage.db["transactions"].find_one(params, projection)
+    return serialize(result) if result is not None else None
 
 
 async def get_query(storage: StorageService, filter: Optional[dict] = None) -> dict:
     filter = filter or {}
     filters_and: List = []
     if filter.get("q"):
-        filters_and.append(
-            {
-                "$or": [
-                    {"tenant": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                    {
-                        "transaction_tag": re.compile(
-                            re.escape(filter["q"]), re.IGNORECASE
-                        )
-                    },
-                    {"account_tag": re.compile(re.escape(filter["q"]), re.IGNORECASE)},
-                ]
-            }
-        )
+        filters_and.append(search.get_search_query(filter["q"]))
     if filter.get("id"):
         filters_and.append({"_id": filter["id"]})
     elif filter.get("ids"):
@@ -134,20 +143,66 @@ async def get_all(
     sortField: str = "id",
     sortOrder: str = "asc",
     filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ) -> List[dict]:
     query = await get_query(storage, filter)
-    result = storage.db["transactions"].find(query)
-    result = result.sort(
-        sortField if sortField != "id" else "_id",
-        sortOrder.lower() == "asc" and ASCENDING or DESCENDING,
+    result = await pagination.find(
+        storage.db["transactions"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
     )
-    transactions = [
-        await serialize(storage, transaction)
-        for transaction in await result.skip(page * perPage)
-        .limit(perPage)
-        .to_list(None)
+    return [
+        dict(
+            serialize(transaction),
+            cursor=pagination.encode_cursor(transaction, sortField),
+        )
+        for transaction in result
     ]
-    return transactions
+
+
+async def get_all_page(
+    storage: StorageService,
+    page: int = 0,
+    perPage: int = 25,
+    sortField: str = "id",
+    sortOrder: str = "asc",
+    filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    estimate: bool = False,
+) -> dict:
+    query = await get_query(storage, filter)
+    result, count = await pagination.find_with_count(
+        storage.db["transactions"],
+        query,
+        projection,
+        page=page,
+        perPage=perPage,
+        sortField=sortField,
+        sortOrder=sortOrder,
+        after=after,
+        before=before,
+        estimate=estimate,
+    )
+    return {
+        "rows": [
+            dict(
+                serialize(transaction),
+                cursor=pagination.encode_cursor(transaction, sortField),
+            )
+            for transaction in result
+        ],
+        "count": count,
+    }
 
 
 async def get_all_meta(
@@ -163,45 +218,237 @@ async def get_all_meta(
     return {"count": result}
 
 
-async def upsert(storage: StorageService, transaction: dict) -> Optional[dict]:
-    transaction = await process(storage, transaction)
-    result = await storage.db["transactions"].find_one_and_update(
+def get_upsert_query(transaction: dict) -> dict:
+    return (
         {"_id": transaction.get("id")}
         if transaction.get("id")
         else {
             "tenant": transaction.get("tenant"),
             "transaction_tag": transaction.get("transaction_tag"),
             "account_tag": transaction.get("account_tag"),
-        },
-        {
-            "$setOnInsert": {"_id": transaction.get("id") or str(uuid4())},
-            "$set": storage.filter_dict(
-                {
-                    "tenant": transaction.get("tenant"),
-                    "transaction_tag": transaction.get("transaction_tag"),
-                    "account_tag": transaction.get("account_tag"),
-                    "source": transaction.get("source"),
-                    "source_ip": transaction.get("source_ip"),
-                    "carrier_ip": transaction.get("carrier_ip"),
-                    "destination": transaction.get("destination"),
-                    "primary": bool(transaction.get("primary")),
-                    "inbound": bool(transaction.get("inbound")),
-                    "tags": transaction.get("tags"),
-                    "authorized": transaction.get("authorized"),
-                    "unauthorized_reason": transaction.get("unauthorized_reason"),
-                    "destination_rate": transaction.get("destination_rate"),
-                    "timestamp_auth": transaction.get("timestamp_auth"),
-                    "timestamp_begin": transaction.get("timestamp_begin"),
-                    "timestamp_end": transaction.get("timestamp_end"),
-                    "duration": transaction.get("duration"),
-                    "fee": transaction.get("fee"),
-                }
+        }
+    )
+
+
+def get_transaction_id(transaction: dict) -> str:
+    """
+    Return the id of a new transaction, derived from its upsert key so that
+    the id of a transaction recorded behind is known before it is written.
+    """
+    if transaction.get("id"):
+        return transaction["id"]
+    if not transaction.get("transaction_tag"):
+        return str(uuid4())
+    return str(
+        uuid5(
+            TRANSACTION_ID_NAMESPACE,
+            repr(
+                (
+                    transaction.get("tenant"),
+                    transaction["transaction_tag"],
+                    transaction.get("account_tag"),
+                )
             ),
-        },
+        )
+    )
+
+
+def get_upsert_update(storage: StorageService, transaction: dict) -> dict:
+    return {
+        "$setOnInsert": {"_id": get_transaction_id(transaction)},
+        "$set": storage.filter_dict(
+            {
+                "tenant": transaction.get("tenant"),
+                "transaction_tag": transaction.get("transaction_tag"),
+                "account_tag": transaction.get("account_tag"),
+                "source": transaction.get("source"),
+                "source_ip": transaction.get("source_ip"),
+                "carrier_ip": transaction.get("carrier_ip"),
+                "destination": transaction.get("destination"),
+                "primary": bool(transaction.get("primary")),
+                "inbound": bool(transaction.get("inbound")),
+                "tags": transaction.get("tags"),
+                "authorized": transaction.get("authorized"),
+                "unauthorized_reason": transaction.get("unauthorized_reason"),
+                "destination_rate": transaction.get("destination_rate"),
+                "timestamp_auth": transaction.get("timestamp_auth"),
+                "timestamp_begin": transaction.get("timestamp_begin"),
+                "timestamp_end": transaction.get("timestamp_end"),
+                "duration": transaction.get("duration"),
+                "fee": transaction.get("fee"),
+                "search_keys": search.get_complete_search_keys(
+                    transaction, SEARCH_FIELDS
+                ),
+            }
+        ),
+    }
+
+
+async def upsert(
+    storage: StorageService,
+    transaction: dict,
+    loaders: Optional[Loaders] = None,
+    validate: bool = True,
+) -> Optional[dict]:
+    if validate:
+        loaders = loaders or Loaders(storage)
+        transaction = await process(storage, transaction, loaders)
+    result = await storage.db["transactions"].find_one_and_update(
+        get_upsert_query(transaction),
+        get_upsert_update(storage, transaction),
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return await serialize(storage, result)
+    result = await search.update_search_keys(
+        storage.db["transactions"], result, SEARCH_FIELDS
+    )
+    return serialize(result)
+
+
+async def record(storage: StorageService, transaction: dict) -> dict:
+    """
+    Save a transaction without validating it, through the write-behind
+    buffer when it is enabled: the returned transaction may not be written
+    yet in that case, and its id is the one derived from its key, which the
+    transactions inserted before the ids were derived do not have.
+    """
+    if storage.write_buffer is None:
+        return await upsert(storage, transaction, validate=False)
+    update = get_upsert_update(storage, transaction)
+    await storage.write_buffer.write(
+        "transactions", get_upsert_query(transaction), update
+    )
+    return serialize(dict(update["$set"], _id=update["$setOnInsert"]["_id"]))
+
+
+async def find_existing_keys(
+    storage: StorageService, collection: str, field: str, keys: Set[Tuple[str, str]]
+) -> Set[Tuple[str, str]]:
+    """
+    Return which of the (tenant, value) keys exist in the collection, with a
+    single query for all of them.
+    """
+    values: Dict[str, Set[str]] = {}
+    for tenant, value in keys:
+        values.setdefault(tenant, set()).add(value)
+    if not values:
+        return set()
+    documents = (
+        await storage.db[collection]
+        .find(
+            {
+                "$or": [
+                    {"tenant": tenant, field: {"$in": list(tenant_values)}}
+                    for tenant, tenant_values in values.items()
+                ]
+            },
+            {"_id": 0, "tenant": 1, field: 1},
+        )
+        .to_list(None)
+    )
+    return {(document["tenant"], document[field]) for document in documents}
+
+
+async def validate_many(
+    storage: StorageService, transactions: List[dict]
+) -> List[Optional[str]]:
+    """
+    Return the validation error of each transaction, or None if it is valid,
+    looking up the referenced accounts and invoices with one query each.
+    """
+    accounts = await find_existing_keys(
+        storage,
+        "accounts",
+        "account_tag",
+        {
+            (transaction.get("tenant"), transaction["account_tag"])
+            for transaction in transactions
+            if transaction.get("account_tag")
+        },
+    )
+    invoices = await find_existing_keys(
+        storage,
+        "invoices",
+        "invoice_number",
+        {
+            (transaction.get("tenant"), transaction["invoice_number"])
+            for transaction in transactions
+            if transaction.get("invoice_number")
+        },
+    )
+    errors: List[Optional[str]] = []
+    for transaction in transactions:
+        tenant = transaction.get("tenant")
+        error = None
+        if not transaction.get("id") and not (
+            tenant
+            and transaction.get("transaction_tag")
+            and transaction.get("account_tag")
+        ):
+            error = "Provide either the id or tenant, transaction_tag and account_tag!"
+        elif (
+            transaction.get("account_tag")
+            and (tenant, transaction["account_tag"]) not in accounts
+        ):
+            error = "Account with id = %s not found in tenant %s!" % (
+                transaction["account_tag"],
+                tenant,
+            )
+        elif (
+            transaction.get("invoice_number")
+            and (tenant, transaction["invoice_number"]) not in invoices
+        ):
+            error = "Invoice with number = %s not found in tenant %s!" % (
+                transaction["invoice_number"],
+                tenant,
+            )
+        errors.append(error)
+    return errors
+
+
+async def upsert_many(
+    storage: StorageService, transactions: List[dict]
+) -> List[Optional[str]]:
+    """
+    Validate and upsert a batch of transactions with an unordered bulk
+    write, returning the error of each transaction or None if it was saved.
+    """
+    errors = await validate_many(storage, transactions)
+    # the search fields of the transactions updated by id without all of them
+    incomplete = [
+        transaction["id"]
+        for transaction, error in zip(transactions, errors)
+        if error is None
+        and transaction.get("id")
+        and search.get_complete_search_keys(transaction, SEARCH_FIELDS) is None
+    ]
+    stored = {}
+    if incomplete:
+        async for document in storage.db["transactions"].find(
+            {"_id": {"$in": incomplete}}, {field: 1 for field in SEARCH_FIELDS}
+        ):
+            stored[document["_id"]] = document
+    requests = []
+    indexes = []
+    for index, (transaction, error) in enumerate(zip(transactions, errors)):
+        if error is None:
+            update = get_upsert_update(storage, transaction)
+            if "search_keys" not in update["$set"]:
+                update["$set"]["search_keys"] = search.get_search_keys(
+                    dict(stored.get(transaction.get("id")) or {}, **update["$set"]),
+                    SEARCH_FIELDS,
+                )
+            requests.append(
+                UpdateOne(get_upsert_query(transaction), update, upsert=True)
+            )
+            indexes.append(index)
+    if requests:
+        try:
+            await storage.db["transactions"].bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                errors[indexes[write_error["index"]]] = write_error["errmsg"]
+    return errors
 
 
 async def delete(
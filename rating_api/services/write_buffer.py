@@ -0,0 +1,171 @@
+import asyncio
+import logging
+
+from typing import Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase  # type: ignore
+from pymongo import UpdateOne  # type: ignore
+from pymongo.errors import BulkWriteError  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer(object):
+    """
+    WriteBuffer acknowledges upserts immediately and writes them behind,
+    coalesced by filter into unordered bulk writes, when flush_size upserts
+    are pending or every flush_interval seconds. Writers wait when max_size
+    upserts are buffered or being written. The upserts of a failed write
+    are buffered again and retried with an exponential backoff, unless the
+    server rejected them; on close, they are retried close_retries times.
+    The upserts written after close has started are written through.
+    """
+
+    def __init__(
+        self,
+        flush_size: int = 1000,
+        flush_interval: float = 1.0,
+        max_size: int = 10000,
+        retry_interval: float = 0.5,
+        max_retry_interval: float = 30.0,
+        close_retries: int = 5,
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.close_retries = close_retries
+        self.failures = 0
+        self._requests: Dict[Tuple[str, tuple], UpdateOne] = {}
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._closing = False
+        self._space = asyncio.Semaphore(self.max_size)
+        self._flush = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def write(self, collection: str, filter: dict, update: dict):
+        key = (collection, tuple(sorted(filter.items())))
+        if self._closing:
+            # would not be flushed anymore, the pending upsert of the same
+            # document is superseded
+            async with self._lock:
+                if self._requests.pop(key, None) is not None:
+                    self._space.release()
+                await self._db[collection].update_one(filter, update, upsert=True)
+            return
+        if key not in self._requests:
+            await self._space.acquire()
+            if key in self._requests:
+                self._space.release()
+        # a previous upsert of the same document not written yet is replaced
+        self._requests[key] = UpdateOne(filter, update, upsert=True)
+        if len(self._requests) >= self.flush_size:
+            self._flush.set()
+
+    def _retry(self, key: Tuple[str, tuple], request: UpdateOne):
+        if key in self._requests:
+            # superseded by a newer upsert, which holds its own permit
+            self._space.release()
+        else:
+            self._requests[key] = request
+
+    async def flush(self) -> bool:
+        """
+        Write the buffered upserts, returning False if some of them have to
+        be retried.
+        """
+        async with self._lock:
+            requests, self._requests = self._requests, {}
+            collections: Dict[str, list] = {}
+            for key, request in requests.items():
+                collections.setdefault(key[0], []).append((key, request))
+            ok = True
+            for collection, items in collections.items():
+                try:
+                    await self._db[collection].bulk_write(
+                        [request for _, request in items], ordered=False
+                    )
+                except BulkWriteError as e:
+                    # the rejected upserts would fail again, the others
+                    # were written
+                    logger.error(
+                        "Write-behind of %d documents into %s rejected: %s",
+                        len(e.details.get("writeErrors", [])),
+                        collection,
+                        e.details.get("writeErrors"),
+                    )
+                    if e.details.get("writeConcernErrors"):
+                        ok = False
+                        for key, request in items:
+                            self._retry(key, request)
+                        continue
+                except Exception:
+                    logger.exception(
+                        "Write-behind of %d documents into %s failed, retrying",
+                        len(items),
+                        collection,
+                    )
+                    ok = False
+                    for key, request in items:
+                        self._retry(key, request)
+                    continue
+                for _ in items:
+                    self._space.release()
+            return ok
+
+    async def _run(self):
+        retries = 0
+        while not self._closing:
+            try:
+                if retries:
+                    # writes filling the buffer do not shorten the backoff
+                    await asyncio.wait_for(
+                        self._stop.wait(),
+                        min(
+                            self.max_retry_interval,
+                            self.retry_interval * 2 ** (retries - 1),
+                        ),
+                    )
+                else:
+                    await asyncio.wait_for(self._flush.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush.clear()
+            if self._closing or not self._requests:
+                continue
+            try:
+                ok = await self.flush()
+            except Exception:
+                logger.exception("Write-behind failed")
+                ok = False
+            if ok:
+                retries = 0
+            else:
+                self.failures += 1
+                retries += 1
+
+    async def close(self):
+        if self._task is not None:
+            self._closing = True
+            self._flush.set()
+            self._stop.set()
+            await self._task
+            self._task = None
+        for retry in range(self.close_retries):
+            if not self._requests or await self.flush():
+                return
+            await asyncio.sleep(
+                min(self.max_retry_interval, self.retry_interval * 2**retry)
+            )
+        if self._requests:
+            logger.error(
+                "Write-behind of %d documents abandoned on close", len(self._requests)
+            )
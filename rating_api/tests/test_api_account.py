@@ -247,6 +247,55 @@ query {
     assert response.json()["data"] == expected
 
 
+def test_api_get_account_balance_without_joined_fields(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "type": "PREPAID",
+            "balance": 100,
+            "customer_tag": "MISSING",
+            "linked_accounts": ["MISSING"],
+        }
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    Account(tenant: "default", account_tag: "1000") {
+        balance
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == {"Account": {"balance": 100}}
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    Account(tenant: "default", account_tag: "1000") {
+        balance
+        customer {
+            id
+        }
+        linked_accounts {
+            account_tag
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {"Account": {"balance": 100, "customer": None, "linked_accounts": []}}
+    assert response.json()["data"] == expected
+
+
 def test_api_get_account_destination_rate_and_least_cost_routing(app, client):
     app.db.accounts.insert_one(
         {
@@ -370,6 +419,100 @@ query {
     assert response.json()["data"] == expected
 
 
+def test_api_get_account_destination_rate_longest_prefix(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 100,
+            "pricelist_tags": ["ITALY", "ANTIFRAUD"],
+        }
+    )
+    app.db.carriers.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "carrier_tag": "CARRIER_1",
+            "active": True,
+        }
+    )
+    app.db.pricelists.insert_many(
+        [
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+                "tenant": "default",
+                "pricelist_tag": "ITALY",
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+                "tenant": "default",
+                "pricelist_tag": "ANTIFRAUD",
+            },
+        ]
+    )
+    app.db.pricelist_rates.insert_many(
+        [
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+                "tenant": "default",
+                "pricelist_tag": "ITALY",
+                "carrier_tag": "CARRIER_1",
+                "prefix": "39",
+                "rate": 180,
+                "active": True,
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+                "tenant": "default",
+                "pricelist_tag": "ANTIFRAUD",
+                "carrier_tag": "CARRIER_1",
+                "prefix": "39040",
+                "rate": 240,
+                "active": True,
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b26",
+                "tenant": "default",
+                "pricelist_tag": "ITALY",
+                "carrier_tag": "CARRIER_1",
+                "prefix": "390401",
+                "rate": 300,
+                "active": False,
+            },
+        ]
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    Account(id: "469f8e15-f0a2-4f7f-92eb-c52d2d491b24") {
+        destination_rate(destination: "390401234567") {
+            id
+            prefix
+            rate
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "Account": {
+            "destination_rate": {
+                "id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+                "prefix": "39040",
+                "rate": 240,
+            }
+        }
+    }
+    assert response.json()["data"] == expected
+
+
 def test_api_get_account_by_tag(app, client):
     app.db.accounts.insert_one(
         {
@@ -686,3 +686,495 @@ mutation {
     assert response.status_code == 200
     expected = {"rollbackAccountTransaction": {"ok": False}}
     assert response.json()["data"] == expected
+
+
+def _begin_account_transaction(client, transaction_tag, inbound="false"):
+    return client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    beginAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction: {
+        transaction_tag: "%s",
+        source: "39040123123",
+        destination: "393292166164",
+        inbound: %s,
+        timestamp_begin: "20190205T200000Z"
+    }
+) {
+    ok
+    reason
+}
+}"""
+            % (transaction_tag, inbound)
+        },
+    )
+
+
+def test_api_begin_account_transaction_limits(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 100,
+            "max_concurrent_transactions": 2,
+            "max_outbound_transactions": 1,
+        }
+    )
+    #
+    response = _begin_account_transaction(client, "100")
+    assert response.status_code == 200
+    expected = {"beginAccountTransaction": {"ok": True, "reason": None}}
+    assert response.json()["data"] == expected
+    # beginning the same transaction again is idempotent
+    response = _begin_account_transaction(client, "100")
+    assert response.status_code == 200
+    expected = {"beginAccountTransaction": {"ok": True, "reason": None}}
+    assert response.json()["data"] == expected
+    #
+    response = _begin_account_transaction(client, "101")
+    assert response.status_code == 200
+    expected = {
+        "beginAccountTransaction": {
+            "ok": False,
+            "reason": "MAX_OUTBOUND_TRANSACTIONS",
+        }
+    }
+    assert response.json()["data"] == expected
+    #
+    response = _begin_account_transaction(client, "102", inbound="true")
+    assert response.status_code == 200
+    expected = {"beginAccountTransaction": {"ok": True, "reason": None}}
+    assert response.json()["data"] == expected
+    #
+    response = _begin_account_transaction(client, "103", inbound="true")
+    assert response.status_code == 200
+    expected = {
+        "beginAccountTransaction": {
+            "ok": False,
+            "reason": "MAX_CONCURRENT_TRANSACTIONS",
+        }
+    }
+    assert response.json()["data"] == expected
+    #
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert [
+        transaction["transaction_tag"]
+        for transaction in account["running_transactions"]
+    ] == ["100", "102"]
+
+
+def test_api_begin_account_transaction_rejected(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 0,
+        }
+    )
+    #
+    response = _begin_account_transaction(client, "100")
+    assert response.status_code == 200
+    expected = {
+        "beginAccountTransaction": {"ok": False, "reason": "INSUFFICIENT_BALANCE"}
+    }
+    assert response.json()["data"] == expected
+    #
+    app.db.accounts.update_one(
+        {"account_tag": "1000"}, {"$set": {"balance": 100, "active": False}}
+    )
+    response = _begin_account_transaction(client, "100")
+    assert response.status_code == 200
+    expected = {"beginAccountTransaction": {"ok": False, "reason": "ACCOUNT_INACTIVE"}}
+    assert response.json()["data"] == expected
+    #
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert "running_transactions" not in account
+
+
+def test_api_authorize_account_transaction(app, client):
+    app.db.pricelists.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "name": "pricelist",
+            "currency": "EUR",
+        }
+    )
+    app.db.carriers.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "carrier_tag": "TESTS_C1",
+            "host": "carriers.canyan.io",
+            "port": 5061,
+            "protocol": "TCP",
+            "active": True,
+        }
+    )
+    app.db.pricelist_rates.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "carrier_tag": "TESTS_C1",
+            "prefix": "39",
+            "connect_fee": 10,
+            "rate": 180,
+            "rate_increment": 60,
+            "interval_start": 0,
+            "active": True,
+        }
+    )
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 100,
+            "pricelist_tags": ["TESTS_P1"],
+        }
+    )
+    #
+    query = """
+mutation {
+    authorizeAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction: {
+        transaction_tag: "100",
+        source: "39040123123",
+        destination: "%s",
+        timestamp_begin: "20190205T200000Z"
+    }
+) {
+    ok
+    reason
+    account {
+        account_tag
+        balance
+    }
+    destination_rate {
+        prefix
+        rate
+    }
+    least_cost_routing {
+        carrier_tag
+    }
+    transaction {
+        transaction_tag
+        in_progress
+        destination_rate {
+            pricelist_tag
+            carrier_tag
+            prefix
+            connect_fee
+            rate
+        }
+    }
+}
+}"""
+    response = client.post("/graphql", json={"query": query % "393292166164"})
+    assert response.status_code == 200
+    expected = {
+        "authorizeAccountTransaction": {
+            "ok": True,
+            "reason": None,
+            "account": {"account_tag": "1000", "balance": 100},
+            "destination_rate": {"prefix": "39", "rate": 180},
+            "least_cost_routing": [{"carrier_tag": "TESTS_C1"}],
+            "transaction": {
+                "transaction_tag": "100",
+                "in_progress": True,
+                "destination_rate": {
+                    "pricelist_tag": "TESTS_P1",
+                    "carrier_tag": "TESTS_C1",
+                    "prefix": "39",
+                    "connect_fee": 10,
+                    "rate": 180,
+                },
+            },
+        }
+    }
+    assert response.json()["data"] == expected
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert len(account["running_transactions"]) == 1
+    #
+    response = client.post("/graphql", json={"query": query % "4420123123"})
+    assert response.status_code == 200
+    expected = {
+        "authorizeAccountTransaction": {
+            "ok": False,
+            "reason": "DESTINATION_NOT_RATED",
+            "account": {"account_tag": "1000", "balance": 100},
+            "destination_rate": None,
+            "least_cost_routing": [],
+            "transaction": None,
+        }
+    }
+    assert response.json()["data"] == expected
+
+
+def test_api_authorize_account_transaction_not_found(client):
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    authorizeAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction: {
+        transaction_tag: "100",
+        destination: "393292166164",
+        timestamp_begin: "20190205T200000Z"
+    }
+) {
+    ok
+    reason
+}
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {"authorizeAccountTransaction": {"ok": None, "reason": None}}
+    assert response.json()["data"] == expected
+
+
+def test_api_settle_account_transaction(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 100,
+            "running_transactions": [
+                {
+                    "destination_rate": {
+                        "pricelist_tag": "39329_ITALY_MOBILE_WIND_0",
+                        "prefix": "39329",
+                        "connect_fee": 5,
+                        "rate": 12,
+                        "rate_increment": 30,
+                        "interval_start": 60,
+                        "carrier_tag": "TELECOM",
+                    },
+                    "transaction_tag": "100",
+                    "source": "39040123123",
+                    "destination": "393292166164",
+                    "in_progress": True,
+                    "timestamp_begin": datetime(2019, 2, 5, 20, 0, 0),
+                    "timestamp_end": None,
+                },
+            ],
+        }
+    )
+    #
+    query = """
+mutation {
+    settleAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction_tag:"100",
+        timestamp_end: "20190205T200131Z"
+    ) {
+        ok
+        duration
+        fee
+    }
+}"""
+    response = client.post("/graphql", json={"query": query})
+    assert response.status_code == 200
+    # 91 seconds are billed as 60 + 30 + 30 seconds at 12 per minute
+    expected = {"settleAccountTransaction": {"ok": True, "duration": 91, "fee": 29}}
+    assert response.json()["data"] == expected
+    #
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["balance"] == 71
+    assert account["running_transactions"] == []
+    transaction = app.db.transactions.find_one({"transaction_tag": "100"})
+    assert transaction["account_tag"] == "1000"
+    assert transaction["destination"] == "393292166164"
+    assert transaction["duration"] == 91
+    assert transaction["fee"] == 29
+    assert transaction["timestamp_end"] == datetime(2019, 2, 5, 20, 1, 31)
+    # the transaction is settled only once
+    response = client.post("/graphql", json={"query": query})
+    assert response.status_code == 200
+    expected = {
+        "settleAccountTransaction": {"ok": False, "duration": None, "fee": None}
+    }
+    assert response.json()["data"] == expected
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["balance"] == 71
+
+
+def test_api_commit_and_rollback_account_transactions(app, client):
+    for account_tag, transaction_tags in (("1000", ("100", "101")), ("1001", ("102",))):
+        app.db.accounts.insert_one(
+            {
+                "_id": account_tag,
+                "tenant": "default",
+                "account_tag": account_tag,
+                "name": "Fabio Tranchitella",
+                "type": "PREPAID",
+                "balance": 100,
+                "running_transactions": [
+                    {
+                        "transaction_tag": transaction_tag,
+                        "destination": "393292166164",
+                        "in_progress": False,
+                        "timestamp_begin": datetime(2019, 2, 5, 20, 0, 0),
+                        "timestamp_end": datetime(2019, 2, 5, 20, 0, 10),
+                    }
+                    for transaction_tag in transaction_tags
+                ],
+            }
+        )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    commitAccountTransactions(
+        tenant: "default",
+        transactions: [
+            {account_tag: "1000", transaction_tag: "100", fee: 10},
+            {account_tag: "1000", transaction_tag: "101", fee: 20},
+            {account_tag: "1001", transaction_tag: "103", fee: 30},
+        ]
+    ) {
+        results {
+            account_tag
+            transaction_tag
+            ok
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "commitAccountTransactions": {
+            "results": [
+                {"account_tag": "1000", "transaction_tag": "100", "ok": True},
+                {"account_tag": "1000", "transaction_tag": "101", "ok": True},
+                {"account_tag": "1001", "transaction_tag": "103", "ok": False},
+            ]
+        }
+    }
+    assert response.json()["data"] == expected
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["balance"] == 70
+    assert account["running_transactions"] == []
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    rollbackAccountTransactions(
+        tenant: "default",
+        transactions: [
+            {account_tag: "1000", transaction_tag: "100"},
+            {account_tag: "1001", transaction_tag: "102"},
+        ]
+    ) {
+        results {
+            account_tag
+            transaction_tag
+            ok
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "rollbackAccountTransactions": {
+            "results": [
+                {"account_tag": "1000", "transaction_tag": "100", "ok": False},
+                {"account_tag": "1001", "transaction_tag": "102", "ok": True},
+            ]
+        }
+    }
+    assert response.json()["data"] == expected
+    account = app.db.accounts.find_one({"account_tag": "1001"})
+    assert account["balance"] == 100
+    assert account["running_transactions"] == []
+
+
+def test_commit_account_transactions_finished_meanwhile(app, monkeypatch):
+    for account_tag, transaction_tags in (("1000", ("100", "101")), ("2000", ("200",))):
+        app.db.accounts.insert_one(
+            {
+                "_id": account_tag,
+                "tenant": "default",
+                "account_tag": account_tag,
+                "name": "Fabio Tranchitella",
+                "type": "PREPAID",
+                "balance": 100,
+                "running_transactions": [
+                    {
+                        "transaction_tag": transaction_tag,
+                        "destination": "393292166164",
+                        "in_progress": False,
+                        "timestamp_begin": datetime(2019, 2, 5, 20, 0, 0),
+                        "timestamp_end": datetime(2019, 2, 5, 20, 0, 10),
+                    }
+                    for transaction_tag in transaction_tags
+                ],
+            }
+        )
+    #
+    from conftest import MONGODB_URI, MONGODB_DB, run_synchronously
+    from rating_api.services import account as account_service
+    from rating_api.services.storage import StorageService
+
+    update_one = account_service.UpdateOne
+
+    def finished_meanwhile(query, update):
+        if query["account_tag"] == "2000":
+            # another call finishes the transaction before this one
+            app.db.accounts.update_one(
+                {"_id": "2000"},
+                {"$pull": {"running_transactions": {"transaction_tag": "200"}}},
+            )
+        return update_one(query, update)
+
+    monkeypatch.setattr(account_service, "UpdateOne", finished_meanwhile)
+
+    async def commit():
+        storage = StorageService(MONGODB_URI, MONGODB_DB)
+        await storage.connect()
+        try:
+            return await account_service.commit_transactions(
+                storage,
+                "default",
+                [
+                    {"account_tag": "1000", "transaction_tag": "100", "fee": 10},
+                    {"account_tag": "1000", "transaction_tag": "101", "fee": 20},
+                    {"account_tag": "2000", "transaction_tag": "200", "fee": 30},
+                ],
+            )
+        finally:
+            await storage.close()
+
+    assert run_synchronously(commit()) == [True, True, False]
+    assert app.db.accounts.find_one({"_id": "1000"})["balance"] == 70
+    assert app.db.accounts.find_one({"_id": "2000"})["balance"] == 100
@@ -211,6 +211,115 @@ query {
     assert response.json()["data"] == expected
 
 
+def test_api_get_list_of_carriers_with_cursor(app, client):
+    app.db.carriers.insert_many(
+        [
+            {"_id": "c%d" % i, "tenant": "default", "carrier_tag": "TESTS_C%d" % i}
+            for i in range(5)
+        ]
+    )
+    #
+    query = """
+query ($after: String, $before: String) {
+    allCarriers(sortField: "carrier_tag", perPage: 2, after: $after, before: $before) {
+        carrier_tag
+        cursor
+    }
+}"""
+
+    def get_page(**variables):
+        response = client.post(
+            "/graphql", json={"query": query, "variables": variables}
+        )
+        assert response.status_code == 200
+        return response.json()["data"]["allCarriers"]
+
+    page = get_page()
+    assert [row["carrier_tag"] for row in page] == ["TESTS_C0", "TESTS_C1"]
+    page = get_page(after=page[-1]["cursor"])
+    assert [row["carrier_tag"] for row in page] == ["TESTS_C2", "TESTS_C3"]
+    page = get_page(after=page[-1]["cursor"])
+    assert [row["carrier_tag"] for row in page] == ["TESTS_C4"]
+    page = get_page(before=page[0]["cursor"])
+    assert [row["carrier_tag"] for row in page] == ["TESTS_C2", "TESTS_C3"]
+
+
+def test_api_get_page_of_carriers(app, client):
+    app.db.carriers.insert_many(
+        [
+            {"_id": "c%d" % i, "tenant": "default", "carrier_tag": "TESTS_C%d" % i}
+            for i in range(5)
+        ]
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    page:allCarriersPage(sortField: "carrier_tag", page: 1, perPage: 2) {
+        rows {
+            carrier_tag
+        }
+        count
+    }
+    estimated:allCarriersPage(perPage: 1, estimate: true) {
+        count
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "page": {
+            "rows": [{"carrier_tag": "TESTS_C2"}, {"carrier_tag": "TESTS_C3"}],
+            "count": 5,
+        },
+        "estimated": {"count": 5},
+    }
+    assert response.json()["data"] == expected
+
+
+def test_api_search_carriers(app, client):
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    upsertCarrier(carrier_tag: "TESTS_C1", host: "sip.canyan.io") {
+        id
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    prefix:allCarriers(filter: {q: "SIP.Cany"}) {
+        carrier_tag
+    }
+    tag:allCarriers(filter: {q: "tests_c"}) {
+        carrier_tag
+    }
+    none:allCarriers(filter: {q: "anyan"}) {
+        carrier_tag
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "prefix": [{"carrier_tag": "TESTS_C1"}],
+        "tag": [{"carrier_tag": "TESTS_C1"}],
+        "none": [],
+    }
+    assert response.json()["data"] == expected
+
+
 def test_api_upsert_carrier(app, client):
     app.db.carriers.insert_one(
         {
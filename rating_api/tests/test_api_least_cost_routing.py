@@ -154,3 +154,64 @@ query {
     assert response.status_code == 200
     expected = {"leastCostRouting": []}
     assert response.json()["data"] == expected
+
+
+def test_api_least_cost_routing_sorted_by_rate(app, client):
+    app.db.carriers.insert_many(
+        [
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+                "tenant": "default",
+                "carrier_tag": "TESTS_C1",
+                "active": True,
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+                "tenant": "default",
+                "carrier_tag": "TESTS_C2",
+                "active": True,
+            },
+        ]
+    )
+    app.db.pricelist_rates.insert_many(
+        [
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+                "tenant": "default",
+                "pricelist_tag": "TESTS_P1",
+                "carrier_tag": "TESTS_C1",
+                "prefix": "39",
+                "rate": 180,
+                'active': True,
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+                "tenant": "default",
+                "pricelist_tag": "TESTS_P1",
+                "carrier_tag": "TESTS_C2",
+                "prefix": "3932",
+                "rate": 120,
+                'active': True,
+            },
+        ]
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    leastCostRouting(
+        tenant: "default",
+        destination: "393292166164"
+    ) {
+        carrier_tag
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "leastCostRouting": [{"carrier_tag": "TESTS_C2"}, {"carrier_tag": "TESTS_C1"}]
+    }
+    assert response.json()["data"] == expected
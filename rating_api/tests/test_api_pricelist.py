@@ -486,3 +486,159 @@ mutation {
         },
     )
     assert response.status_code == 400
+
+
+def _get_destination_rate(client):
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    Account(tenant: "default", account_tag: "1000") {
+        destination_rate(destination: "393292166164") {
+            prefix
+            rate
+            version
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    return response.json()["data"]["Account"]["destination_rate"]
+
+
+def test_api_activate_pricelist_version(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 100,
+            "pricelist_tags": ["TESTS_P1"],
+        }
+    )
+    app.db.carriers.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "carrier_tag": "TESTS_C1",
+            "active": True,
+        }
+    )
+    app.db.pricelists.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "name": "pricelist",
+            "currency": "EUR",
+        }
+    )
+    app.db.pricelist_rates.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "carrier_tag": "TESTS_C1",
+            "prefix": "39",
+            "rate": 180,
+            "active": True,
+        }
+    )
+    # the staged rates are not used
+    response = client.post(
+        "/pricelist_rates/import?pricelist_tag=TESTS_P1&carrier_tag=TESTS_C1&version=2",
+        data=b"prefix,rate\n39,120\n",
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 1, "errors": [], "error_count": 0}
+    assert _get_destination_rate(client) == {
+        "prefix": "39",
+        "rate": 180,
+        "version": None,
+    }
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    activatePricelistVersion(pricelist_tag: "TESTS_P1", version: "2") {
+        pricelist_tag
+        active_version
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "activatePricelistVersion": {"pricelist_tag": "TESTS_P1", "active_version": "2"}
+    }
+    assert response.json()["data"] == expected
+    assert _get_destination_rate(client) == {
+        "prefix": "39",
+        "rate": 120,
+        "version": "2",
+    }
+    pricelist = app.db.pricelists.find_one({"pricelist_tag": "TESTS_P1"})
+    assert pricelist["retired_versions"] == [None]
+    # the rates of a version which was never loaded cannot be activated
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    activatePricelistVersion(pricelist_tag: "TESTS_P1", version: "3") {
+        active_version
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["errors"]
+    # the active version cannot be deleted
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    deletePricelistVersion(pricelist_tag: "TESTS_P1", version: "2") {
+        count
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == {"deletePricelistVersion": {"count": 0}}
+    assert app.db.pricelist_rates.count_documents({}) == 2
+    # a version being deleted cannot be activated
+    app.db.pricelist_rates.insert_one(
+        {
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "carrier_tag": "TESTS_C1",
+            "prefix": "39",
+            "rate": 100,
+            "active": True,
+            "version": "3",
+        }
+    )
+    app.db.pricelists.update_one(
+        {"pricelist_tag": "TESTS_P1"}, {"$set": {"deleting_versions": ["3"]}}
+    )
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    activatePricelistVersion(pricelist_tag: "TESTS_P1", version: "3") {
+        active_version
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["errors"]
@@ -899,3 +899,199 @@ mutation {
         },
     )
     assert response.status_code == 400
+
+
+def test_api_import_pricelist_rates(app, client):
+    app.db.pricelists.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "name": "pricelist",
+            "currency": "EUR",
+        }
+    )
+    app.db.carriers.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "carrier_tag": "TESTS_C1",
+            "active": True,
+        }
+    )
+    #
+    deck = b"""prefix,carrier_tag,rate,connect_fee,description
+39,,180,5,Italy
+3932,,240,,Italy mobile
+44,TESTS_C2,100,,UK
+49,,abc,,Germany
+33,,90,,"France,
+fixed"
+"""
+    response = client.post(
+        "/pricelist_rates/import?pricelist_tag=TESTS_P1&carrier_tag=TESTS_C1",
+        data=deck,
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "count": 3,
+        "errors": [
+            {
+                "line": 4,
+                "error": "Carrier with tag = TESTS_C2 not found in tenant default!",
+            },
+            {"line": 5, "error": "Invalid rate: abc"},
+        ],
+        "error_count": 2,
+    }
+    rate = app.db.pricelist_rates.find_one({"prefix": "3932"}, {"_id": 0})
+    assert rate["pricelist_tag"] == "TESTS_P1"
+    assert rate["carrier_tag"] == "TESTS_C1"
+    assert rate["rate"] == 240
+    assert rate["active"] is True
+    rate = app.db.pricelist_rates.find_one({"prefix": "33"})
+    assert rate["description"] == "France,\nfixed"
+    # importing the deck again updates the same rates
+    response = client.post(
+        "/pricelist_rates/import?format=ndjson",
+        data=b'{"pricelist_tag": "TESTS_P1", "carrier_tag": "TESTS_C1", "prefix": "39", "rate": 120}\n',
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 1, "errors": [], "error_count": 0}
+    assert app.db.pricelist_rates.count_documents({}) == 3
+    assert app.db.pricelist_rates.find_one({"prefix": "39"})["rate"] == 120
+
+
+def test_api_export_pricelist_rates(app, client):
+    app.db.pricelist_rates.insert_many(
+        [
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+                "tenant": "default",
+                "pricelist_tag": "TESTS_P1",
+                "carrier_tag": "TESTS_C1",
+                "prefix": "39",
+                "active": True,
+                "rate": 180,
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+                "tenant": "default",
+                "pricelist_tag": "TESTS_P2",
+                "carrier_tag": "TESTS_C1",
+                "prefix": "44",
+                "active": True,
+                "rate": 100,
+                "version": "2",
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b26",
+                "tenant": "default",
+                "pricelist_tag": "TESTS_P2",
+                "carrier_tag": "TESTS_C1",
+                "prefix": "44",
+                "active": True,
+                "rate": 120,
+                "version": "1",
+            },
+        ]
+    )
+    app.db.pricelists.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P2",
+            "active_version": "2",
+        }
+    )
+    #
+    response = client.get("/pricelist_rates/export?pricelist_tag=TESTS_P1")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.split("\n") == [
+        "tenant,pricelist_tag,carrier_tag,prefix,datetime_start,datetime_end,active,connect_fee,rate,rate_increment,interval_start,description",
+        "default,TESTS_P1,TESTS_C1,39,,,true,,180,,,",
+        "",
+    ]
+    #
+    # only the rates of the active versions are exported
+    response = client.get("/pricelist_rates/export?format=ndjson&carrier_tag=TESTS_C1")
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 2
+    assert '"rate": 120' not in response.text
+    #
+    response = client.get(
+        "/pricelist_rates/export?pricelist_id=469f8e15-f0a2-4f7f-92eb-c52d2d491b25"
+    )
+    assert response.status_code == 200
+    assert response.text.split("\n")[1:] == [
+        "default,TESTS_P2,TESTS_C1,44,,,true,,100,,,",
+        "",
+    ]
+    #
+    response = client.get("/pricelist_rates/export?format=xml")
+    assert response.status_code == 422
+
+
+def test_api_rate_destinations(app, client):
+    app.db.pricelists.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "name": "pricelist",
+            "currency": "EUR",
+        }
+    )
+    app.db.pricelist_rates.insert_many(
+        [
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+                "tenant": "default",
+                "pricelist_tag": "TESTS_P1",
+                "carrier_tag": "TESTS_C1",
+                "prefix": "39",
+                "rate": 180,
+                "active": True,
+            },
+            {
+                "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b25",
+                "tenant": "default",
+                "pricelist_tag": "TESTS_P1",
+                "carrier_tag": "TESTS_C1",
+                "prefix": "3932",
+                "rate": 240,
+                "active": True,
+            },
+        ]
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    rateDestinations(
+        tenant: "default",
+        pricelist_tags: ["TESTS_P1"],
+        destinations: ["393292166164", "390612345678", "4930123456", "393292166164"]
+    ) {
+        destination
+        rate {
+            prefix
+            rate
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "rateDestinations": [
+            {"destination": "393292166164", "rate": {"prefix": "3932", "rate": 240}},
+            {"destination": "390612345678", "rate": {"prefix": "39", "rate": 180}},
+            {"destination": "4930123456", "rate": None},
+            {"destination": "393292166164", "rate": {"prefix": "3932", "rate": 240}},
+        ]
+    }
+    assert response.json()["data"] == expected
@@ -0,0 +1,119 @@
+import pytest
+
+from conftest import MONGODB_URI, MONGODB_DB
+
+
+@pytest.fixture(scope="function")
+def config():
+    return dict(
+        mongodb_uri=MONGODB_URI, mongodb_db=MONGODB_DB, rate_cache=True, debug=True
+    )
+
+
+def _get_destination_rate(client):
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    Account(tenant: "default", account_tag: "1000") {
+        destination_rate(destination: "393292166164") {
+            prefix
+            rate
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    return response.json()["data"]["Account"]["destination_rate"]
+
+
+def test_api_rate_cache_destination_rate(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 100,
+            "pricelist_tags": ["ITALY"],
+        }
+    )
+    app.db.carriers.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "carrier_tag": "CARRIER_1",
+            "active": True,
+        }
+    )
+    app.db.pricelists.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "ITALY",
+            "name": "pricelist",
+            "currency": "EUR",
+        }
+    )
+    app.db.pricelist_rates.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "pricelist_tag": "ITALY",
+            "carrier_tag": "CARRIER_1",
+            "prefix": "39",
+            "rate": 180,
+            "active": True,
+        }
+    )
+    #
+    assert _get_destination_rate(client) == {"prefix": "39", "rate": 180}
+    # the cached rate is returned
+    app.db.pricelist_rates.update_one({"prefix": "39"}, {"$set": {"rate": 120}})
+    assert _get_destination_rate(client) == {"prefix": "39", "rate": 180}
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    upsertPricelistRate(
+        tenant: "default",
+        pricelist_tag: "ITALY",
+        carrier_tag: "CARRIER_1",
+        prefix: "39329",
+        rate: 240
+    ) {
+        id
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert _get_destination_rate(client) == {"prefix": "39329", "rate": 240}
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    deletePricelistRate(
+        tenant: "default",
+        pricelist_tag: "ITALY",
+        carrier_tag: "CARRIER_1",
+        prefix: "39329"
+    ) {
+        id
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert _get_destination_rate(client) == {"prefix": "39", "rate": 120}
+    #
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'rating_api_cache_hits{cache="rates"} 1' in response.text
@@ -0,0 +1,360 @@
+import pytest
+
+from conftest import MONGODB_URI, MONGODB_DB
+
+
+@pytest.fixture(scope="function")
+def config():
+    return dict(
+        mongodb_uri=MONGODB_URI,
+        mongodb_db=MONGODB_DB,
+        running_transactions_collection=True,
+        debug=True,
+    )
+
+
+def _insert_account(app):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "Fabio Tranchitella",
+            "type": "PREPAID",
+            "balance": 100,
+            "pricelist_tags": ["ITALY", "ANTIFRAUD"],
+            "tags": ["account", "sample"],
+        }
+    )
+
+
+def _begin_transaction(client):
+    return client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    beginAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction: {
+        transaction_tag: "100",
+        proxy_tag: "1111",
+        source: "39040123123",
+        destination: "393292166164",
+        tags: ["A","B"],
+        timestamp_begin: "20190205T200000Z"
+    }
+) {
+    ok
+}
+}"""
+        },
+    )
+
+
+def _get_account(client):
+    return client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    Account(id: "469f8e15-f0a2-4f7f-92eb-c52d2d491b24") {
+        account_tag
+        balance
+        running_transactions {
+            transaction_tag
+            destination
+            in_progress
+            timestamp_begin
+            timestamp_end
+        }
+    }
+}"""
+        },
+    )
+
+
+def test_api_begin_running_transaction(app, client):
+    _insert_account(app)
+    #
+    response = _begin_transaction(client)
+    assert response.status_code == 200
+    assert response.json()["data"] == {"beginAccountTransaction": {"ok": True}}
+    # beginning the same transaction twice does not count it twice
+    response = _begin_transaction(client)
+    assert response.status_code == 200
+    assert response.json()["data"] == {"beginAccountTransaction": {"ok": True}}
+    #
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["outbound_transactions_in_progress"] == 1
+    assert "running_transactions" not in account
+    assert app.db.running_transactions.count_documents({}) == 1
+    #
+    response = _get_account(client)
+    assert response.status_code == 200
+    expected = {
+        "Account": {
+            "account_tag": "1000",
+            "balance": 100,
+            "running_transactions": [
+                {
+                    "transaction_tag": "100",
+                    "destination": "393292166164",
+                    "in_progress": True,
+                    "timestamp_begin": "2019-02-05T20:00:00",
+                    "timestamp_end": None,
+                }
+            ],
+        }
+    }
+    assert response.json()["data"] == expected
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    allAccounts(filter: {with_running_transactions: true}) {
+        account_tag
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == {"allAccounts": [{"account_tag": "1000"}]}
+
+
+def test_api_begin_running_transaction_not_found(app, client):
+    response = _begin_transaction(client)
+    assert response.status_code == 200
+    assert response.json()["data"] == {"beginAccountTransaction": {"ok": None}}
+    assert app.db.running_transactions.count_documents({}) == 0
+
+
+def test_api_end_and_commit_running_transaction(app, client):
+    _insert_account(app)
+    _begin_transaction(client)
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    endAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction_tag:"100",
+        timestamp_end: "20190205T200010Z"
+    ) {
+        ok
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == {"endAccountTransaction": {"ok": True}}
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["outbound_transactions_in_progress"] == 0
+    #
+    response = _get_account(client)
+    assert response.status_code == 200
+    running_transactions = response.json()["data"]["Account"]["running_transactions"]
+    assert running_transactions == [
+        {
+            "transaction_tag": "100",
+            "destination": "393292166164",
+            "in_progress": False,
+            "timestamp_begin": "2019-02-05T20:00:00",
+            "timestamp_end": "2019-02-05T20:00:10",
+        }
+    ]
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    commitAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction_tag:"100",
+        fee: 10
+    ) {
+        ok
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == {"commitAccountTransaction": {"ok": True}}
+    #
+    response = _get_account(client)
+    assert response.status_code == 200
+    expected = {
+        "Account": {"account_tag": "1000", "balance": 90, "running_transactions": []}
+    }
+    assert response.json()["data"] == expected
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["outbound_transactions_in_progress"] == 0
+
+
+def test_api_rollback_running_transaction(app, client):
+    _insert_account(app)
+    _begin_transaction(client)
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    rollbackAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction_tag:"100"
+    ) {
+        ok
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == {"rollbackAccountTransaction": {"ok": True}}
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["balance"] == 100
+    assert account["outbound_transactions_in_progress"] == 0
+    assert app.db.running_transactions.count_documents({}) == 0
+    # the transaction is gone
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    rollbackAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction_tag:"100"
+    ) {
+        ok
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == {"rollbackAccountTransaction": {"ok": False}}
+
+
+def test_api_settle_running_transaction(app, client):
+    _insert_account(app)
+    _begin_transaction(client)
+    app.db.running_transactions.update_one(
+        {"transaction_tag": "100"},
+        {"$set": {"destination_rate": {"connect_fee": 5, "rate": 60}}},
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    settleAccountTransaction(
+        tenant: "default",
+        account_tag: "1000",
+        transaction_tag:"100",
+        duration: 10
+    ) {
+        ok
+        duration
+        fee
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {"settleAccountTransaction": {"ok": True, "duration": 10, "fee": 15}}
+    assert response.json()["data"] == expected
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["balance"] == 85
+    assert account["outbound_transactions_in_progress"] == 0
+    assert app.db.running_transactions.count_documents({}) == 0
+    assert app.db.transactions.count_documents({"fee": 15}) == 1
+
+
+def test_api_commit_running_transactions(app, client):
+    _insert_account(app)
+    _begin_transaction(client)
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    commitAccountTransactions(
+        tenant: "default",
+        transactions: [
+            {account_tag: "1000", transaction_tag: "100", fee: 10},
+            {account_tag: "1000", transaction_tag: "101", fee: 20},
+        ]
+    ) {
+        results {
+            transaction_tag
+            ok
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "commitAccountTransactions": {
+            "results": [
+                {"transaction_tag": "100", "ok": True},
+                {"transaction_tag": "101", "ok": False},
+            ]
+        }
+    }
+    assert response.json()["data"] == expected
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["balance"] == 90
+    assert account["outbound_transactions_in_progress"] == 0
+    assert app.db.running_transactions.count_documents({}) == 0
+
+
+def test_reconcile_transactions_in_progress(app, client):
+    from conftest import run_synchronously
+    from rating_api.services.running_transaction import reconcile_counters
+    from rating_api.services.storage import StorageService
+
+    _insert_account(app)
+    app.db.accounts.update_one(
+        {"account_tag": "1000"},
+        {
+            "$set": {
+                "inbound_transactions_in_progress": 2,
+                "outbound_transactions_in_progress": 0,
+            }
+        },
+    )
+    app.db.running_transactions.insert_one(
+        {
+            "tenant": "default",
+            "account_tag": "1000",
+            "transaction_tag": "100",
+            "in_progress": True,
+            "inbound": False,
+        }
+    )
+
+    async def reconcile():
+        storage = StorageService(MONGODB_URI, MONGODB_DB)
+        await storage.connect()
+        try:
+            return await reconcile_counters(storage, "default", delay=0)
+        finally:
+            await storage.close()
+
+    assert run_synchronously(reconcile()) == 1
+    account = app.db.accounts.find_one({"account_tag": "1000"})
+    assert account["inbound_transactions_in_progress"] == 0
+    assert account["outbound_transactions_in_progress"] == 1
+    assert run_synchronously(reconcile()) == 0
@@ -686,3 +686,193 @@ mutation {
         },
     )
     assert response.status_code == 400
+
+
+def test_api_get_list_of_transactions_with_relations(app, client):
+    app.db.customers.insert_one(
+        {
+            "_id": "c1",
+            "tenant": "default",
+            "customer_tag": "100",
+            "company_name": "ACME",
+        }
+    )
+    app.db.accounts.insert_one(
+        {
+            "_id": "a1",
+            "tenant": "default",
+            "account_tag": "1000",
+            "customer_tag": "100",
+            "linked_accounts": ["1001"],
+        }
+    )
+    app.db.accounts.insert_one(
+        {"_id": "a2", "tenant": "default", "account_tag": "1001"}
+    )
+    app.db.invoices.insert_one(
+        {
+            "_id": "i1",
+            "tenant": "default",
+            "invoice_number": "2019/001",
+            "customer_tag": "100",
+        }
+    )
+    app.db.transactions.insert_many(
+        [
+            {
+                "_id": "t%d" % i,
+                "tenant": "default",
+                "transaction_tag": str(i),
+                "account_tag": "1000",
+                "invoice_number": "2019/001",
+            }
+            for i in range(5)
+        ]
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+query {
+    allTransactions(sortField: "transaction_tag") {
+        transaction_tag
+        account {
+            account_tag
+            customer_tag
+            linked_accounts {
+                account_tag
+            }
+        }
+        invoice {
+            invoice_number
+            customer {
+                company_name
+            }
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = [
+        {
+            "transaction_tag": str(i),
+            "account": {
+                "account_tag": "1000",
+                "customer_tag": "100",
+                "linked_accounts": [{"account_tag": "1001"}],
+            },
+            "invoice": {
+                "invoice_number": "2019/001",
+                "customer": {"company_name": "ACME"},
+            },
+        }
+        for i in range(5)
+    ]
+    assert response.json()["data"]["allTransactions"] == expected
+
+
+def test_api_upsert_transactions(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "pricelist",
+            "currency": "EUR",
+        }
+    )
+    #
+    response = client.post(
+        "/graphql",
+        json={
+            "query": """
+mutation {
+    upsertTransactions(
+        transactions: [
+            {transaction_tag: "100", account_tag: "1000", fee: 10},
+            {transaction_tag: "101", account_tag: "1001"},
+            {transaction_tag: "102", account_tag: "1000", invoice_number: "1"},
+        ]
+    ) {
+        results {
+            transaction_tag
+            account_tag
+            ok
+            error
+        }
+    }
+}"""
+        },
+    )
+    assert response.status_code == 200
+    expected = {
+        "upsertTransactions": {
+            "results": [
+                {
+                    "transaction_tag": "100",
+                    "account_tag": "1000",
+                    "ok": True,
+                    "error": None,
+                },
+                {
+                    "transaction_tag": "101",
+                    "account_tag": "1001",
+                    "ok": False,
+                    "error": "Account with id = 1001 not found in tenant default!",
+                },
+                {
+                    "transaction_tag": "102",
+                    "account_tag": "1000",
+                    "ok": False,
+                    "error": "Invoice with number = 1 not found in tenant default!",
+                },
+            ]
+        }
+    }
+    assert response.json()["data"] == expected
+    transaction = app.db.transactions.find_one({"transaction_tag": "100"})
+    assert transaction["account_tag"] == "1000"
+    assert transaction["fee"] == 10
+    assert app.db.transactions.count_documents({}) == 1
+
+
+def test_api_import_transactions(app, client):
+    app.db.accounts.insert_one(
+        {
+            "_id": "469f8e15-f0a2-4f7f-92eb-c52d2d491b24",
+            "tenant": "default",
+            "account_tag": "1000",
+            "name": "pricelist",
+            "currency": "EUR",
+        }
+    )
+    #
+    lines = [
+        '{"transaction_tag": "100", "account_tag": "1000", "duration": 10,'
+        ' "timestamp_begin": "2019-02-05T20:00:00Z"}',
+        "",
+        '{"transaction_tag": "101", "account_tag": "1001"}',
+        "not json",
+        '{"transaction_tag": "102", "account_tag": "1000"}',
+    ]
+    response = client.post("/transactions/import", data="\n".join(lines))
+    assert response.status_code == 200
+    result = response.json()
+    assert result["count"] == 2
+    assert [error["line"] for error in result["errors"]] == [3, 4]
+    transaction = app.db.transactions.find_one({"transaction_tag": "100"})
+    assert transaction["tenant"] == "default"
+    assert transaction["duration"] == 10
+    assert transaction["timestamp_begin"] == datetime(2019, 2, 5, 20, 0, 0)
+    assert app.db.transactions.count_documents({}) == 2
+    assert transaction["search_keys"] == ["1", "10", "100", "1000"]
+    # updated by id, the search keys come from the stored transaction
+    response = client.post(
+        "/transactions/import", data='{"id": "%s", "fee": 5}' % transaction["_id"]
+    )
+    assert response.json()["count"] == 1
+    transaction = app.db.transactions.find_one({"transaction_tag": "100"})
+    assert transaction["fee"] == 5
+    assert transaction["search_keys"] == ["1", "10", "100", "1000"]
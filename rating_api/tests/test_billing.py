@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from rating_api.services import billing
+from rating_api.services.billing import compute_fee, compute_fees, get_duration
+
+
+def test_compute_fee():
+    destination_rate = {
+        "connect_fee": 10,
+        "rate": 60,
+        "rate_increment": 6,
+        "interval_start": 30,
+    }
+    # unanswered calls are free
+    assert compute_fee(destination_rate, 0) == 0
+    assert compute_fee(None, 10) == 0
+    # the first interval is always billed
+    assert compute_fee(destination_rate, 1) == 10 + 30
+    assert compute_fee(destination_rate, 30) == 10 + 30
+    # then the call is billed by increments
+    assert compute_fee(destination_rate, 31) == 10 + 36
+    assert compute_fee(destination_rate, 36) == 10 + 36
+    assert compute_fee(destination_rate, 37) == 10 + 42
+    # per second billing rounds the fee up
+    assert compute_fee({"rate": 100}, 1) == 2
+    assert compute_fee({"rate": 100}, 60) == 100
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_compute_fees(monkeypatch, vectorized):
+    # numpy is in the test requirements, both paths must run
+    if not vectorized:
+        monkeypatch.setattr(billing, "numpy", None)
+    assert (billing.numpy is not None) == vectorized
+    destination_rates = [
+        {"connect_fee": 10, "rate": 60, "rate_increment": 6, "interval_start": 30},
+        {"rate": 100},
+        {"connect_fee": 5, "rate": 7, "rate_increment": 0},
+        None,
+    ]
+    durations = [0, 1, 30, 31, 37, 59, 60, 61, 3601]
+    rates = [rate for rate in destination_rates for _ in durations]
+    durations = durations * len(destination_rates)
+    assert compute_fees(rates, durations) == [
+        compute_fee(rate, duration) for rate, duration in zip(rates, durations)
+    ]
+    assert compute_fees([], []) == []
+
+
+def test_get_duration():
+    timestamp_begin = datetime(2019, 2, 5, 20, 0, 0)
+    assert get_duration(timestamp_begin, timestamp_begin) == 0
+    assert get_duration(timestamp_begin, timestamp_begin - timedelta(seconds=5)) == 0
+    assert (
+        get_duration(timestamp_begin, timestamp_begin + timedelta(milliseconds=10200))
+        == 11
+    )
+    assert (
+        get_duration(
+            timestamp_begin,
+            datetime(2019, 2, 5, 20, 0, 10, tzinfo=timezone.utc),
+        )
+        == 10
+    )
+    assert get_duration(None, timestamp_begin) == 0
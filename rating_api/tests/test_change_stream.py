@@ -0,0 +1,217 @@
+import asyncio
+
+from conftest import run_synchronously
+
+from rating_api.services.change_stream import ChangeStreamListener
+from rating_api.services.rate_cache import NOT_FOUND, get_key
+from rating_api.services.storage import StorageService
+
+
+def _storage():
+    storage = StorageService(
+        mongodb_uri="mongodb://localhost:27017",
+        mongodb_db="rating_api_tests",
+        entity_cache=True,
+        rate_cache=True,
+    )
+    listener = ChangeStreamListener()
+    listener._storage = storage
+    return storage, listener
+
+
+def test_change_stream_apply_entities():
+    storage, listener = _storage()
+    carrier = {"_id": "1", "tenant": "default", "carrier_tag": "TESTS_C1"}
+    storage.entity_cache.set("carriers", ("_id",), ("1",), carrier)
+    listener.apply(
+        {
+            "operationType": "delete",
+            "ns": {"db": "rating_api_tests", "coll": "carriers"},
+            "documentKey": {"_id": "1"},
+        }
+    )
+    assert storage.entity_cache.get("carriers", ("_id",), ("1",)) is None
+
+
+def test_change_stream_apply_rates():
+    storage, listener = _storage()
+    italy = get_key("default", ["ITALY"], None, "393292166164")
+    germany = get_key("default", ["GERMANY"], None, "491722166164")
+    rate = {
+        "_id": "1",
+        "tenant": "default",
+        "pricelist_tag": "ITALY",
+        "carrier_tag": "C1",
+        "prefix": "39",
+        "rate": 10,
+    }
+    for key in (italy, germany):
+        storage.rate_cache.set(key, None, storage.rate_cache.version)
+    listener.apply(
+        {
+            "operationType": "update",
+            "ns": {"db": "rating_api_tests", "coll": "pricelist_rates"},
+            "documentKey": {"_id": "1"},
+            "updateDescription": {"updatedFields": {"rate": 10}},
+            "fullDocument": rate,
+        }
+    )
+    assert storage.rate_cache.get(italy) is NOT_FOUND
+    assert storage.rate_cache.get(germany) is None
+    # the rate moved from an unknown prefix
+    listener.apply(
+        {
+            "operationType": "update",
+            "ns": {"db": "rating_api_tests", "coll": "pricelist_rates"},
+            "documentKey": {"_id": "1"},
+            "updateDescription": {"updatedFields": {"prefix": "39"}},
+            "fullDocument": rate,
+        }
+    )
+    assert storage.rate_cache.get(germany) is NOT_FOUND
+
+
+def test_change_stream_apply_recorded_deletes():
+    storage, listener = _storage()
+    italy = get_key("default", ["ITALY"], None, "393292166164")
+    other = get_key("other", ["ITALY"], None, "393292166164")
+    for key in (italy, other):
+        storage.rate_cache.set(key, None, storage.rate_cache.version)
+    # the fields of the deleted rate are not known from the event
+    listener.apply(
+        {
+            "operationType": "delete",
+            "ns": {"db": "rating_api_tests", "coll": "pricelist_rates"},
+            "documentKey": {"_id": "1"},
+        }
+    )
+    assert storage.rate_cache.get(italy) is None
+    assert storage.rate_cache.get(other) is None
+    # but from its record
+    listener.apply(
+        {
+            "operationType": "insert",
+            "ns": {"db": "rating_api_tests", "coll": "deleted_documents"},
+            "documentKey": {"_id": "2"},
+            "fullDocument": {
+                "_id": "2",
+                "collection": "pricelist_rates",
+                "document": {
+                    "_id": "1",
+                    "tenant": "default",
+                    "pricelist_tag": "ITALY",
+                    "prefix": "39",
+                },
+            },
+        }
+    )
+    assert storage.rate_cache.get(italy) is NOT_FOUND
+    assert storage.rate_cache.get(other) is None
+
+
+def test_change_stream_apply_polled():
+    storage, listener = _storage()
+    italy = get_key("default", ["ITALY"], None, "393292166164")
+    germany = get_key("default", ["GERMANY"], None, "491722166164")
+    for key in (italy, germany):
+        storage.rate_cache.set(key, None, storage.rate_cache.version)
+    rate = {
+        "_id": "1",
+        "tenant": "default",
+        "pricelist_tag": "ITALY",
+        "carrier_tag": "C1",
+        "prefix": "39",
+        "rate": 10,
+    }
+    # the polled document is applied as is
+    listener.apply_polled("pricelist_rates", rate)
+    assert storage.rate_cache.get(italy) is NOT_FOUND
+    assert storage.rate_cache.get(germany) is None
+    storage.entity_cache.set("carriers", ("_id",), ("1",), {"_id": "1"})
+    listener.apply_polled(
+        "deleted_documents",
+        {
+            "_id": "2",
+            "collection": "carriers",
+            "document": {"_id": "1", "tenant": "default", "carrier_tag": "C1"},
+        },
+    )
+    assert storage.entity_cache.get("carriers", ("_id",), ("1",)) is None
+    listener.apply_polled(
+        "deleted_documents",
+        {
+            "_id": "3",
+            "collection": "pricelist_rates",
+            "document": {
+                "_id": "2",
+                "tenant": "default",
+                "pricelist_tag": "GERMANY",
+                "prefix": "49",
+            },
+        },
+    )
+    assert storage.rate_cache.get(germany) is NOT_FOUND
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def sort(self, key, direction):
+        self.documents = iter(sorted(self.documents, key=lambda d: d[key]))
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class Collection:
+    def __init__(self):
+        self.documents: list = []
+
+    async def find_one(self, query, projection, sort):
+        return max(self.documents, key=lambda d: d["updated_at"], default=None)
+
+    def find(self, query):
+        if "$gte" in query["updated_at"]:
+            since = query["updated_at"]["$gte"]
+            return Cursor(d for d in self.documents if d["updated_at"] >= since)
+        return Cursor(self.documents)
+
+
+def test_change_stream_poll():
+    storage, listener = _storage()
+    listener.collections = ("carriers",)
+    listener.poll_interval = 0.01
+    carriers, deletes = Collection(), Collection()
+    storage.db = {"carriers": carriers, "deleted_documents": deletes}
+    carriers.documents.append({"_id": "1", "updated_at": 1})
+    applied: list = []
+    listener.apply_polled = lambda collection, document: applied.append(
+        (collection, document["_id"])
+    )
+
+    async def run():
+        task = asyncio.ensure_future(listener.poll())
+        await asyncio.sleep(0.05)
+        # written in the same millisecond as the last seen one
+        carriers.documents.append({"_id": "2", "updated_at": 1})
+        deletes.documents.append(
+            {"_id": "3", "collection": "carriers", "document": {"_id": "1"}}
+        )
+        deletes.documents[0]["updated_at"] = 2
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    run_synchronously(run())
+    assert applied == [
+        ("carriers", "1"),
+        ("carriers", "2"),
+        ("deleted_documents", "3"),
+    ]
@@ -0,0 +1,37 @@
+from rating_api.services.entity_cache import EntityCache
+
+
+def test_entity_cache_get_set_and_invalidate():
+    cache = EntityCache()
+    carrier = {"_id": "1", "tenant": "default", "carrier_tag": "TESTS_C1"}
+    assert cache.get("carriers", ("_id",), ("1",)) is None
+    cache.set("carriers", ("_id",), ("1",), carrier)
+    cache.set("carriers", ("tenant", "carrier_tag"), ("default", "TESTS_C1"), carrier)
+    assert cache.get("carriers", ("_id",), ("1",)) is carrier
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 2
+    # all the keys of the same document are invalidated
+    cache.invalidate("carriers", "1")
+    assert cache.get("carriers", ("_id",), ("1",)) is None
+    assert (
+        cache.get("carriers", ("tenant", "carrier_tag"), ("default", "TESTS_C1"))
+        is None
+    )
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_entity_cache_ttl_and_memory_bound():
+    cache = EntityCache(ttl=-1)
+    cache.set("carriers", ("_id",), ("1",), {"_id": "1"})
+    assert cache.get("carriers", ("_id",), ("1",)) is None
+    #
+    cache = EntityCache(max_bytes=100)
+    for i in range(10):
+        cache.set("carriers", ("_id",), (str(i),), {"_id": str(i), "host": "x" * 20})
+    assert cache.stats()["bytes"] <= 100
+    assert cache.stats()["evictions"] > 0
+    # the least recently used entries are evicted first
+    assert cache.get("carriers", ("_id",), ("0",)) is None
+    assert cache.get("carriers", ("_id",), ("9",)) is not None
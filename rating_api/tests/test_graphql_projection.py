@@ -0,0 +1,58 @@
+import graphene  # type: ignore
+
+from rating_api.graphql.projection import get_projection
+
+
+class Item(graphene.ObjectType):
+    id = graphene.ID()
+    name = graphene.String()
+    balance = graphene.Int()
+    customer = graphene.String()
+
+
+def _projection(query, dependencies=None):
+    projections = []
+
+    class Query(graphene.ObjectType):
+        item = graphene.Field(Item)
+
+        def resolve_item(self, info):
+            projections.append(get_projection(info, dependencies))
+            return {}
+
+    result = graphene.Schema(query=Query).execute(query)
+    assert result.errors is None
+    return projections[0]
+
+
+def test_get_projection():
+    assert _projection("{ item { id balance __typename } }") == {
+        "_id": 1,
+        "balance": 1,
+    }
+
+
+def test_get_projection_fragments():
+    query = """
+query {
+    item {
+        ...ItemFields
+        ... on Item {
+            balance
+        }
+    }
+}
+
+fragment ItemFields on Item {
+    name
+}"""
+    assert _projection(query) == {"_id": 1, "name": 1, "balance": 1}
+
+
+def test_get_projection_dependencies():
+    dependencies = {"customer": ("tenant", "customer_tag")}
+    assert _projection("{ item { customer } }", dependencies) == {
+        "_id": 1,
+        "tenant": 1,
+        "customer_tag": 1,
+    }
@@ -0,0 +1,41 @@
+from conftest import run_synchronously
+
+
+def test_dataloader_batches_and_caches():
+    from rating_api.services.loader import DataLoader
+
+    calls = []
+
+    async def batch_load(keys):
+        calls.append(keys)
+        return [key * 2 if key != 3 else None for key in keys]
+
+    async def run():
+        loader = DataLoader(batch_load)
+        results = await loader.load_many([1, 2, 1, 3])
+        assert results == [2, 4, 2, None]
+        assert await loader.load(2) == 4
+        assert await loader.load(3) is None
+
+    run_synchronously(run())
+    assert calls == [[1, 2, 3], [3]]
+
+
+def test_dataloader_prime_and_clear():
+    from rating_api.services.loader import DataLoader
+
+    calls = []
+
+    async def batch_load(keys):
+        calls.append(keys)
+        return keys
+
+    async def run():
+        loader = DataLoader(batch_load)
+        loader.prime("a", "primed")
+        assert await loader.load("a") == "primed"
+        loader.clear("a")
+        assert await loader.load("a") == "a"
+
+    run_synchronously(run())
+    assert calls == [["a"]]
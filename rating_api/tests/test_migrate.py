@@ -0,0 +1,38 @@
+from click.testing import CliRunner
+
+from conftest import MONGODB_URI, MONGODB_DB
+
+
+def test_migrate_backfill_search_keys(app):
+    app.db.carriers.insert_many(
+        [
+            {"_id": "1", "tenant": "default", "carrier_tag": "C1", "host": "a.io"},
+            {
+                "_id": "2",
+                "tenant": "default",
+                "carrier_tag": "C2",
+                "host": "b.io",
+                "search_keys": ["c2"],
+            },
+        ]
+    )
+    #
+    from rating_api.migrate import main
+
+    runner = CliRunner()
+    args = ["--mongodb-uri", MONGODB_URI, "--mongodb-db", MONGODB_DB]
+    result = runner.invoke(main, args + ["-c", "carriers"])
+    assert result.exit_code == 0
+    assert "carriers: 1 documents backfilled" in result.output
+    assert app.db.carriers.find_one({"_id": "1"})["search_keys"] == [
+        "a",
+        "c",
+        "c1",
+        "i",
+        "io",
+    ]
+    assert app.db.carriers.find_one({"_id": "2"})["search_keys"] == ["c2"]
+    #
+    result = runner.invoke(main, args + ["-c", "carriers"])
+    assert result.exit_code == 0
+    assert "carriers: 0 documents backfilled" in result.output
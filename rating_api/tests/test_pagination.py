@@ -0,0 +1,52 @@
+import base64
+import json
+import pytest
+
+from datetime import datetime
+
+from rating_api.services.pagination import (
+    decode_cursor,
+    encode_cursor,
+    get_cursor_query,
+)
+
+
+def test_cursor_roundtrip():
+    document = {"_id": "1", "timestamp_begin": datetime(2019, 8, 1, 10, 0)}
+    cursor = encode_cursor(document, "timestamp_begin")
+    assert decode_cursor(cursor) == (datetime(2019, 8, 1, 10, 0), "1")
+    assert decode_cursor(encode_cursor(document, "id")) == ("1", "1")
+
+
+def test_cursor_invalid():
+    with pytest.raises(ValueError):
+        decode_cursor("invalid")
+    for value in (
+        [{"$ne": None}, "1"],
+        ["a", {"$regex": "."}],
+        [["a"], "1"],
+        ["a", None],
+        "a",
+    ):
+        cursor = base64.urlsafe_b64encode(json.dumps(value).encode("utf-8"))
+        with pytest.raises(ValueError):
+            decode_cursor(cursor.decode("ascii"))
+
+
+def test_get_cursor_query():
+    cursor = encode_cursor({"_id": "1", "name": "a"}, "name")
+    assert get_cursor_query("_id", "$gt", cursor) == {"_id": {"$gt": "1"}}
+    assert get_cursor_query("name", "$gt", cursor) == {
+        "$or": [{"name": "a", "_id": {"$gt": "1"}}, {"name": {"$gt": "a"}}]
+    }
+    assert get_cursor_query("name", "$lt", cursor) == {
+        "$or": [
+            {"name": "a", "_id": {"$lt": "1"}},
+            {"name": {"$lt": "a"}},
+            {"name": None},
+        ]
+    }
+    cursor = encode_cursor({"_id": "1"}, "name")
+    assert get_cursor_query("name", "$gt", cursor) == {
+        "$or": [{"name": None, "_id": {"$gt": "1"}}, {"name": {"$ne": None}}]
+    }
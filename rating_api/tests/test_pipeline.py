@@ -0,0 +1,90 @@
+import asyncio
+
+from conftest import run_synchronously
+
+
+async def _read_lines(lines):
+    for line in lines:
+        yield line
+
+
+async def _to_list(records):
+    return [record async for record in records]
+
+
+def test_import_records_overlaps_parsing_and_writing():
+    from rating_api.services.pipeline import import_records, number_lines
+
+    events: list = []
+    errors: list = []
+
+    def parse(line):
+        events.append("parse %s" % line.decode())
+        return int(line.decode())
+
+    async def write(numbers):
+        events.append("write %s" % numbers)
+        await asyncio.sleep(0.01)
+        return [None if number != 4 else "rejected" for number in numbers]
+
+    lines = [b"1", b"2", b"", b"x", b"3", b"4", b"5"]
+    result = run_synchronously(
+        import_records(
+            number_lines(_read_lines(lines)),
+            parse,
+            write,
+            2,
+            error=errors.append,
+            max_errors=1,
+        )
+    )
+    assert result == {
+        "count": 4,
+        "errors": [{"line": 4, "error": "invalid literal for int() with base 10: 'x'"}],
+        "error_count": 2,
+    }
+    # the errors are streamed in line order, beyond max_errors
+    assert errors == [
+        {"line": 4, "error": "invalid literal for int() with base 10: 'x'"},
+        {"line": 6, "error": "rejected"},
+    ]
+    # each batch is being written while the next one is parsed
+    assert events == [
+        "parse 1",
+        "parse 2",
+        "write [1, 2]",
+        "parse x",
+        "parse 3",
+        "write [3]",
+        "parse 4",
+        "parse 5",
+        "write [4, 5]",
+    ]
+
+
+def test_read_csv_rows():
+    from rating_api.services import pipeline
+
+    lines = [
+        b"prefix,description\n",
+        b'39,"Italy,\n',
+        b'""fixed"" and\n',
+        b'mobile"\n',
+        b"\n",
+        b"49,Germany",
+        b'33,"France',
+    ]
+    rows = run_synchronously(_to_list(pipeline.read_csv_rows(_read_lines(lines))))
+    assert rows[:3] == [
+        (1, ["prefix", "description"]),
+        (2, ["39", 'Italy,\n"fixed" and\nmobile']),
+        (6, ["49", "Germany"]),
+    ]
+    assert rows[3][0] == 7
+    assert isinstance(rows[3][1], ValueError)
+    # a row left unterminated is dropped after MAX_ROW_LINES lines
+    lines = [b'1,"a\n'] + [b"b\n"] * pipeline.MAX_ROW_LINES + [b"2,c\n"]
+    rows = run_synchronously(_to_list(pipeline.read_csv_rows(_read_lines(lines))))
+    assert len(rows) == 3
+    assert isinstance(rows[0][1], ValueError)
+    assert rows[1:] == [(101, ["b"]), (102, ["2", "c"])]
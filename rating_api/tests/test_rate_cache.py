@@ -0,0 +1,89 @@
+from rating_api.services.rate_cache import NOT_FOUND, RateCache, get_key
+
+
+def test_rate_cache_key():
+    assert get_key("default", ["ITALY"], None, "393292166164") == (
+        "default",
+        ("ITALY",),
+        (),
+        "393292166",
+    )
+    assert get_key("default", ["ITALY"], None, "39") == ("default", ("ITALY",), (), "3")
+
+
+def test_rate_cache_negative_results_and_stats():
+    cache = RateCache()
+    key = get_key("default", ["ITALY"], None, "393292166164")
+    assert cache.get(key) is NOT_FOUND
+    cache.set(key, None, cache.version)
+    assert cache.get(key) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+def test_rate_cache_invalidate_ancestor_prefix():
+    cache = RateCache()
+    italy = get_key("default", ["ITALY"], None, "393292166164")
+    italy_carrier = get_key("default", ["ITALY"], ["C2"], "393292166164")
+    germany = get_key("default", ["GERMANY"], None, "393292166164")
+    other = get_key("default", ["ITALY"], None, "390401234567")
+    for key in (italy, italy_carrier, germany, other):
+        cache.set(key, None, cache.version)
+    cache.invalidate(
+        "pricelist_rates",
+        "1",
+        {
+            "tenant": "default",
+            "pricelist_tag": "ITALY",
+            "carrier_tag": "C1",
+            "prefix": "3932",
+        },
+    )
+    assert cache.get(italy) is NOT_FOUND
+    assert cache.get(italy_carrier) is None
+    assert cache.get(germany) is None
+    assert cache.get(other) is None
+    # lookups started before a change are not cached
+    version = cache.version
+    cache.invalidate("pricelist_rates", "2", {"tenant": "other", "prefix": "44"})
+    cache.set(italy, None, version)
+    assert cache.get(italy) is NOT_FOUND
+    # changes to unknown rates invalidate everything
+    cache.invalidate("pricelist_rates", "3")
+    assert cache.stats()["entries"] == 0
+
+
+def test_rate_cache_eviction():
+    cache = RateCache(max_entries=2)
+    keys = [get_key("default", ["ITALY"], None, "39%d2921661" % i) for i in range(3)]
+    for key in keys:
+        cache.set(key, None, cache.version)
+    assert cache.get(keys[0]) is NOT_FOUND
+    assert cache.get(keys[2]) is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_rate_cache_invalidate_pricelist():
+    cache = RateCache()
+    italy = get_key("default", ["ITALY"], None, "393292166164")
+    germany = get_key("default", ["GERMANY"], None, "393292166164")
+    any_pricelist = get_key("default", None, None, "393292166164")
+    for key in (italy, germany, any_pricelist):
+        cache.set(key, None, cache.version)
+    cache.invalidate("pricelists", "1", {"tenant": "default", "pricelist_tag": "ITALY"})
+    assert cache.get(italy) is NOT_FOUND
+    assert cache.get(any_pricelist) is NOT_FOUND
+    assert cache.get(germany) is None
+
+
+def test_rate_cache_invalidate_tenant():
+    cache = RateCache()
+    default = get_key("default", ["ITALY"], None, "393292166164")
+    other = get_key("other", ["ITALY"], None, "393292166164")
+    for key in (default, other):
+        cache.set(key, None, cache.version)
+    cache.invalidate("pricelists", None, {"tenant": "default"})
+    assert cache.get(default) is NOT_FOUND
+    assert cache.get(other) is None
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from rating_api.services.rate_export import format_rows
+
+
+def test_format_rows_csv():
+    rows = [
+        {
+            "tenant": "default",
+            "pricelist_tag": "TESTS_P1",
+            "carrier_tag": "TESTS_C1",
+            "prefix": "39",
+            "active": True,
+            "rate": 180,
+            "description": "Italy, mobile",
+        }
+    ]
+    result = format_rows(rows, "csv", header=True).decode("utf-8").split("\n")
+    assert result == [
+        "tenant,pricelist_tag,carrier_tag,prefix,datetime_start,datetime_end,active,connect_fee,rate,rate_increment,interval_start,description",
+        'default,TESTS_P1,TESTS_C1,39,,,true,,180,,,"Italy, mobile"',
+        "",
+    ]
+    assert format_rows(rows, "csv").count(b"\n") == 1
+
+
+def test_format_rows_ndjson():
+    rows = [{"prefix": "39", "datetime_start": datetime(2019, 2, 5, 20, 0, 0)}]
+    result = format_rows(rows, "ndjson")
+    assert result.endswith(b"\n")
+    assert b'"datetime_start": "2019-02-05T20:00:00"' in result
+    assert b'"prefix": "39"' in result
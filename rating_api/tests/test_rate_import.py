@@ -0,0 +1,31 @@
+import pytest
+
+from rating_api.services.rate_import import parse_rate
+
+
+def test_parse_rate():
+    rate = parse_rate(
+        {
+            "prefix": "39",
+            "carrier_tag": "",
+            "rate": "180",
+            "active": "false",
+            "datetime_start": "20190205T200000Z",
+        },
+        "default",
+        "TESTS_P1",
+        "TESTS_C1",
+    )
+    assert rate["tenant"] == "default"
+    assert rate["pricelist_tag"] == "TESTS_P1"
+    assert rate["carrier_tag"] == "TESTS_C1"
+    assert rate["rate"] == 180
+    assert rate["active"] is False
+    assert rate["datetime_start"].year == 2019
+    assert parse_rate({"prefix": 39}, "default")["prefix"] == "39"
+    assert parse_rate({"prefix": 39}, "default")["active"] is True
+
+
+def test_parse_rate_invalid():
+    with pytest.raises(ValueError):
+        parse_rate({"prefix": "39", "rate": "abc"}, "default")
@@ -0,0 +1,39 @@
+def test_prefix_trie_longest_prefix():
+    from rating_api.services.rate_index import PrefixTrie
+
+    trie = PrefixTrie()
+    trie.insert({"prefix": "39", "carrier_tag": "C1", "rate": 1})
+    trie.insert({"prefix": "3932", "carrier_tag": "C1", "rate": 2})
+    trie.insert({"prefix": "393", "carrier_tag": "C2", "rate": 3})
+
+    assert trie.lookup("393292166164", 9)["rate"] == 2
+    assert trie.lookup("393292166164", 9, ["C2"])["rate"] == 3
+    assert trie.lookup("393292166164", 3)["rate"] == 3
+    assert trie.lookup("440401234567", 9) is None
+
+
+def test_prefix_trie_remove():
+    from rating_api.services.rate_index import PrefixTrie
+
+    trie = PrefixTrie()
+    trie.insert({"prefix": "39", "carrier_tag": "C1", "rate": 1})
+    trie.insert({"prefix": "3932", "carrier_tag": "C1", "rate": 2})
+    trie.remove("3932", "C1")
+
+    assert trie.lookup("393292166164", 9)["rate"] == 1
+    trie.remove("39", "C1")
+    assert trie.lookup("393292166164", 9) is None
+
+
+def test_rate_index_versions():
+    from rating_api.services.rate_index import PrefixTrie, RateIndex
+
+    index = RateIndex()
+    trie = PrefixTrie(version="1")
+    index._tries[("default", "ITALY")] = trie
+    rate = {"tenant": "default", "pricelist_tag": "ITALY", "carrier_tag": "C1"}
+    index.update(dict(rate, _id="1", prefix="39", rate=1, active=True, version="1"))
+    # the rates of another version are ignored
+    index.update(dict(rate, _id="2", prefix="39", rate=2, active=True, version="2"))
+    index.remove(dict(rate, _id="3", prefix="39", version="2"))
+    assert trie.lookup("393292166164", 9)["rate"] == 1
@@ -0,0 +1,143 @@
+import os
+
+from datetime import datetime
+
+from conftest import run_synchronously
+
+from rating_api.services.rate_table import (
+    NOT_LOADED,
+    RateTable,
+    RateTables,
+    get_path,
+    write_rate_table,
+)
+
+RATES = [
+    {
+        "_id": "1",
+        "pricelist_tag": "ITALY",
+        "carrier_tag": "CARRIER1",
+        "prefix": "39",
+        "datetime_start": datetime(2020, 1, 1, 12, 30),
+        "connect_fee": 10,
+        "rate": 100,
+        "rate_increment": 60,
+        "interval_start": 0,
+        "description": "Italy",
+    },
+    {
+        "_id": "2",
+        "pricelist_tag": "ITALY",
+        "carrier_tag": "CARRIER2",
+        "prefix": "3932",
+        "connect_fee": 0,
+        "rate": 200,
+        "rate_increment": 1,
+        "interval_start": 0,
+        "description": "Italy mobile",
+    },
+    {
+        "_id": "3",
+        "pricelist_tag": "GERMANY",
+        "carrier_tag": "CARRIER1",
+        "prefix": "39329",
+        "connect_fee": 0,
+        "rate": 300,
+        "rate_increment": 1,
+        "interval_start": 0,
+    },
+]
+
+
+def test_rate_table_lookup(tmpdir):
+    path = get_path(str(tmpdir), "default")
+    write_rate_table(path, "default", {"ITALY": "v1", "GERMANY": None}, RATES)
+    table = RateTable(path)
+    try:
+        assert table.count == 3
+        rate = table.lookup(["ITALY"], None, "393292166164", 9)
+        assert rate == {
+            "_id": "2",
+            "tenant": "default",
+            "pricelist_tag": "ITALY",
+            "carrier_tag": "CARRIER2",
+            "prefix": "3932",
+            "datetime_start": None,
+            "datetime_end": None,
+            "active": True,
+            "connect_fee": 0,
+            "rate": 200,
+            "rate_increment": 1,
+            "interval_start": 0,
+            "description": "Italy mobile",
+            "version": "v1",
+        }
+        rate = table.lookup(["ITALY"], ["CARRIER1"], "393292166164", 9)
+        assert rate["_id"] == "1"
+        assert rate["datetime_start"] == datetime(2020, 1, 1, 12, 30)
+        assert table.lookup(["ITALY", "GERMANY"], None, "393292166164", 9)["_id"] == "3"
+        assert table.lookup(["ITALY", "GERMANY"], None, "393292166164", 4)["_id"] == "2"
+        assert table.lookup(["ITALY"], ["CARRIER3"], "393292166164", 9) is None
+        assert table.lookup(["FRANCE"], None, "393292166164", 9) is None
+        assert table.lookup(["ITALY"], None, "4930", 3) is None
+    finally:
+        table.close()
+
+
+def test_rate_tables_reopen_replaced_table(tmpdir):
+    tables = RateTables(str(tmpdir), check_interval=0)
+    assert tables.lookup("default", ["ITALY"], None, "393292166164", 9) is NOT_LOADED
+    path = get_path(str(tmpdir), "default")
+    write_rate_table(path, "default", {}, RATES[:1])
+    assert tables.lookup("default", ["ITALY"], None, "393292166164", 9)["_id"] == "1"
+    write_rate_table(path, "default", {}, RATES[:2])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert tables.lookup("default", ["ITALY"], None, "393292166164", 9)["_id"] == "2"
+    assert tables.stats()["tables"] == 1
+    assert tables.stats()["lookups"] == 2
+
+
+def test_rate_tables_skip_changed_tenant(tmpdir):
+    path = get_path(str(tmpdir), "default")
+    write_rate_table(path, "default", {}, RATES[:1])
+
+    async def run():
+        tables = RateTables(str(tmpdir), delay=60, check_interval=0)
+        tables.start(None)
+        try:
+            rate = tables.lookup("default", ["ITALY"], None, "393292166164", 9)
+            assert rate["_id"] == "1"
+            tables.invalidate(
+                "pricelist_rates", "1", {"tenant": "default", "prefix": "39"}
+            )
+            # until the table is rebuilt, the lookups use the database
+            assert (
+                tables.lookup("default", ["ITALY"], None, "393292166164", 9)
+                is NOT_LOADED
+            )
+            tables.invalidate("pricelist_rates", "1", {"tenant": "other"})
+            assert tables.lookup("default", ["ITALY"], None, "39329", 9) is NOT_LOADED
+        finally:
+            await tables.close()
+
+    run_synchronously(run())
+
+
+def test_rate_tables_skip_long_prefixes(tmpdir):
+    path = get_path(str(tmpdir), "default")
+    long_prefix = dict(RATES[1], _id="4", prefix="39329216616412345")
+    write_rate_table(path, "default", {}, RATES[:2] + [long_prefix])
+    table = RateTable(path)
+    try:
+        assert table.count == 2
+        assert table.long_prefixes == 1
+    finally:
+        table.close()
+    tables = RateTables(str(tmpdir), check_interval=0)
+    assert tables.lookup("default", ["ITALY"], None, "393292166164", 20)["_id"] == "2"
+    # the table may miss the longest matching prefix
+    assert (
+        tables.lookup("default", ["ITALY"], None, "393292166164123456", 20)
+        is NOT_LOADED
+    )
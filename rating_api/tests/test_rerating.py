@@ -0,0 +1,139 @@
+from datetime import datetime
+
+from click.testing import CliRunner
+
+from conftest import MONGODB_URI, MONGODB_DB
+
+
+def _insert_transaction(app, transaction_tag, destination, duration, fee):
+    app.db.transactions.insert_one(
+        {
+            "_id": transaction_tag,
+            "tenant": "default",
+            "transaction_tag": transaction_tag,
+            "account_tag": "1000",
+            "destination": destination,
+            "destination_rate": {
+                "pricelist_tag": "ITALY",
+                "prefix": "39",
+                "connect_fee": 0,
+                "rate": 60,
+                "rate_increment": 1,
+                "interval_start": 0,
+                "carrier_tag": "CARRIER_1",
+            },
+            "authorized": True,
+            "timestamp_begin": datetime(2020, 1, 1, 12, 0),
+            "duration": duration,
+            "fee": fee,
+        }
+    )
+
+
+def test_rerate(app, tmpdir):
+    app.db.accounts.insert_one(
+        {
+            "_id": "1000",
+            "tenant": "default",
+            "account_tag": "1000",
+            "type": "POSTPAID",
+            "pricelist_tags": ["ITALY"],
+        }
+    )
+    app.db.pricelists.insert_one(
+        {"_id": "ITALY", "tenant": "default", "pricelist_tag": "ITALY"}
+    )
+    app.db.pricelist_rates.insert_many(
+        [
+            {
+                "tenant": "default",
+                "pricelist_tag": "ITALY",
+                "carrier_tag": "CARRIER_1",
+                "prefix": "39",
+                "rate": 60,
+                "rate_increment": 1,
+                "active": True,
+            },
+            {
+                "tenant": "default",
+                "pricelist_tag": "ITALY",
+                "carrier_tag": "CARRIER_1",
+                "prefix": "3932",
+                "connect_fee": 5,
+                "rate": 120,
+                "rate_increment": 60,
+                "active": True,
+            },
+        ]
+    )
+    _insert_transaction(app, "T1", "390612345678", 61, 61)
+    _insert_transaction(app, "T2", "393292166164", 61, 61)
+    _insert_transaction(app, "T3", "4930123456", 61, 61)
+    #
+    from rating_api.rerate import main
+
+    report_dir = str(tmpdir.join("reports"))
+    runner = CliRunner()
+    args = [
+        "--mongodb-uri",
+        MONGODB_URI,
+        "--mongodb-db",
+        MONGODB_DB,
+        "-t",
+        "default",
+        "--from",
+        "2020-01-01T00:00:00",
+        "--to",
+        "2020-01-02T00:00:00",
+    ]
+    result = runner.invoke(main, args + ["--dry-run", "-r", report_dir])
+    assert result.exit_code == 0
+    assert "3 transactions, 1 changed (dry run), 1 unrated, fee delta 184" in (
+        result.output
+    )
+    with open(tmpdir.join("reports", "default.ndjson")) as f:
+        lines = f.readlines()
+    assert len(lines) == 1
+    assert '"transaction_tag": "T2"' in lines[0]
+    assert app.db.transactions.find_one({"_id": "T2"})["fee"] == 61
+    #
+    result = runner.invoke(main, args)
+    assert result.exit_code == 0
+    transaction = app.db.transactions.find_one({"_id": "T2"})
+    assert transaction["fee"] == 5 + 240
+    assert transaction["destination_rate"]["prefix"] == "3932"
+    assert app.db.transactions.find_one({"_id": "T1"})["fee"] == 61
+    assert app.db.transactions.find_one({"_id": "T3"})["fee"] == 61
+
+
+def test_rerate_get_duration():
+    from rating_api.services.rerating import get_duration
+
+    timestamp_begin = datetime(2020, 1, 1, 12, 0)
+    assert get_duration({"duration": 0, "timestamp_begin": timestamp_begin}) == 0
+    assert (
+        get_duration(
+            {
+                "timestamp_begin": timestamp_begin,
+                "timestamp_end": datetime(2020, 1, 1, 12, 1, 1),
+            }
+        )
+        == 61
+    )
+    # the fee of a transaction without duration is not recomputed
+    assert get_duration({"timestamp_begin": timestamp_begin}) is None
+
+
+def test_rerate_is_valid_at():
+    from rating_api.services.rerating import is_valid_at
+
+    rate = {
+        "datetime_start": datetime(2020, 1, 1),
+        "datetime_end": datetime(2020, 2, 1),
+    }
+    assert is_valid_at(rate, datetime(2020, 1, 1))
+    assert is_valid_at(rate, datetime(2020, 1, 31, 23, 59))
+    assert not is_valid_at(rate, datetime(2019, 12, 31, 23, 59))
+    assert not is_valid_at(rate, datetime(2020, 2, 1))
+    assert is_valid_at({"datetime_start": None}, datetime(2019, 1, 1))
+    assert is_valid_at(rate, None)
@@ -0,0 +1,91 @@
+from conftest import run_synchronously
+
+from rating_api.services.search import (
+    get_complete_search_keys,
+    get_search_keys,
+    get_search_query,
+)
+
+
+def test_get_search_keys():
+    document = {"carrier_tag": "TESTS_C1", "host": "Canyan.io", "port": 5060}
+    assert get_search_keys(document, ("carrier_tag", "host", "missing")) == [
+        "c",
+        "c1",
+        "ca",
+        "can",
+        "cany",
+        "canya",
+        "canyan",
+        "i",
+        "io",
+        "t",
+        "te",
+        "tes",
+        "test",
+        "tests",
+    ]
+
+
+def test_get_complete_search_keys():
+    assert get_complete_search_keys({"prefix": "39"}, ("prefix",)) == ["3", "39"]
+    assert get_complete_search_keys({"prefix": "39"}, ("prefix", "name")) is None
+
+
+def test_get_search_query():
+    assert get_search_query("Canyan.I") == {"search_keys": {"$all": ["canyan", "i"]}}
+    assert get_search_query("...") == {}
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class Collection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.writes: list = []
+
+    def find(self, query, projection, batch_size=None):
+        return Cursor(
+            [
+                {key: document[key] for key in ("_id",) + tuple(projection)}
+                for document in self.documents
+                if "search_keys" not in document
+            ]
+        )
+
+    async def bulk_write(self, requests, ordered=True):
+        self.writes.append(requests)
+
+
+def test_backfill_search_keys(monkeypatch):
+    from rating_api.services import search
+
+    monkeypatch.setattr(search, "BACKFILL_BATCH_SIZE", 2)
+    collection = Collection(
+        [
+            {"_id": "1", "carrier_tag": "C1", "host": "a.io"},
+            {"_id": "2", "carrier_tag": "C2", "host": "b", "search_keys": ["c"]},
+            {"_id": "3", "carrier_tag": "C3", "host": "c"},
+            {"_id": "4", "carrier_tag": "C4", "host": "d"},
+        ]
+    )
+    count = run_synchronously(
+        search.backfill_search_keys(collection, ("carrier_tag", "host"))
+    )
+    assert count == 3
+    assert [len(requests) for requests in collection.writes] == [2, 1]
+    request = collection.writes[0][0]
+    assert request._filter == {"_id": "1", "search_keys": {"$exists": False}}
+    assert request._doc == {"$set": {"search_keys": ["a", "c", "c1", "i", "io"]}}
@@ -0,0 +1,32 @@
+import asyncio
+import logging
+
+from conftest import run_synchronously
+
+from rating_api.services.storage import StorageService
+
+
+def test_storage_run_in_background(caplog):
+    storage = StorageService(
+        mongodb_uri="mongodb://localhost:27017", mongodb_db="rating_api_tests"
+    )
+    done: list = []
+
+    async def succeed():
+        await asyncio.sleep(0.01)
+        done.append(True)
+
+    async def fail():
+        raise ValueError("failed")
+
+    async def run():
+        storage.run_in_background(succeed(), "Succeeding")
+        storage.run_in_background(fail(), "Failing")
+        assert len(storage._background) == 2
+        await storage.wait_background()
+
+    with caplog.at_level(logging.ERROR):
+        run_synchronously(run())
+    assert done == [True]
+    assert not storage._background
+    assert "Failing failed" in caplog.text
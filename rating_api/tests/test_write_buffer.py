@@ -0,0 +1,108 @@
+import asyncio
+
+from conftest import run_synchronously
+
+
+class Collection(object):
+    def __init__(self, writes):
+        self.writes = writes
+
+    async def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        self.writes.append([request._doc for request in requests])
+
+    async def update_one(self, filter, update, upsert=False):
+        assert upsert
+        self.writes.append(update)
+
+
+def test_write_buffer_coalesces_and_flushes_on_close():
+    from rating_api.services.write_buffer import WriteBuffer
+
+    writes: list = []
+
+    async def run():
+        buffer = WriteBuffer(flush_interval=60)
+        buffer.start({"transactions": Collection(writes)})
+        await buffer.write("transactions", {"_id": "1"}, {"$set": {"fee": 1}})
+        await buffer.write("transactions", {"_id": "2"}, {"$set": {"fee": 2}})
+        await buffer.write("transactions", {"_id": "1"}, {"$set": {"fee": 3}})
+        assert writes == []
+        await buffer.close()
+
+    run_synchronously(run())
+    assert writes == [[{"$set": {"fee": 3}}, {"$set": {"fee": 2}}]]
+
+
+def test_write_buffer_flushes_by_size_with_backpressure():
+    from rating_api.services.write_buffer import WriteBuffer
+
+    writes: list = []
+
+    async def run():
+        buffer = WriteBuffer(flush_size=2, flush_interval=60, max_size=2)
+        buffer.start({"transactions": Collection(writes)})
+        for i in range(5):
+            await buffer.write("transactions", {"_id": i}, {"$set": {"fee": i}})
+        await asyncio.sleep(0)
+        await buffer.close()
+
+    run_synchronously(run())
+    assert [len(requests) for requests in writes] == [2, 2, 1]
+
+
+class FailingCollection(Collection):
+    def __init__(self, writes, failures):
+        super().__init__(writes)
+        self.failures = failures
+
+    async def bulk_write(self, requests, ordered=True):
+        from pymongo.errors import AutoReconnect  # type: ignore
+
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection lost")
+        await super().bulk_write(requests, ordered)
+
+
+def test_write_buffer_retries_failed_writes():
+    from rating_api.services.write_buffer import WriteBuffer
+
+    writes: list = []
+
+    async def run():
+        buffer = WriteBuffer(flush_interval=60, retry_interval=0.01, max_size=2)
+        buffer.start({"transactions": FailingCollection(writes, 2)})
+        await buffer.write("transactions", {"_id": "1"}, {"$set": {"fee": 1}})
+        await buffer.write("transactions", {"_id": "2"}, {"$set": {"fee": 2}})
+        assert not await buffer.flush()
+        assert writes == []
+        # the failed upserts are kept, merged with the newer ones
+        await buffer.write("transactions", {"_id": "1"}, {"$set": {"fee": 3}})
+        buffer._flush.set()
+        await asyncio.sleep(0.1)
+        assert buffer.failures == 1
+        assert writes == [[{"$set": {"fee": 3}}, {"$set": {"fee": 2}}]]
+        # the permits were released once written
+        await buffer.write("transactions", {"_id": "3"}, {"$set": {"fee": 4}})
+        await buffer.write("transactions", {"_id": "4"}, {"$set": {"fee": 5}})
+        await buffer.close()
+
+    run_synchronously(run())
+    assert writes[-1] == [{"$set": {"fee": 4}}, {"$set": {"fee": 5}}]
+
+
+def test_write_buffer_writes_through_after_close():
+    from rating_api.services.write_buffer import WriteBuffer
+
+    writes: list = []
+
+    async def run():
+        buffer = WriteBuffer(flush_interval=60)
+        buffer.start({"transactions": Collection(writes)})
+        await buffer.write("transactions", {"_id": "1"}, {"$set": {"fee": 1}})
+        await buffer.close()
+        await buffer.write("transactions", {"_id": "1"}, {"$set": {"fee": 2}})
+
+    run_synchronously(run())
+    assert writes == [[{"$set": {"fee": 1}}], {"$set": {"fee": 2}}]
@@ -27,6 +27,7 @@ setup(
         "passlib[bcrypt]",
         "uvicorn>=0.13",
     ],
+    extras_require={"rerating": ["numpy"]},
     packages=find_packages(exclude=("tests")),
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -36,5 +37,8 @@ setup(
     entry_points="""
         [console_scripts]
         rating-api=rating_api.main:main_with_env
+        rating-api-import-rates=rating_api.import_rates:main_with_env
+        rating-api-rerate=rating_api.rerate:main_with_env
+        rating-api-migrate=rating_api.migrate:main_with_env
     """,
 )